@@ -86,13 +86,14 @@ class CrawlerAgent:
 
         extracted_links = set()
         try:
-            # Use Playwright's locator to find all anchor tags
-            links = self.browser_controller.page.locator('a[href]').all()
-            logger.debug(f"Found {len(links)} potential link elements on {current_url}.")
+            # Read every anchor's href in one round-trip instead of one get_attribute call per link
+            hrefs = self.browser_controller.page.locator('a[href]').evaluate_all(
+                "(links) => links.map(link => link.getAttribute('href'))"
+            )
+            logger.debug(f"Found {len(hrefs)} potential link elements on {current_url}.")
 
-            for link_locator in links:
+            for href in hrefs:
                 try:
-                    href = link_locator.get_attribute('href')
                     if href:
                         # Resolve relative URLs against the current page's URL
                         absolute_url = urljoin(current_url, href.strip())
@@ -104,8 +105,8 @@ class CrawlerAgent:
                         # else: logger.debug(f"  Skipping invalid/malformed link: {href} -> {normalized_url}")
 
                 except Exception as link_err:
-                    # Log error getting attribute but continue with others
-                    logger.warning(f"Could not get href for a link element on {current_url}: {link_err}")
+                    # Log error resolving the href but continue with others
+                    logger.warning(f"Could not process href '{href}' on {current_url}: {link_err}")
                     continue # Skip this link
 
         except Exception as e:
@@ -20,6 +20,7 @@ from ..browser.panel.panel import Panel
 from ..llm.llm_client import LLMClient
 from ..core.task_manager import TaskManager
 from ..dom.views import DOMState, DOMElementNode, SelectorMap # Import DOM types
+from ..utils.utils import save_json_file
 # Configure logger
 logger = logging.getLogger(__name__)
 
@@ -126,7 +127,7 @@ class WebAgent:
             logger.info("Automated mode running with visible browser (headless=False).")
 
         self.browser_controller = BrowserController(headless=effective_headless, auth_state_path='_'.join([filename, "auth_state.json"]))
-        self.panel = Panel()
+        self.panel = self.browser_controller.panel # Shares the controller's page once started
         # TaskManager manages the *planned* steps generated by LLM initially
         self.task_manager = TaskManager(max_retries_per_subtask=max_retries_per_subtask)
         self.history: List[Dict[str, Any]] = []
@@ -141,6 +142,7 @@ class WebAgent:
         self._consecutive_suggestion_failures = 0 # Track failures for the *same* step index
         self._last_failed_step_index = -1 # Track which step index had the last failure
         self._last_static_id_map: Dict[str, 'DOMElementNode'] = {}
+        self._xpath_generator_js: Optional[str] = None # Loaded once from js_utils on first selector validation
         # --- Recorder Specific State ---
         self.recorded_steps: List[Dict[str, Any]] = []
         self._current_step_id = 1 # Counter for recorded steps
@@ -154,6 +156,21 @@ class WebAgent:
         logger.info(f"Visual baseline directory: {self.baseline_dir}")
 
 
+    def _get_xpath_generator_js(self) -> str:
+        """Returns the source of js_utils/xpathgenerator.js, reading it from the package only once."""
+        if self._xpath_generator_js is None:
+            try:
+                with resources.files(__package__).joinpath('js_utils', 'xpathgenerator.js') as js_path:
+                    self._xpath_generator_js = js_path.read_text(encoding='utf-8')
+                    logger.debug("xpathgenerator.js loaded successfully.")
+            except FileNotFoundError:
+                logger.error("xpathgenerator.js not found in the 'agents' package directory!")
+                raise
+            except Exception as e:
+                logger.error(f"Error loading xpathgenerator.js: {e}", exc_info=True)
+                raise
+        return self._xpath_generator_js
+
     def _add_to_history(self, entry_type: str, data: Any):
         """Adds an entry to the agent's history, maintaining max length."""
         timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -381,8 +398,7 @@ class WebAgent:
             }
 
             # 3. Save Metadata
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, indent=2, ensure_ascii=False)
+            save_json_file(metadata_path, metadata)
             logger.info(f"Saved baseline metadata to: {metadata_path}")
 
             return True # Success
@@ -678,35 +694,14 @@ Now, generate the verification JSON for: "{verification_description}"
 
                 if final_selector and target_node and self.browser_controller.page:
                     try:
-                        handles = self.browser_controller.page.query_selector_all(final_selector)
-                        num_matches = len(handles)
+                        # Count matches and get the XPath of a unique match in one round-trip
+                        match_info = self.browser_controller.batch_query([final_selector], xpath_generator_js=self._get_xpath_generator_js())[0]
+                        num_matches = match_info["count"] if match_info else 0
                         validation_passed = False
 
                         if num_matches == 1:
-                            # Get XPath of the element found by the generated selector
-                            
-                            try:
-                                with resources.files(__package__).joinpath('js_utils', 'xpathgenerator.js') as js_path:
-                                    js_code = js_path.read_text(encoding='utf-8')
-                                    logger.debug("xpathgenerator.js loaded successfully.")
-                            except FileNotFoundError:
-                                logger.error("xpathgenerator.js not found in the 'agents' package directory!")
-                                raise
-                            except Exception as e:
-                                logger.error(f"Error loading xpathgenerator.js: {e}", exc_info=True)
-                                raise
-
-                            # Pass a *function string* to evaluate. Playwright passes the handle as 'element'.
-                            # The function string first defines our helper, then calls it.
-                            script_to_run = f"""
-                                (element) => {{
-                                    {js_code} // Define the helper function(s)
-                                    return generateXPathForElement(element); // Call it
-                                }}
-                            """
-
-                            # Use page.evaluate, passing the script string and the element handle
-                            matched_xpath = self.browser_controller.page.evaluate(script_to_run, handles[0])
+                            # XPath of the element found by the generated selector
+                            matched_xpath = match_info["xpath"]
 
                             # Compare XPaths (simplest reliable comparison)
                             if target_node.xpath == matched_xpath:
@@ -804,7 +799,7 @@ Now, generate the verification JSON for: "{verification_description}"
             if assertion_type and (final_selector or assertion_type == 'assert_llm_verification' or assertion_type == 'assert_passed_verification'):
                 logger.info("Performing quick Playwright validation of LLM's suggested assertion...")
                 validation_passed, validation_error = self.browser_controller.validate_assertion(
-                    assertion_type, final_selector, parameters
+                    assertion_type, final_selector, parameters, poll_ms=50
                 )
             elif not assertion_type:
                 validation_passed = True
@@ -906,11 +901,8 @@ Now, generate the verification JSON for: "{verification_description}"
 
                 print("="*60)
 
-                # Show the review panel (button should be enabled now)
-                self.panel.show_verification_review_panel(planned_desc, verification_result)
-
-                # Wait for user choice from panel
-                user_choice = self.panel.wait_for_panel_interaction(30.0) # Give more time for review
+                # Show the review panel (button should be enabled now) and wait for user choice in one call
+                user_choice = self.panel.show_verification_review_panel(planned_desc, verification_result, wait_timeout_seconds=30.0) # Give more time for review
                 if not user_choice: user_choice = 'skip' # Default to skip on timeout
 
                 # --- Process User Choice ---
@@ -1439,47 +1431,21 @@ Respond ONLY with the JSON object matching the schema.
                  logger.error(f"LLM suggested index [{target_index}], but it was not found in DOM context map. Available: {available_indices}")
                  return {"action": "suggestion_failed", "parameters": {}, "reasoning": f"Suggested element index [{target_index}] not found in current page context."}
 
-            suggested_selector = target_node.css_selector
+            suggested_selector = target_node.css_selector # Generated on first access, falling back to the xpath
             if not suggested_selector:
-                 # Try to generate it now if missing
-                 suggested_selector = self.browser_controller.get_selector_for_node(target_node)
-                 if suggested_selector:
-                      target_node.css_selector = suggested_selector # Cache it
-                 else:
-                      logger.error(f"Could not generate selector for suggested index [{target_index}] (Node: {target_node.tag_name}).")
-                      return {"action": "suggestion_failed", "parameters": {}, "reasoning": f"Failed to generate CSS selector for suggested index [{target_index}]."}
+                 logger.error(f"Could not generate selector for suggested index [{target_index}] (Node: {target_node.tag_name}).")
+                 return {"action": "suggestion_failed", "parameters": {}, "reasoning": f"Failed to generate CSS selector for suggested index [{target_index}]."}
 
             if suggested_selector and target_node and self.browser_controller.page:
                 try:
-                    handles = self.browser_controller.page.query_selector_all(suggested_selector)
-                    num_matches = len(handles)
+                    # Count matches and get the XPath of a unique match in one round-trip
+                    match_info = self.browser_controller.batch_query([suggested_selector], xpath_generator_js=self._get_xpath_generator_js())[0]
+                    num_matches = match_info["count"] if match_info else 0
                     validation_passed = False
 
                     if num_matches == 1:
-                        # Get XPath of the element found by the generated selector
-                        # Note: Requires a reliable JS function 'generateXPath' accessible in evaluate
-                        try:
-                            with resources.files(__package__).joinpath('js_utils', 'xpathgenerator.js') as js_path:
-                                js_code = js_path.read_text(encoding='utf-8')
-                                logger.debug("xpathgenerator.js loaded successfully.")
-                        except FileNotFoundError:
-                            logger.error("xpathgenerator.js not found in the 'agents' package directory!")
-                            raise
-                        except Exception as e:
-                            logger.error(f"Error loading xpathgenerator.js: {e}", exc_info=True)
-                            raise
-
-                        # Pass a *function string* to evaluate. Playwright passes the handle as 'element'.
-                        # The function string first defines our helper, then calls it.
-                        script_to_run = f"""
-                            (element) => {{
-                                {js_code} // Define the helper function(s)
-                                return generateXPathForElement(element); // Call it
-                            }}
-                        """
-
-                        # Use page.evaluate, passing the script string and the element handle
-                        matched_xpath = self.browser_controller.page.evaluate(script_to_run, handles[0])
+                        # XPath of the element found by the generated selector
+                        matched_xpath = match_info["xpath"]
 
                         # Compare XPaths
                         if target_node.xpath == matched_xpath:
@@ -1524,15 +1490,10 @@ Respond ONLY with the JSON object matching the schema.
                         available_indices = list(self._latest_dom_state.selector_map.keys())
                         logger.error(f"LLM suggested index [{destination_index}], but it was not found in DOM context map. Available: {available_indices}")
                         return {"action": "suggestion_failed", "parameters": {}, "reasoning": f"Suggested element index [{destination_index}] not found in current page context."}
-                    destination_selector = destination_node.css_selector
+                    destination_selector = destination_node.css_selector # Generated on first access, falling back to the xpath
                     if not destination_selector:
-                        # Try to generate it now if missing
-                        destination_selector = self.browser_controller.get_selector_for_node(destination_node)
-                        if destination_selector:
-                            destination_node.css_selector = destination_selector # Cache it
-                        else:
-                            logger.error(f"Could not generate selector for suggested index [{destination_index}] (Node: {destination_node.tag_name}).")
-                            return {"action": "suggestion_failed", "parameters": {}, "reasoning": f"Failed to generate CSS selector for suggested index [{destination_index}]."}
+                        logger.error(f"Could not generate selector for suggested index [{destination_index}] (Node: {destination_node.tag_name}).")
+                        return {"action": "suggestion_failed", "parameters": {}, "reasoning": f"Failed to generate CSS selector for suggested index [{destination_index}]."}
                     
                     suggestion_dict["destination_selector"] = destination_selector
                     suggestion_dict["destination_node"] = destination_node
@@ -1712,10 +1673,10 @@ Respond ONLY with the JSON object matching the schema.
             if action == "drag_and_drop":
                 logger.info(f"[Auto Mode] Suggested Target Selector: {destination_selector}")
             self.browser_controller.clear_highlights()
-            self.browser_controller.highlight_element(suggested_selector, target_node.highlight_index, color="#FFA500", text="AI Suggestion")
-
+            highlights = [{"selector": suggested_selector, "index": target_node.highlight_index, "color": "#FFA500", "text": "AI Suggestion"}]
             if action == "drag_and_drop" and destination_selector and destination_node:
-               self.browser_controller.highlight_element(destination_selector, destination_node.highlight_index, color="#0000FF", text="AI Suggestion (Target)")
+               highlights.append({"selector": destination_selector, "index": destination_node.highlight_index, "color": "#0000FF", "text": "AI Suggestion (Target)"})
+            self.browser_controller.batch_highlight(highlights)
 
             # Directly accept AI suggestion
             final_selector = suggested_selector
@@ -1780,9 +1741,10 @@ Respond ONLY with the JSON object matching the schema.
 
             # Highlight suggested element
             self.browser_controller.clear_highlights()
-            self.browser_controller.highlight_element(suggested_selector, target_node.highlight_index, color="#FFA500", text="AI Suggestion") # Orange for suggestion
+            highlights = [{"selector": suggested_selector, "index": target_node.highlight_index, "color": "#FFA500", "text": "AI Suggestion"}] # Orange for suggestion
             if action == "drag_and_drop" and destination_selector and destination_node:
-               self.browser_controller.highlight_element(destination_selector, destination_node.highlight_index, color="#0000FF", text="AI Suggestion (Destination)")
+               highlights.append({"selector": destination_selector, "index": destination_node.highlight_index, "color": "#0000FF", "text": "AI Suggestion (Destination)"})
+            self.browser_controller.batch_highlight(highlights)
 
             # Show the UI Panel with options
             suggestion_display_text = f"'{action}' on <{target_node.tag_name}>"
@@ -2134,7 +2096,6 @@ Respond ONLY with the JSON object matching the schema.
                          except Exception as e:
                               logger.error(f"Error during manual override click wait: {e}", exc_info=True)
                               user_choice = 'abort'
-                    self.browser_controller.remove_click_listener() # Remove listener
 
                     if user_choice == 'override_target_confirmed':
                          final_selector = override_selector
@@ -2168,8 +2129,7 @@ Respond ONLY with the JSON object matching the schema.
                     current_state = "target_selection"; continue # Go back
 
                 print("Panel State: Select Assertion Type.")
-                self.panel.show_assertion_type_panel(final_selector)
-                user_choice = self.panel.wait_for_panel_interaction(20.0) # Wait for type selection
+                user_choice = self.panel.show_assertion_type_panel(final_selector, wait_timeout_seconds=20.0) # Wait for type selection
                 if not user_choice: user_choice = 'skip' # Default to skip on timeout
 
                 # --- Process Type Choice ---
@@ -2227,8 +2187,7 @@ Respond ONLY with the JSON object matching the schema.
                     "assert_element_count": ["Expected Count"]
                 }
                 param_labels = needs_params_map.get(assertion_action, [])
-                self.panel.show_assertion_params_panel(final_selector, assertion_action, param_labels)
-                user_choice = self.panel.wait_for_panel_interaction(60.0) # Longer timeout for typing
+                user_choice = self.panel.show_assertion_params_panel(final_selector, assertion_action, param_labels, wait_timeout_seconds=60.0) # Longer timeout for typing
                 if not user_choice: user_choice = 'skip' # Default to skip on timeout
 
                 # --- Process Param Choice ---
@@ -2594,7 +2553,6 @@ Respond ONLY with the JSON object matching the schema.
                                     logger.error(f"Error during element selection for baseline: {e}")
                                     print("Error selecting element. Defaulting to Full Page.")
                                     capture_type = 'page'
-                                self.browser_controller.remove_click_listener() # Clean up listener
                             else:
                                 print("Error setting up click listener. Defaulting to Full Page.")
                                 capture_type = 'page'
@@ -2829,14 +2787,15 @@ Respond ONLY with the JSON object matching the schema.
                               recording_status["success"] = False # Override success if any task failed
                               recording_status["message"] = recording_status["message"].replace("completed.", "completed with failures.") # Adjust message
                               logger.warning("Overriding overall success status to False due to permanently failed steps found.")
+                    console_messages = self.browser_controller.get_console_messages()
                     output_data = {
                         "test_name": f"{feature_description[:50]}_Test",
                         "feature_description": feature_description,
                         "recorded_at": datetime.utcnow().isoformat() + "Z",
-                        "console_logs": self.browser_controller.console_messages,
+                        "console_logs": console_messages,
                         "steps": self.recorded_steps
                     }
-                    recording_status["console_messages"] = self.browser_controller.console_messages
+                    recording_status["console_messages"] = console_messages
                     ts = time.strftime("%Y%m%d_%H%M%S")
                     safe_feature_name = re.sub(r'[^\w\-]+', '_', feature_description)[:50]
                     if self.file_name is None:
@@ -2848,8 +2807,7 @@ Respond ONLY with the JSON object matching the schema.
                         os.makedirs(output_dir)
                     self.output_file_path = os.path.join(output_dir, self.file_name)
 
-                    with open(self.output_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(output_data, f, indent=2, ensure_ascii=False)
+                    save_json_file(self.output_file_path, output_data)
 
                     recording_status["output_file"] = self.output_file_path
                     recording_status["steps_recorded"] = len(self.recorded_steps)
@@ -5,13 +5,16 @@ import time
 import random
 import json
 import os
-from typing import Optional, Any, Dict, List, Callable, Tuple
+import re
+from typing import Optional, Any, Dict, List, Callable, Tuple, Set
 import threading
 import platform
+import atexit
+from collections import deque
 
 from ..dom.service import DomService
 from ..dom.views import DOMState, DOMElementNode, SelectorMap
-from .panel.panel import Panel
+from .panel.panel import Panel, RECORDER_PANEL_INIT_SCRIPT
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +29,27 @@ COMMON_HEADERS = {
     'Upgrade-Insecure-Requests': '1',
 }
 
+USER_AGENTS = (
+    # Chrome on Windows
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36',
+     # Chrome on Mac
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    # Firefox on Windows
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0',
+    # Add more variations if desired (Edge, Safari etc.)
+)
+
+# (width, height) pairs; a fresh dict is built per context so the offsets never accumulate
+COMMON_VIEWPORT_SIZES = (
+    # (1280, 720),
+    # (1366, 768),
+    (800, 600),
+    # (1536, 864),
+)
+
 HIDE_WEBDRIVER_SCRIPT = """
 Object.defineProperty(navigator, 'webdriver', {
   get: () => undefined
@@ -58,31 +82,46 @@ async () => {
         event.preventDefault(); // Prevent default action (like navigation) ONLY for override clicks
         event.stopPropagation(); // Stop propagation ONLY for override clicks
 
+        // ---- IMPORTANT: Remove the listener AFTER processing an override click ----
+        // This prevents it interfering further and ensures it's gone before panel interaction waits
+        const finish = (selector) => {
+            // Only set override if a non-empty selector was generated
+            if (selector) {
+                window._recorder_override_selector = selector;
+                console.log(`[Recorder Listener] Override selector variable set: ${selector}`);
+                // Push the selector to a pending WAIT_FOR_OVERRIDE_CLICK_JS promise
+                if (window._recorder_resolveOverride) window._recorder_resolveOverride(selector);
+            } else {
+                console.warn('[Recorder Listener] Could not generate a valid selector for the override click.');
+            }
+            document.body.removeEventListener('click', clickHandler, { capture: true });
+            console.log('[Recorder Listener] Listener removed after processing override click.');
+        };
+
         if (!targetElement) {
           console.warn('[Recorder Listener] Override click event has no target.');
           // Remove listener even if target is null to avoid getting stuck
-          document.body.removeEventListener('click', clickHandler, { capture: true });
-          console.log('[Recorder Listener] Listener removed due to null target.');
+          finish('');
           return;
         }
-    
 
-        // --- Simple Selector Generation (enhance as needed) ---
-        let selector = '';
-        function escapeCSS(value) {
-            if (!value) return '';
-            // Basic escape for common CSS special chars in identifiers/strings
-            // For robust escaping, a library might be better, but this covers many cases.
-            return value.replace(/([!"#$%&'()*+,./:;<=>?@\\[\\]^`{|}~])/g, '\\$1');
+        // --- Fast path: most clickable widgets carry an id or data-testid ---
+        const id = targetElement.id;
+        if (id && id !== PANEL_ID && id !== 'playwright-highlight-container') {
+            finish(`#${CSS.escape(id.trim())}`);
+            return;
+        }
+        const testId = targetElement.getAttribute('data-testid');
+        if (testId) {
+            finish(`[data-testid="${CSS.escape(testId.trim())}"]`);
+            return;
         }
 
-        if (targetElement.id && targetElement.id !== PANEL_ID && targetElement.id !== 'playwright-highlight-container') {
-        selector = `#${escapeCSS(targetElement.id.trim())}`;
-        } else if (targetElement.getAttribute('data-testid')) {
-        selector = `[data-testid="${escapeCSS(targetElement.getAttribute('data-testid').trim())}"]`;
-        } else if (targetElement.name) {
-        selector = `${targetElement.tagName.toLowerCase()}[name="${escapeCSS(targetElement.name.trim())}"]`;
-        } else {
+        // --- Slow path: name attribute, then structural path ---
+        if (targetElement.name) {
+            finish(`${targetElement.tagName.toLowerCase()}[name="${CSS.escape(targetElement.name.trim())}"]`);
+            return;
+        }
         // Fallback: Basic XPath -> CSS approximation (needs improvement)
         let path = '';
         let current = targetElement;
@@ -90,47 +129,23 @@ async () => {
             let segment = current.tagName.toLowerCase();
             const parent = current.parentElement;
             if (parent) {
-                const siblings = Array.from(parent.children);
-                const sameTagSiblings = siblings.filter(sib => sib.tagName === current.tagName);
-                if (sameTagSiblings.length > 1) {
-                    let index = 1;
-                    for(let i=0; i < sameTagSiblings.length; i++) { // Find index correctly
-                        if(sameTagSiblings[i] === current) {
-                            index = i + 1;
-                            break;
-                        }
-                    }
-                    // Prefer nth-child if possible, might be slightly more stable
-                    try {
-                        const siblingIndex = Array.prototype.indexOf.call(parent.children, current) + 1;
-                        segment += `:nth-child(${siblingIndex})`;
-                    } catch(e) { // Fallback if indexOf fails
-                        segment += `:nth-of-type(${index})`;
-                    }
+                const siblings = parent.children;
+                let sameTagCount = 0;
+                for (let i = 0; i < siblings.length; i++) {
+                    if (siblings[i].tagName === current.tagName) sameTagCount++;
+                }
+                if (sameTagCount > 1) {
+                    // nth-child is slightly more stable than nth-of-type here
+                    const siblingIndex = Array.prototype.indexOf.call(siblings, current) + 1;
+                    segment += `:nth-child(${siblingIndex})`;
                 }
             }
             path = segment + (path ? ' > ' + path : '');
             current = parent;
         }
-        selector = path ? `body > ${path}` : targetElement.tagName.toLowerCase();
+        const selector = path ? `body > ${path}` : targetElement.tagName.toLowerCase();
         console.log(`[Recorder Listener] Generated fallback selector: ${selector}`);
-        }
-        // --- End Selector Generation ---
-
-        console.log(`[Recorder Listener] Override Target: ${targetElement.tagName}, Generated selector: ${selector}`);
-
-        // Only set override if a non-empty selector was generated
-        if (selector) {
-            window._recorder_override_selector = selector;
-            console.log('[Recorder Listener] Override selector variable set.');
-        } else {
-             console.warn('[Recorder Listener] Could not generate a valid selector for the override click.');
-        }
-        
-        // ---- IMPORTANT: Remove the listener AFTER processing an override click ----
-        // This prevents it interfering further and ensures it's gone before panel interaction waits
-        document.body.removeEventListener('click', clickHandler, { capture: true });
-        console.log('[Recorder Listener] Listener removed after processing override click.');
+        finish(selector);
     };
     // If it WAS a panel click (isPanelClick = true), we did nothing in this handler.
     // The event continues to the button's specific onclick handler.
@@ -148,6 +163,34 @@ async () => {
 }
 """
 
+# Installs the listener setup once per document; setup_click_listener then only calls it
+CLICK_LISTENER_INIT_SCRIPT = f"window._recorder_attachClickListener = {CLICK_LISTENER_JS.strip()};"
+
+# Resolves with the override selector as soon as the click handler reports it, or null after timeoutMs.
+# The listener and the override flag are cleaned up before resolving, so no follow-up evaluate is needed.
+WAIT_FOR_OVERRIDE_CLICK_JS = """
+(timeoutMs) => new Promise((resolve) => {
+    const settle = (selector) => {
+        window._recorder_resolveOverride = undefined;
+        if (window._recorderClickListener) {
+            document.body.removeEventListener('click', window._recorderClickListener, { capture: true });
+            delete window._recorderClickListener;
+        }
+        delete window._recorder_override_selector;
+        resolve(selector);
+    };
+    if (window._recorder_override_selector !== undefined) {
+        settle(window._recorder_override_selector); // Clicked before the wait started
+        return;
+    }
+    const timer = setTimeout(() => settle(null), timeoutMs);
+    window._recorder_resolveOverride = (selector) => {
+        clearTimeout(timer);
+        settle(selector);
+    };
+})
+"""
+
 REMOVE_CLICK_LISTENER_JS = """
 () => {
   let removed = false;
@@ -169,9 +212,273 @@ REMOVE_CLICK_LISTENER_JS = """
 }
 """
 
+# --- JavaScript for drawing highlight overlays ---
+# Installs window._bw_highlightBatch(items). All elements are resolved and measured first (read
+# phase); overlays are then built off-DOM in a fragment cloned from class-styled templates and
+# attached in one append inside requestAnimationFrame (write phase), so a batch costs one layout.
+HIGHLIGHTER_JS = """
+() => {
+  const HIGHLIGHT_CONTAINER_ID = "bw-highlight-container"; // Unique ID
+  const HIGHLIGHT_STYLE_ID = "bw-highlight-style";
+
+  // --- Shared overlay styles and container, created once per document and cached on window ---
+  const style = document.createElement("style");
+  style.id = HIGHLIGHT_STYLE_ID;
+  style.textContent = `
+      .bw-hl-box { position: fixed; border: 2px solid var(--bw-hl-color); background-color: var(--bw-hl-fill);
+                   pointer-events: none; box-sizing: border-box; z-index: 2147483646; }
+      .bw-hl-label { position: fixed; background: var(--bw-hl-color); color: white; padding: 1px 4px; border-radius: 4px;
+                     font-size: 10px; font-weight: bold; pointer-events: none; z-index: 2147483647; }
+  `;
+  const container = document.createElement("div");
+  container.id = HIGHLIGHT_CONTAINER_ID;
+  container.style.cssText = "position: fixed; pointer-events: none; top: 0; left: 0; width: 0; height: 0; z-index: 2147483646;";
+  container._boxTemplate = document.createElement("div");
+  container._boxTemplate.className = "bw-hl-box";
+  container._labelTemplate = document.createElement("div");
+  container._labelTemplate.className = "bw-hl-label";
+  window._bw_hl_container = container;
+
+  window._bw_highlightBatch = (items) => {
+      // Init scripts run before <body> exists, so attach on first use (and again if the page dropped them)
+      if (!style.isConnected) (document.head || document.documentElement).appendChild(style);
+      if (!container.isConnected) document.body.appendChild(container);
+
+      function findElement(selector, node_xpath) {
+          let element = null;
+          try {
+              element = document.querySelector(selector);
+          } catch (e) {
+              console.warn(`[Highlighter] querySelector failed for '${selector}': ${e.message}.`);
+              element = null; // Ensure element is null if querySelector fails
+          }
+          // --- Fallback to XPath if CSS failed AND xpath is available ---
+          if (!element && node_xpath) {
+              console.log(`[Highlighter] Falling back to XPath: ${node_xpath}`);
+              try {
+                  element = document.evaluate(node_xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+              } catch (e) {
+                  console.error(`[Highlighter] XPath evaluation failed for '${node_xpath}': ${e.message}`);
+                  element = null;
+              }
+          }
+          return element;
+      }
+
+      // --- Read phase: resolve and measure every element before touching the DOM ---
+      const measured = [];
+      for (const item of items) {
+          const element = findElement(item.selector, item.node_xpath);
+          if (!element) {
+              console.warn(`[Highlighter] Element not found using selector '${item.selector}' or XPath '${item.node_xpath}'. Cannot highlight.`);
+              continue;
+          }
+          const rect = element.getBoundingClientRect();
+          if (!rect || rect.width === 0 || rect.height === 0) continue; // Don't highlight non-rendered
+          measured.push({ item, rect });
+      }
+
+      // --- Write phase: build overlays off-DOM, attach once on the next frame ---
+      const generation = window._bw_hl_generation || 0;
+      requestAnimationFrame(() => {
+          if ((window._bw_hl_generation || 0) !== generation) return; // Cleared before this frame
+          const fragment = document.createDocumentFragment();
+          for (const { item, rect } of measured) {
+              const colorVars = `--bw-hl-color: ${item.color}; --bw-hl-fill: ${item.color}1A;`; // Fill at 10% opacity
+
+              const overlay = container._boxTemplate.cloneNode(false);
+              overlay.style.cssText = `${colorVars} top: ${rect.top}px; left: ${rect.left}px; width: ${rect.width}px; height: ${rect.height}px;`;
+              overlay.setAttribute('data-highlight-selector', item.selector); // Mark for cleanup
+              fragment.appendChild(overlay);
+
+              // Position label top-left, slightly offset; move inside if it would go off-screen top
+              const labelTop = rect.top - 18 < 0 ? rect.top + 2 : rect.top - 18;
+              const label = container._labelTemplate.cloneNode(false);
+              label.style.cssText = `${colorVars} top: ${labelTop}px; left: ${rect.left}px;`;
+              label.textContent = item.text ? `${item.index}: ${item.text}` : `${item.index}`;
+              label.setAttribute('data-highlight-selector', item.selector); // Mark for cleanup
+              fragment.appendChild(label);
+          }
+          container.appendChild(fragment);
+      });
+      return measured.length;
+  };
+}
+"""
+HIGHLIGHTER_INIT_SCRIPT = f"({HIGHLIGHTER_JS})();"
+
+# --- JavaScript for resolving many selectors in one evaluate ---
+# XPATH_HELPER is replaced with an optional script defining generateXPathForElement(element).
+BATCH_QUERY_JS_TEMPLATE = """
+(selectors) => {
+    XPATH_HELPER
+    const canGenerateXPath = typeof generateXPathForElement === 'function';
+    return selectors.map((sel) => {
+        let matches;
+        try {
+            matches = document.querySelectorAll(sel);
+        } catch (e) {
+            return null; // Invalid selector
+        }
+        const first = matches[0];
+        return {
+            count: matches.length,
+            visible: first ? first.offsetParent !== null : false,
+            text: first ? (first.innerText || '').trim().slice(0, 200) : null,
+            xpath: canGenerateXPath && matches.length === 1 ? generateXPathForElement(first) : null,
+        };
+    });
+}
+"""
+
+# Same description of a first match, for an element handle found by Playwright (batch_query fallback)
+BATCH_QUERY_ELEMENT_JS_TEMPLATE = """
+([first, count]) => {
+    XPATH_HELPER
+    const canGenerateXPath = typeof generateXPathForElement === 'function';
+    return {
+        count: count,
+        visible: first.offsetParent !== null,
+        text: (first.innerText || '').trim().slice(0, 200),
+        xpath: canGenerateXPath && count === 1 ? generateXPathForElement(first) : null,
+    };
+}
+"""
+
+# A selector is treated as XPath if it starts like one, or contains '/' and none of the CSS characters #.[>+~=
+_XPATH_RE = re.compile(r'[/(.]|[^#.\[>+~=]*/[^#.\[>+~=]*\Z')
+
+def _normalize_selector(selector: str) -> str:
+    """Prefixes plain XPath selectors with 'xpath=' for Playwright; CSS and already-prefixed selectors pass through."""
+    if selector.startswith(('css=', 'xpath=')) or not _XPATH_RE.match(selector):
+        return selector
+    return f"xpath={selector}"
+# Locators kept by _get_locator before the cache is reset
+LOCATOR_CACHE_SIZE = 512
+
+# Single non-retrying checks for state assertions, used by validate_assertion when polling itself (poll_ms);
+# each takes the locator and a short per-probe timeout
+STATE_ASSERTION_PROBES: Dict[str, Callable[[Locator, int], bool]] = {
+    'assert_visible': lambda locator, timeout: locator.is_visible(),
+    'assert_hidden': lambda locator, timeout: locator.is_hidden(),
+    'assert_checked': lambda locator, timeout: locator.is_checked(timeout=timeout),
+    'assert_not_checked': lambda locator, timeout: not locator.is_checked(timeout=timeout),
+    'assert_enabled': lambda locator, timeout: locator.is_enabled(timeout=timeout),
+    'assert_disabled': lambda locator, timeout: locator.is_disabled(timeout=timeout),
+}
+
+# Upper bound on waiting for the network to go idle after a navigation
+POST_NAVIGATION_IDLE_TIMEOUT_MS = 2000
+
+# Characters replaced when a selector is used in a screenshot file name
+_SANITIZE_RE = re.compile(r'[ :>]')
+
+def _safe_name(selector: str, max_len: int = 30) -> str:
+    """Turns a selector into a short file-name fragment."""
+    return _SANITIZE_RE.sub('_', selector)[:max_len]
+
+def _first_line(e: BaseException) -> str:
+    """First line of an exception message, without splitting the whole (often multi-line) Playwright text."""
+    s = str(e)
+    i = s.find('\n')
+    return s if i < 0 else s[:i]
+
+# Console messages / network requests kept per session; the oldest are dropped first on long sessions
+CONSOLE_BUFFER_SIZE = 10_000
+NETWORK_BUFFER_SIZE = 10_000
+
+# Anti-detection launch flags shared by every pooled browser
+BROWSER_LAUNCH_ARGS = ['--disable-blink-features=AutomationControlled']
+
+
+class _BrowserPool:
+    """
+    Keeps the Playwright driver and idle launched browsers alive between BrowserController sessions,
+    so a new session only pays for a fresh (cookie-isolated) context instead of a driver start and
+    a Chromium launch. Sync Playwright objects are bound to the thread that created them, hence the
+    pool is kept per thread. Only the main thread keeps browsers idle (closed at exit); worker threads
+    (e.g. asyncio.to_thread in the MCP server) shut theirs down once their last session closes.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def _state(self) -> threading.local:
+        state = self._local
+        if not hasattr(state, "playwright"):
+            state.playwright = None
+            state.idle_browsers = {} # headless flag -> list of idle Browser objects
+            state.live = 0 # Browsers handed out and not yet released
+        return state
+
+    def _shutdown_if_unused(self, state: threading.local):
+        # atexit only runs on the main thread, so nothing else would stop a worker thread's driver
+        if state.live == 0 and threading.current_thread() is not threading.main_thread():
+            self.shutdown()
+
+    def acquire(self, headless: bool) -> Tuple[Playwright, Browser]:
+        """Returns the thread's Playwright instance and an idle (or newly launched) browser."""
+        state = self._state()
+        if state.playwright is None:
+            logger.info("Starting Playwright...")
+            state.playwright = sync_playwright().start()
+        idle = state.idle_browsers.setdefault(headless, [])
+        while idle:
+            browser = idle.pop()
+            if browser.is_connected():
+                logger.info(f"Reusing pooled browser (headless={headless}).")
+                state.live += 1
+                return state.playwright, browser
+        logger.info(f"Launching browser (headless={headless})...")
+        try:
+            browser = state.playwright.chromium.launch(headless=headless, args=BROWSER_LAUNCH_ARGS)
+        except Exception:
+            self._shutdown_if_unused(state)
+            raise
+        state.live += 1
+        return state.playwright, browser
+
+    def release(self, browser: Browser, headless: bool):
+        """Returns a browser to the pool once its contexts are closed."""
+        state = self._state()
+        state.live = max(state.live - 1, 0)
+        if browser.is_connected():
+            state.idle_browsers.setdefault(headless, []).append(browser)
+        self._shutdown_if_unused(state)
+
+    def shutdown(self):
+        """Closes the calling thread's idle browsers and stops its Playwright driver."""
+        state = self._state()
+        for browsers in state.idle_browsers.values():
+            for browser in browsers:
+                try:
+                    browser.close()
+                except Exception as e:
+                    logger.warning(f"Could not close pooled browser: {e}")
+        state.idle_browsers = {}
+        if state.playwright:
+            try:
+                state.playwright.stop()
+                logger.info("Playwright stopped.")
+            except Exception as e:
+                logger.warning(f"Could not stop Playwright: {e}")
+            state.playwright = None
+
+
+_browser_pool = _BrowserPool()
+
+
+def shutdown_browser_pool():
+    """Closes pooled browsers owned by the calling thread (registered for the main thread at exit)."""
+    _browser_pool.shutdown()
+
+
+atexit.register(shutdown_browser_pool)
+
 
 class BrowserController:
     """Handles Playwright browser automation tasks, including console message capture."""
+    _created_dirs: Set[str] = set() # Screenshot directories already created, shared by all controllers
+
 
     def __init__(self, headless=True, viewport_size=None, auth_state_path: Optional[str] = None):
         self.playwright: Playwright | None = None
@@ -182,13 +489,22 @@ class BrowserController:
         self.default_navigation_timeout = 9000
         self.default_action_timeout = 9000
         self._dom_service: Optional[DomService] = None
-        self.console_messages: List[Dict[str, Any]] = [] # <-- Add list to store messages
+        self.console_messages: deque = deque(maxlen=CONSOLE_BUFFER_SIZE) # (timestamp, type, text) tuples, see get_console_messages
         self.viewport_size = viewport_size
-        self.network_requests: List[Dict[str, Any]] = []
+        self.network_requests: deque = deque(maxlen=NETWORK_BUFFER_SIZE)
         self.page_performance_timing: Optional[Dict[str, Any]] = None 
         self.auth_state_path = auth_state_path
         
         self.panel = Panel(headless=headless, page=self.page)
+        self._highlights_drawn = False # Overlays present in the current document; lets clear_highlights skip a no-op evaluate
+        self._cached_browser_version: Optional[str] = None # Looked up once per browser, see get_browser_version
+        self._cached_os_info: Optional[str] = None
+        self._viewport_cached: Optional[Dict[str, int]] = None # Viewport the context was created with
+        self._locator_cache: Dict[Tuple[int, str, bool], Locator] = {} # (id(page), selector, first) -> locator, see _get_locator
+        # Screenshots on failed actions cost hundreds of ms each; opt in for debugging
+        self.debug_screenshots_on_error: bool = os.getenv("BC_DEBUG_SHOTS") == "1"
+        self._cdp_session = None # Created on first get_html(fast=True), tied to self.page
+        self._assertion_handlers = self._build_assertion_handlers() # assertion_type -> handler, see validate_assertion
         logger.info(f"BrowserController initialized (headless={headless}).")
         
     def _handle_response(self, response: Response):
@@ -218,6 +534,11 @@ class BrowserController:
         }
         self.network_requests.append(req_data)
         
+    def _handle_dom_content_loaded(self, page: Page):
+        """Callback for a new main-frame document: overlays and the panel from the previous one are gone."""
+        self._highlights_drawn = False
+        self.panel.handle_document_loaded()
+
     def _handle_request_failed(self, request: Request):
         """Callback function to handle failed network requests."""
         try:
@@ -238,67 +559,69 @@ class BrowserController:
             }
             self.network_requests.append(req_data)
         except Exception as e:
-             logger.error(f"Error within _handle_request_failed for URL {request.url}: {e}", exc_info=True)
+             logger.error(f"Error within _handle_request_failed for URL {request.url}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
 
     def _handle_console_message(self, message: ConsoleMessage):
         """Callback function to handle console messages."""
         msg_type = message.type
         msg_text = message.text
-        timestamp = time.time()
-        log_entry = {
-            "timestamp": timestamp,
-            "type": msg_type,
-            "text": msg_text,
-            # Optional: Add location if needed, but can be verbose
-            # "location": message.location()
-        }
-        self.console_messages.append(log_entry)
+        # Stored as a tuple; converted to a dict only when exported
+        self.console_messages.append((time.time(), msg_type, msg_text))
         # Optional: Log immediately to agent's log file for real-time debugging
-        log_level = logging.WARNING if msg_type in ['error', 'warning'] else logging.DEBUG
-        logger.log(log_level, f"[CONSOLE.{msg_type.upper()}] {msg_text}")
+        log_level = logging.WARNING if msg_type in ('error', 'warning') else logging.DEBUG
+        if logger.isEnabledFor(log_level): # Chatty pages log hundreds of lines; skip the formatting when nobody listens
+            logger.log(log_level, "[CONSOLE.%s] %s", msg_type.upper(), msg_text)
 
     def _get_random_user_agent(self):
         """Provides a random choice from a list of common user agents."""
-        user_agents = [
-            # Chrome on Windows
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36',
-             # Chrome on Mac
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            # Firefox on Windows
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/119.0',
-            # Add more variations if desired (Edge, Safari etc.)
-        ]
-        return random.choice(user_agents)
+        return random.choice(USER_AGENTS)
 
     def _get_random_viewport(self):
         """Provides a slightly randomized common viewport size."""
-        common_sizes = [
-            # {'width': 1280, 'height': 720},
-            # {'width': 1366, 'height': 768},
-            {'width': 800, 'height': 600},
-            # {'width': 1536, 'height': 864},
-        ]
-        base = random.choice(common_sizes)
+        if self.viewport_size:
+            return self.viewport_size
+        width, height = random.choice(COMMON_VIEWPORT_SIZES)
         # Add small random offset
-        if not self.viewport_size:
-            base['width'] += random.randint(-10, 10)
-            base['height'] += random.randint(-5, 5)
-        else:
-            base = self.viewport_size
-        return base
+        return {'width': width + random.randint(-10, 10), 'height': height + random.randint(-5, 5)}
+
+    def _ensure_dir(self, directory: str):
+        """Creates directory once per process; later calls for the same path skip the makedirs syscall."""
+        if directory not in BrowserController._created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            BrowserController._created_dirs.add(directory)
+
+    def _save_failure_screenshot(self, kind: str, name: str) -> str:
+        """
+        Saves a viewport JPEG for a failed action as output/<kind>_<name>_<timestamp>.jpg and returns its path.
+        Only when debug_screenshots_on_error is set (BC_DEBUG_SHOTS=1); returns a placeholder for the error message otherwise.
+        """
+        if not self.debug_screenshots_on_error:
+            return "not captured (set BC_DEBUG_SHOTS=1)"
+        screenshot_path = f"output/{kind}_{name}_{int(time.time())}.jpg"
+        try:
+            abs_file_path = os.path.abspath(screenshot_path)
+            self._ensure_dir(os.path.dirname(abs_file_path))
+            self.page.screenshot(path=abs_file_path, full_page=False, type='jpeg', quality=60)
+            logger.error(f"Saved screenshot on {kind.replace('_', ' ')} to: {screenshot_path}")
+        except Exception as e:
+            logger.error(f"Error saving screenshot to {screenshot_path}: {e}")
+        return screenshot_path
 
     def _human_like_delay(self, min_secs: float, max_secs: float):
-        """ Sleeps for a random duration within the specified range. """
+        """
+        Waits for a random duration within the specified range.
+        Waits through Playwright when a page is open, so console/network events keep being dispatched meanwhile.
+        """
         delay = random.uniform(min_secs, max_secs)
-        logger.debug(f"Applying human-like delay: {delay:.2f} seconds")
-        time.sleep(delay)
+        logger.debug("Applying human-like delay: %.2f seconds", delay)
+        if self.page:
+            self.page.wait_for_timeout(delay * 1000)
+        else:
+            time.sleep(delay)
         
-    def _get_locator(self, selector: str):
+    def _get_locator(self, selector: str, first: bool = True):
         """
-        Gets a Playwright locator for the first matching element,
+        Gets a Playwright locator for the first matching element (or all matches with first=False),
         handling potential XPath selectors passed as CSS.
         """
         if not self.page:
@@ -306,24 +629,27 @@ class BrowserController:
         if not selector:
             raise ValueError("Selector cannot be empty.")
 
-        # Basic check to see if it looks like XPath
+        # Locators are lazy (resolved on each use), so a cached one stays valid across navigations
+        cache_key = (id(self.page), selector, first)
+        cached = self._locator_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
         # Playwright's locator handles 'xpath=...' automatically,
-        # but sometimes plain XPaths are passed. Let's try to detect them.
-        is_likely_xpath = selector.startswith(('/', '(', '.')) or \
-                          ('/' in selector and not any(c in selector for c in ['#', '.', '[', '>', '+', '~', '='])) # Avoid CSS chars
-
-        processed_selector = selector
-        if is_likely_xpath and not selector.startswith(('css=', 'xpath=')):
-            # If it looks like XPath, explicitly prefix it for Playwright's locator
-            logger.debug(f"Selector '{selector}' looks like XPath. Using explicit 'xpath=' prefix.")
-            processed_selector = f"xpath={selector}"
+        # but sometimes plain XPaths are passed; those get an explicit prefix.
         # If it starts with css= or xpath=, Playwright handles it.
         # Otherwise, it's assumed to be a CSS selector.
+        processed_selector = _normalize_selector(selector)
 
         try:
-            logger.debug(f"Attempting to create locator using: '{processed_selector}'")
+            logger.debug("Attempting to create locator using: '%s'", processed_selector)
             # Use .first to always target a single element, consistent with other actions
-            locator = self.page.locator(processed_selector).first
+            locator = self.page.locator(processed_selector)
+            if first:
+                locator = locator.first
+            if len(self._locator_cache) >= LOCATOR_CACHE_SIZE:
+                self._locator_cache.clear() # Simple bound; selectors repeat within a flow, not across long sessions
+            self._locator_cache[cache_key] = locator
             return locator
         except Exception as e:
             # Catch errors during locator creation itself (e.g., invalid selector syntax)
@@ -342,9 +668,11 @@ class BrowserController:
             logger.error("Page not initialized. Cannot set up click listener.")
             return False
         try:
-            # Inject and run the listener setup JS
+            # Run the listener setup installed by the init script (send it only if this document lacks it)
             # It now resets the flag internally before adding the listener
-            self.page.evaluate(CLICK_LISTENER_JS)
+            attached = self.page.evaluate("() => window._recorder_attachClickListener ? window._recorder_attachClickListener().then(() => true) : false")
+            if not attached:
+                self.page.evaluate(CLICK_LISTENER_JS)
             logger.info("JavaScript click listener attached (using pre-exposed callback).")
             return True
 
@@ -368,8 +696,8 @@ class BrowserController:
 
     def wait_for_user_click_or_timeout(self, timeout_seconds: float) -> Optional[str]:
         """
-        Waits for the user to click (triggering the callback) or for the timeout.
-        Returns the selector if clicked, None otherwise.
+        Waits for the user to click (the click handler resolves the wait) or for the timeout.
+        Removes the click listener either way. Returns the selector if clicked, None otherwise.
         MUST be called after setup_click_listener.
         """
         if self.headless: return None
@@ -378,30 +706,21 @@ class BrowserController:
              return None
 
         selector_result = None
-        js_condition = "() => window._recorder_override_selector !== undefined"
         timeout_ms = timeout_seconds * 1000
 
-        logger.info(f"Waiting up to {timeout_seconds}s for user click (checking JS flag)...")
+        logger.info(f"Waiting up to {timeout_seconds}s for user click...")
 
         try:
-            # Wait for the JS condition to become true
-            self.page.wait_for_function(js_condition, timeout=timeout_ms)
-
-            # If wait_for_function completes without timeout, the flag was set
-            logger.info("User click detected (JS flag set)!")
-            # Retrieve the value set by the click handler
-            selector_result = self.page.evaluate("window._recorder_override_selector")
-            logger.debug(f"Retrieved selector from JS flag: {selector_result}")
-
-        except PlaywrightTimeoutError:
-            logger.info("Timeout reached waiting for user click (JS flag not set).")
-            selector_result = None # Timeout occurred
+            # Single evaluate: the promise is resolved by the click handler or by the in-page timeout
+            selector_result = self.page.evaluate(WAIT_FOR_OVERRIDE_CLICK_JS, timeout_ms)
+            if selector_result:
+                logger.info(f"User click detected! Selector: {selector_result}")
+            else:
+                logger.info("Timeout reached waiting for user click.")
         except Exception as e:
-             logger.error(f"Error during page.wait_for_function: {e}", exc_info=True)
+             logger.error(f"Error while waiting for user click: {e}", exc_info=True)
              selector_result = None # Treat other errors as timeout/failure
-
-        finally:
-             # Clean up the JS listener and the flag regardless of outcome
+             # The promise never settled, so its cleanup did not run
              self.remove_click_listener()
 
         return selector_result
@@ -410,114 +729,38 @@ class BrowserController:
     # Highlighting elements
     def highlight_element(self, selector: str, index: int, color: str = "#FF0000", text: Optional[str] = None, node_xpath: Optional[str] = None):
         """Highlights an element using a specific selector and index label."""
-        if self.headless or not self.page: return
-        try:
-            self.page.evaluate("""
-                (args) => {
-                    const { selector, index, color, text, node_xpath } = args;
-                    const HIGHLIGHT_CONTAINER_ID = "bw-highlight-container"; // Unique ID
-
-                    let container = document.getElementById(HIGHLIGHT_CONTAINER_ID);
-                    if (!container) {
-                        container = document.createElement("div");
-                        container.id = HIGHLIGHT_CONTAINER_ID;
-                        container.style.position = "fixed";
-                        container.style.pointerEvents = "none";
-                        container.style.top = "0";
-                        container.style.left = "0";
-                        container.style.width = "0"; // Occupy no space
-                        container.style.height = "0";
-                        container.style.zIndex = "2147483646"; // Below listener potentially
-                        document.body.appendChild(container);
-                    }
-
-                    let element = null;
-                    try {
-                        element = document.querySelector(selector);
-                    } catch (e) {
-                        console.warn(`[Highlighter] querySelector failed for '${selector}': ${e.message}.`);
-                        element = null; // Ensure element is null if querySelector fails
-                    }
+        self.batch_highlight([{"selector": selector, "index": index, "color": color, "text": text, "node_xpath": node_xpath}])
 
-                    // --- Fallback to XPath if CSS failed AND xpath is available ---
-                    if (!element && node_xpath) {
-                        console.log(`[Highlighter] Falling back to XPath: ${node_xpath}`);
-                        try {
-                            element = document.evaluate(
-                                node_xpath,
-                                document,
-                                null,
-                                XPathResult.FIRST_ORDERED_NODE_TYPE,
-                                null
-                            ).singleNodeValue;
-                        } catch (e) {
-                            console.error(`[Highlighter] XPath evaluation failed for '${node_xpath}': ${e.message}`);
-                            element = null;
-                        }
-                    }
-                    // ------------------------------------------------------------
-
-                    if (!element) {
-                        console.warn(`[Highlighter] Element not found using selector '${selector}' or XPath '${node_xpath}'. Cannot highlight.`);
-                        return;
-                    }
-
-                    const rect = element.getBoundingClientRect();
-                    if (!rect || rect.width === 0 || rect.height === 0) return; // Don't highlight non-rendered
-
-                    const overlay = document.createElement("div");
-                    overlay.style.position = "fixed";
-                    overlay.style.border = `2px solid ${color}`;
-                    overlay.style.backgroundColor = color + '1A'; // 10% opacity
-                    overlay.style.pointerEvents = "none";
-                    overlay.style.boxSizing = "border-box";
-                    overlay.style.top = `${rect.top}px`;
-                    overlay.style.left = `${rect.left}px`;
-                    overlay.style.width = `${rect.width}px`;
-                    overlay.style.height = `${rect.height}px`;
-                    overlay.style.zIndex = "2147483646";
-                    overlay.setAttribute('data-highlight-selector', selector); // Mark for cleanup
-                    container.appendChild(overlay);
-
-                    const label = document.createElement("div");
-                    const labelText = text ? `${index}: ${text}` : `${index}`;
-                    label.style.position = "fixed";
-                    label.style.background = color;
-                    label.style.color = "white";
-                    label.style.padding = "1px 4px";
-                    label.style.borderRadius = "4px";
-                    label.style.fontSize = "10px";
-                    label.style.fontWeight = "bold";
-                    label.style.zIndex = "2147483647";
-                    label.textContent = labelText;
-                    label.setAttribute('data-highlight-selector', selector); // Mark for cleanup
-
-                    // Position label top-left, slightly offset
-                    let labelTop = rect.top - 18;
-                    let labelLeft = rect.left;
-                     // Adjust if label would go off-screen top
-                    if (labelTop < 0) labelTop = rect.top + 2;
-
-                    label.style.top = `${labelTop}px`;
-                    label.style.left = `${labelLeft}px`;
-                    container.appendChild(label);
-                }
-            """, {"selector": selector, "index": index, "color": color, "text": text, "node_xpath": node_xpath})
+    def batch_highlight(self, items: List[Dict[str, Any]]):
+        """
+        Highlights several elements with a single evaluate; collect a step's highlights and pass them together.
+        Each item takes the highlight_element arguments: selector, index, color, text, node_xpath.
+        """
+        if self.headless or not self.page or not items: return
+        items = [{"color": "#FF0000", "text": None, "node_xpath": None, **item} for item in items]
+        try:
+            drawn = self.page.evaluate("(items) => window._bw_highlightBatch ? window._bw_highlightBatch(items) : -1", items)
+            if drawn == -1: # Document predates the init script (e.g. loaded before start finished)
+                self.page.evaluate(HIGHLIGHTER_JS)
+                self.page.evaluate("(items) => window._bw_highlightBatch(items)", items)
+            self._highlights_drawn = True
         except Exception as e:
-            logger.warning(f"Failed to highlight element '{selector}': {e}")
+            logger.warning(f"Failed to highlight elements {[item.get('selector') for item in items]}: {e}")
 
     def clear_highlights(self):
         """Removes all highlight overlays and labels added by highlight_element."""
-        if self.headless or not self.page: return
+        if self.headless or not self.page or not self._highlights_drawn: return
         try:
             self.page.evaluate("""
                 () => {
-                    const container = document.getElementById("bw-highlight-container");
+                    window._bw_hl_generation = (window._bw_hl_generation || 0) + 1; // Cancel batches still waiting for a frame
+                    const container = window._bw_hl_container || document.getElementById("bw-highlight-container");
                     if (container) {
-                        container.innerHTML = ''; // Clear contents efficiently
+                        container.replaceChildren(); // Detach overlays without going through the HTML parser
                     }
                 }
             """)
+            self._highlights_drawn = False
             # logger.debug("Cleared highlights.")
         except Exception as e:
             logger.warning(f"Could not clear highlights: {e}")
@@ -564,11 +807,7 @@ class BrowserController:
             )
             end_time = time.time()
             logger.info(f"Structured DOM retrieved in {end_time - start_time:.2f}s. Found {len(dom_state.selector_map)} interactive elements.")
-            # Generate selectors immediately for recorder use
-            if dom_state and dom_state.selector_map:
-                for node in dom_state.selector_map.values():
-                     if not node.css_selector:
-                           node.css_selector = self.get_selector_for_node(node)
+            # css_selector is generated lazily per node on first access (see DOMElementNode.css_selector)
             return dom_state
         
         except Exception as e:
@@ -576,15 +815,49 @@ class BrowserController:
             return None
     
     def get_selector_for_node(self, node: DOMElementNode) -> Optional[str]:
-        """Generates a robust CSS selector for a given DOMElementNode."""
+        """Generates a robust CSS selector for a given DOMElementNode (cached on the node, xpath as fallback)."""
         if not node: return None
+        return node.css_selector
+    
+    def batch_query(self, selectors: List[str], xpath_generator_js: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Resolves several CSS selectors with a single evaluate instead of one round-trip per selector/handle.
+
+        Args:
+            selectors: CSS selectors to look up in the main document.
+            xpath_generator_js: Optional JS source defining generateXPathForElement(element). When given,
+                                selectors matching exactly one element also report that element's XPath.
+
+        Returns:
+            One entry per selector, in order: None for an invalid selector, otherwise a dict with
+            'count', plus 'visible', 'text' and 'xpath' describing the first match.
+            Selectors the document query rejects or finds nothing for are retried through Playwright,
+            which also pierces open shadow roots and understands its own selector syntax.
+        """
+        if not self.page:
+            logger.error("Cannot query selectors, page not initialized.")
+            return [None] * len(selectors)
+        if not selectors:
+            return []
+        script = BATCH_QUERY_JS_TEMPLATE.replace("XPATH_HELPER", xpath_generator_js or "")
+        results = self.page.evaluate(script, selectors)
+        for i, result in enumerate(results):
+            if result is None or result["count"] == 0:
+                results[i] = self._query_with_playwright(selectors[i], xpath_generator_js)
+        return results
+
+    def _query_with_playwright(self, selector: str, xpath_generator_js: Optional[str]) -> Optional[Dict[str, Any]]:
+        """batch_query entry for one selector resolved by Playwright's engine; None if the selector is invalid."""
         try:
-            # Use the static method from DomService
-            return DomService._enhanced_css_selector_for_element(node)
+            handles = self.page.query_selector_all(selector)
         except Exception as e:
-             logger.error(f"Error generating selector for node {node.xpath}: {e}", exc_info=True)
-             return node.xpath # Fallback to xpath
-    
+            logger.debug(f"Selector '{selector}' is invalid for Playwright too: {e}")
+            return None
+        if not handles:
+            return {"count": 0, "visible": False, "text": None, "xpath": None}
+        script = BATCH_QUERY_ELEMENT_JS_TEMPLATE.replace("XPATH_HELPER", xpath_generator_js or "")
+        return self.page.evaluate(script, [handles[0], len(handles)])
+
     def get_performance_timing(self) -> Optional[Dict[str, Any]]:
         """Gets the window.performance.timing object from the page."""
         if not self.page:
@@ -604,6 +877,27 @@ class BrowserController:
             logger.error(f"Error getting performance timing: {e}", exc_info=True)
             return None
 
+    def get_html(self, fast: bool = False) -> Optional[str]:
+        """
+        Returns the page's serialized HTML.
+        With fast=True, reads the document's outerHTML over a (cached) CDP session instead of page.content(),
+        skipping Playwright's in-page serialization; useful for very large DOMs. Chromium only.
+        """
+        if not self.page:
+            logger.error("Cannot get HTML, browser not started.")
+            return None
+        try:
+            if not fast:
+                return self.page.content()
+            if self._cdp_session is None:
+                self._cdp_session = self.page.context.new_cdp_session(self.page)
+            # depth 0: only the root's nodeId is needed, not the whole tree sent over the protocol
+            root = self._cdp_session.send("DOM.getDocument", {"depth": 0})["root"]
+            return self._cdp_session.send("DOM.getOuterHTML", {"nodeId": root["nodeId"]})["outerHTML"]
+        except Exception as e:
+            logger.error(f"Error getting page HTML (fast={fast}): {e}", exc_info=True)
+            return None
+
     def get_current_url(self) -> str:
         """Returns the current URL of the page."""
         if not self.page:
@@ -617,23 +911,29 @@ class BrowserController:
     def get_browser_version(self) -> str:
         if not self.browser:
             return "Unknown"
-        try:
-            # Browser version might be available directly
-            return f"{self.browser.browser_type.name} {self.browser.version}"
-        except Exception:
-            logger.warning("Could not retrieve exact browser version.")
-            return self.browser.browser_type.name if self.browser else "Unknown"
+        if self._cached_browser_version is None: # Fixed for the lifetime of the browser; reset in close()
+            try:
+                # Browser version might be available directly
+                self._cached_browser_version = f"{self.browser.browser_type.name} {self.browser.version}"
+            except Exception:
+                logger.warning("Could not retrieve exact browser version.")
+                return self.browser.browser_type.name if self.browser else "Unknown"
+        return self._cached_browser_version
 
     def get_os_info(self) -> str:
-        try:
-            return f"{platform.system()} {platform.release()}"
-        except Exception:
-            logger.warning("Could not retrieve OS information.")
-            return "Unknown"
+        if self._cached_os_info is None:
+            try:
+                self._cached_os_info = f"{platform.system()} {platform.release()}"
+            except Exception:
+                logger.warning("Could not retrieve OS information.")
+                return "Unknown"
+        return self._cached_os_info
 
     def get_viewport_size(self) -> Optional[Dict[str, int]]:
          if not self.page:
               return None
+         if self._viewport_cached is not None:
+              return dict(self._viewport_cached) # Set when the context was created; the viewport is never resized
          try:
               return self.page.viewport_size # Returns {'width': W, 'height': H} or None
          except Exception:
@@ -642,13 +942,16 @@ class BrowserController:
 
 
     def get_console_messages(self) -> List[Dict[str, Any]]:
-        """Returns a copy of the captured console messages."""
-        return list(self.console_messages) # Return a copy
+        """Returns a copy of the captured console messages as dicts with timestamp, type and text."""
+        return [
+            {"timestamp": timestamp, "type": msg_type, "text": msg_text}
+            for timestamp, msg_type, msg_text in self.console_messages
+        ]
 
     def clear_console_messages(self):
         """Clears the stored console messages."""
         logger.debug("Clearing captured console messages.")
-        self.console_messages = []
+        self.console_messages.clear()
         
     def get_network_requests(self) -> List[Dict[str, Any]]:
         """Returns a copy of the captured network request data."""
@@ -657,11 +960,82 @@ class BrowserController:
     def clear_network_requests(self):
         """Clears the stored network request data."""
         logger.debug("Clearing captured network requests.")
-        self.network_requests = []
+        self.network_requests.clear()
 
 
 
-    def validate_assertion(self, assertion_type: str, selector: str, params: Dict[str, Any], timeout_ms: int = 3000) -> Tuple[bool, Optional[str]]:
+    def _poll_state(self, probe: Callable[[int], bool], timeout_ms: int, poll_ms: int) -> bool:
+        """
+        Calls probe(poll_ms) until it returns True or timeout_ms elapses, backing off poll_ms, 2x, 4x.
+        Probe errors (e.g. element not attached yet) count as not satisfied.
+        """
+        deadline = time.monotonic() + timeout_ms / 1000
+        intervals = (poll_ms, poll_ms * 2, poll_ms * 4)
+        attempt = 0
+        while True:
+            try:
+                if probe(poll_ms):
+                    return True
+            except PlaywrightError:
+                pass
+            remaining_ms = (deadline - time.monotonic()) * 1000
+            if remaining_ms <= 0:
+                return False
+            self.page.wait_for_timeout(min(intervals[min(attempt, 2)], remaining_ms))
+            attempt += 1
+
+    # Assertion handlers for validate_assertion: (selector, locator, params, timeout_ms) -> Optional[error for missing params].
+    # Use Playwright's expect() for efficient checks; a failed check raises.
+    def _build_assertion_handlers(self) -> Dict[str, Callable[[str, Locator, Dict[str, Any], int], Optional[str]]]:
+        return {
+            'assert_visible': lambda sel, loc, p, t: expect(loc).to_be_visible(timeout=t),
+            'assert_hidden': lambda sel, loc, p, t: expect(loc).to_be_hidden(timeout=t),
+            'assert_text_equals': self._assert_text_equals,
+            'assert_text_contains': self._assert_text_contains,
+            'assert_attribute_equals': self._assert_attribute_equals,
+            'assert_element_count': self._assert_element_count,
+            'assert_checked': lambda sel, loc, p, t: expect(loc).to_be_checked(timeout=t),
+            'assert_not_checked': lambda sel, loc, p, t: expect(loc).not_to_be_checked(timeout=t),
+            'assert_enabled': lambda sel, loc, p, t: expect(loc).to_be_enabled(timeout=t),
+            'assert_disabled': lambda sel, loc, p, t: expect(loc).to_be_disabled(timeout=t),
+            'assert_llm_verification': self._assert_llm_verification,
+        }
+
+    def _assert_text_equals(self, selector: str, locator: Locator, params: Dict[str, Any], timeout_ms: int) -> Optional[str]:
+        expected_text = params.get('expected_text')
+        if expected_text is None: return "Missing 'expected_text' parameter for assert_text_equals"
+        expect(locator).to_have_text(expected_text, timeout=timeout_ms)
+        return None
+
+    def _assert_text_contains(self, selector: str, locator: Locator, params: Dict[str, Any], timeout_ms: int) -> Optional[str]:
+        expected_text = params.get('expected_text')
+        if expected_text is None: return "Missing 'expected_text' parameter for assert_text_contains"
+        expect(locator).to_contain_text(expected_text, timeout=timeout_ms)
+        return None
+
+    def _assert_attribute_equals(self, selector: str, locator: Locator, params: Dict[str, Any], timeout_ms: int) -> Optional[str]:
+        attr_name = params.get('attribute_name')
+        expected_value = params.get('expected_value')
+        if not attr_name: return "Missing 'attribute_name' parameter"
+        # Note: Playwright's to_have_attribute handles presence and value check
+        expect(locator).to_have_attribute(attr_name, expected_value if expected_value is not None else "", timeout=timeout_ms) # Check empty string if value is None/missing? Or require value? Let's require non-None value.
+        # if expected_value is None: return "Missing 'expected_value' parameter" # Stricter check
+        return None
+
+    def _assert_element_count(self, selector: str, locator: Locator, params: Dict[str, Any], timeout_ms: int) -> Optional[str]:
+        expected_count = params.get('expected_count')
+        if expected_count is None: return "Missing 'expected_count' parameter"
+        # All matches for count, with the same xpath handling as the single-element locator
+        all_matches_locator = self._get_locator(selector, first=False)
+        expect(all_matches_locator).to_have_count(expected_count, timeout=timeout_ms)
+        return None
+
+    def _assert_llm_verification(self, selector: str, locator: Locator, params: Dict[str, Any], timeout_ms: int) -> Optional[str]:
+        logger.info("Skipping Playwright validation for 'assert_llm_verification'.")
+        # This assertion type is validated externally by the LLM during execution.
+        return None # Treat as passed for this quick check
+
+    def validate_assertion(self, assertion_type: str, selector: str, params: Dict[str, Any], timeout_ms: int = 3000, poll_ms: Optional[int] = None) -> Tuple[bool, Optional[str]]:
         """
         Performs a quick Playwright check to validate a proposed assertion. 
 
@@ -670,6 +1044,8 @@ class BrowserController:
             selector: The CSS selector for the target element.
             params: Dictionary of parameters for the assertion (e.g., expected_text).
             timeout_ms: Short timeout for the validation check.
+            poll_ms: If set, state assertions (visible/hidden/checked/enabled...) poll at this interval
+                     instead of expect()'s slower built-in schedule.
 
         Returns:
             Tuple (bool, Optional[str]): (True, None) if validation passes,
@@ -686,86 +1062,66 @@ class BrowserController:
         if not assertion_type:
             return False, "Assertion type is required for validation."
 
-        logger.info(f"Validating assertion: {assertion_type} on '{selector}' with params {params} (timeout: {timeout_ms}ms)")
+        logger.info("Validating assertion: %s on '%s' with params %s (timeout: %sms)", assertion_type, selector, params, timeout_ms)
         try:
             locator = self._get_locator(selector) # Use helper to handle xpath/css
 
-            # Use Playwright's expect() for efficient checks
-            if assertion_type == 'assert_visible':
-                expect(locator).to_be_visible(timeout=timeout_ms)
-            elif assertion_type == 'assert_hidden':
-                expect(locator).to_be_hidden(timeout=timeout_ms)
-            elif assertion_type == 'assert_text_equals':
-                expected_text = params.get('expected_text')
-                if expected_text is None: return False, "Missing 'expected_text' parameter for assert_text_equals"
-                expect(locator).to_have_text(expected_text, timeout=timeout_ms)
-            elif assertion_type == 'assert_text_contains':
-                expected_text = params.get('expected_text')
-                if expected_text is None: return False, "Missing 'expected_text' parameter for assert_text_contains"
-                expect(locator).to_contain_text(expected_text, timeout=timeout_ms)
-            elif assertion_type == 'assert_attribute_equals':
-                attr_name = params.get('attribute_name')
-                expected_value = params.get('expected_value')
-                if not attr_name: return False, "Missing 'attribute_name' parameter"
-                # Note: Playwright's to_have_attribute handles presence and value check
-                expect(locator).to_have_attribute(attr_name, expected_value if expected_value is not None else "", timeout=timeout_ms) # Check empty string if value is None/missing? Or require value? Let's require non-None value.
-                # if expected_value is None: return False, "Missing 'expected_value' parameter" # Stricter check
-                # expect(locator).to_have_attribute(attr_name, expected_value, timeout=timeout_ms)
-            elif assertion_type == 'assert_element_count':
-                expected_count = params.get('expected_count')
-                if expected_count is None: return False, "Missing 'expected_count' parameter"
-                # Re-evaluate locator to get all matches for count
-                all_matches_locator = self.page.locator(selector)
-                expect(all_matches_locator).to_have_count(expected_count, timeout=timeout_ms)
-            elif assertion_type == 'assert_checked':
-                expect(locator).to_be_checked(timeout=timeout_ms)
-            elif assertion_type == 'assert_not_checked':
-                 # Use expect(...).not_to_be_checked()
-                 expect(locator).not_to_be_checked(timeout=timeout_ms)
-            elif assertion_type == 'assert_enabled':
-                 expect(locator).to_be_enabled(timeout=timeout_ms)
-            elif assertion_type == 'assert_disabled':
-                 expect(locator).to_be_disabled(timeout=timeout_ms)
-            elif assertion_type == 'assert_llm_verification':
-                 logger.info("Skipping Playwright validation for 'assert_llm_verification'.")
-                 # This assertion type is validated externally by the LLM during execution.
-                 pass # Treat as passed for this quick check
+            state_probe = STATE_ASSERTION_PROBES.get(assertion_type) if poll_ms else None
+            if state_probe:
+                if not self._poll_state(lambda probe_timeout: state_probe(locator, probe_timeout), timeout_ms, poll_ms):
+                    raise AssertionError(f"{assertion_type} not satisfied within {timeout_ms}ms")
             else:
-                return False, f"Unsupported assertion type for validation: {assertion_type}"
+                handler = self._assertion_handlers.get(assertion_type)
+                if handler is None:
+                    return False, f"Unsupported assertion type for validation: {assertion_type}"
+                # Handlers raise on a failed check and return an error message for missing parameters
+                missing_param_error = handler(selector, locator, params, timeout_ms)
+                if missing_param_error:
+                    return False, missing_param_error
 
             # If no exception was raised by expect()
-            logger.info(f"Validation successful for {assertion_type} on '{selector}'.")
+            logger.info("Validation successful for %s on '%s'.", assertion_type, selector)
             return True, None
 
         except PlaywrightTimeoutError as e:
-            err_msg = f"Validation failed for {assertion_type} on '{selector}': Timeout ({timeout_ms}ms) - {str(e).splitlines()[0]}"
+            err_msg = f"Validation failed for {assertion_type} on '{selector}': Timeout ({timeout_ms}ms) - {_first_line(e)}"
             logger.warning(err_msg)
             return False, err_msg
         except AssertionError as e: # Catch expect() assertion failures
-            err_msg = f"Validation failed for {assertion_type} on '{selector}': Condition not met - {str(e).splitlines()[0]}"
+            err_msg = f"Validation failed for {assertion_type} on '{selector}': Condition not met - {_first_line(e)}"
             logger.warning(err_msg)
             return False, err_msg
         except PlaywrightError as e:
-            err_msg = f"Validation failed for {assertion_type} on '{selector}': PlaywrightError - {str(e).splitlines()[0]}"
+            err_msg = f"Validation failed for {assertion_type} on '{selector}': PlaywrightError - {_first_line(e)}"
             logger.warning(err_msg)
             return False, err_msg
         except Exception as e:
             err_msg = f"Unexpected error during validation for {assertion_type} on '{selector}': {type(e).__name__} - {e}"
-            logger.error(err_msg, exc_info=True)
+            logger.error(err_msg, exc_info=logger.isEnabledFor(logging.DEBUG))
             return False, err_msg
 
 
 
-    def goto(self, url: str):
-        """Navigates the page to a specific URL."""
+    def goto(self, url: str, ready_selector: Optional[str] = None):
+        """
+        Navigates the page to a specific URL.
+        After load, waits briefly for the network to go idle, or for ready_selector to become visible if given
+        (use it for pages whose long-polling requests never let the network idle).
+        """
         if not self.page:
             raise PlaywrightError("Browser not started. Call start() first.")
         try:
             logger.info(f"Navigating to URL: {url}")
             # Use default navigation timeout set in context
             response = self.page.goto(url, wait_until='load', timeout=self.default_navigation_timeout) 
-            # Add a small stable delay after load
-            time.sleep(1)
+            # Settle on a condition instead of a fixed delay; not settling in time is not an error
+            try:
+                if ready_selector:
+                    self._get_locator(ready_selector).wait_for(state='visible', timeout=self.default_action_timeout)
+                else:
+                    self.page.wait_for_load_state('networkidle', timeout=POST_NAVIGATION_IDLE_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                logger.debug("Page did not settle after navigating to %s; continuing.", url)
             status = response.status if response else 'unknown'
             
             # --- Capture performance timing after navigation ---
@@ -783,7 +1139,7 @@ class BrowserController:
             logger.error(f"Playwright error navigating to {url}: {e}")
             raise PlaywrightError(f"Error navigating to {url}: {e}") from e
         except Exception as e:
-            logger.error(f"Unexpected error navigating to {url}: {e}", exc_info=True)
+            logger.error(f"Unexpected error navigating to {url}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise # Re-raise for the agent to handle
 
     def check(self, selector: str): 
@@ -792,7 +1148,7 @@ class BrowserController:
             raise PlaywrightError("Browser not started.")
         try:
             logger.info(f"Attempting to check element: {selector}")
-            locator = self.page.locator(selector).first
+            locator = self._get_locator(selector)
             # check() includes actionability checks (visible, enabled)
             locator.check(timeout=self.default_action_timeout)
             logger.info(f"Checked element: {selector}")
@@ -800,15 +1156,13 @@ class BrowserController:
         except PlaywrightTimeoutError as e:
             logger.error(f"Timeout ({self.default_action_timeout}ms) waiting for element '{selector}' to be actionable for check.")
             # Add screenshot on failure
-            screenshot_path = f"output/check_timeout_{selector.replace(' ','_').replace(':','_').replace('>','_')[:30]}_{int(time.time())}.png"
-            self.save_screenshot(screenshot_path)
-            logger.error(f"Saved screenshot on check timeout to: {screenshot_path}")
+            screenshot_path = self._save_failure_screenshot("check_timeout", _safe_name(selector))
             raise PlaywrightTimeoutError(f"Timeout trying to check element: '{selector}'. Check visibility and enabled state. Screenshot: {screenshot_path}") from e
         except PlaywrightError as e:
             logger.error(f"PlaywrightError checking element '{selector}': {e}")
             raise PlaywrightError(f"Failed to check element '{selector}': {e}") from e
         except Exception as e:
-            logger.error(f"Unexpected error checking '{selector}': {e}", exc_info=True)
+            logger.error(f"Unexpected error checking '{selector}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise PlaywrightError(f"Unexpected error checking element '{selector}': {e}") from e
 
     def uncheck(self, selector: str):
@@ -817,22 +1171,20 @@ class BrowserController:
             raise PlaywrightError("Browser not started.")
         try:
             logger.info(f"Attempting to uncheck element: {selector}")
-            locator = self.page.locator(selector).first
+            locator = self._get_locator(selector)
             # uncheck() includes actionability checks
             locator.uncheck(timeout=self.default_action_timeout)
             logger.info(f"Unchecked element: {selector}")
             self._human_like_delay(0.2, 0.5) # Small delay
         except PlaywrightTimeoutError as e:
             logger.error(f"Timeout ({self.default_action_timeout}ms) waiting for element '{selector}' to be actionable for uncheck.")
-            screenshot_path = f"output/uncheck_timeout_{selector.replace(' ','_').replace(':','_').replace('>','_')[:30]}_{int(time.time())}.png"
-            self.save_screenshot(screenshot_path)
-            logger.error(f"Saved screenshot on uncheck timeout to: {screenshot_path}")
+            screenshot_path = self._save_failure_screenshot("uncheck_timeout", _safe_name(selector))
             raise PlaywrightTimeoutError(f"Timeout trying to uncheck element: '{selector}'. Screenshot: {screenshot_path}") from e
         except PlaywrightError as e:
             logger.error(f"PlaywrightError unchecking element '{selector}': {e}")
             raise PlaywrightError(f"Failed to uncheck element '{selector}': {e}") from e
         except Exception as e:
-            logger.error(f"Unexpected error unchecking '{selector}': {e}", exc_info=True)
+            logger.error(f"Unexpected error unchecking '{selector}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise PlaywrightError(f"Unexpected error unchecking element '{selector}': {e}") from e
         
     def take_screenshot(self) -> bytes | None:
@@ -856,7 +1208,7 @@ class BrowserController:
         try:
             # Ensure directory exists
             abs_file_path = os.path.abspath(file_path)
-            os.makedirs(os.path.dirname(abs_file_path), exist_ok=True)
+            self._ensure_dir(os.path.dirname(abs_file_path))
 
             self.page.screenshot(path=abs_file_path)
             logger.info(f"Screenshot saved to: {abs_file_path}")
@@ -865,42 +1217,45 @@ class BrowserController:
             logger.error(f"Error saving screenshot to {file_path}: {e}", exc_info=True)
             return False
 
-    def click(self, selector: str):
-        """Clicks an element, relying on Playwright's built-in actionability checks."""
+    def click(self, selector: str, human_like: bool = False):
+        """
+        Clicks an element, relying on Playwright's built-in actionability checks.
+        With human_like=True, hovers first, holds the button briefly and pauses afterwards like a person would.
+        """
         if not self.page:
             raise PlaywrightError("Browser not started.")
         try:
             logger.info(f"Attempting to click element: {selector}")
-            locator = self.page.locator(selector).first #
-            logger.debug(f"Executing click on locator for '{selector}' (with built-in checks)...")
-            click_delay = random.uniform(50, 150)
+            locator = self._get_locator(selector)
+            logger.debug("Executing click on locator for '%s' (with built-in checks)...", selector)
 
-            # Optional: Try hover first
-            try:
-                locator.hover(timeout=3000) # Short timeout for hover
-                self._human_like_delay(0.1, 0.3)
-            except Exception:
-                logger.debug(f"Hover failed or timed out for {selector}, proceeding with click.")
+            if human_like:
+                # Optional: Try hover first
+                try:
+                    locator.hover(timeout=3000) # Short timeout for hover
+                    self._human_like_delay(0.1, 0.3)
+                except Exception:
+                    logger.debug("Hover failed or timed out for %s, proceeding with click.", selector)
 
             # Perform the click with its own timeout
+            click_delay = random.uniform(50, 150) if human_like else 0
             locator.click(delay=click_delay, timeout=self.default_action_timeout)
             logger.info(f"Clicked element: {selector}")
-            self._human_like_delay(0.5, 1.5) # Post-click delay
+            if human_like:
+                self._human_like_delay(0.5, 1.5) # Post-click delay
 
         except PlaywrightTimeoutError as e:
             # Timeout occurred *during* the click action's internal waits
             logger.error(f"Timeout ({self.default_action_timeout}ms) waiting for element '{selector}' to be actionable for click. Element might be obscured, disabled, unstable, or not found.")
             # Add more context to the error message
-            screenshot_path = f"output/click_timeout_{selector.replace(' ','_').replace(':','_').replace('>','_')[:30]}_{int(time.time())}.png"
-            self.save_screenshot(screenshot_path)
-            logger.error(f"Saved screenshot on click timeout to: {screenshot_path}")
+            screenshot_path = self._save_failure_screenshot("click_timeout", _safe_name(selector))
             raise PlaywrightTimeoutError(f"Timeout trying to click element: '{selector}'. Check visibility, interactability, and selector correctness. Screenshot saved to {screenshot_path}") from e
         except PlaywrightError as e:
              # Other errors during click
              logger.error(f"PlaywrightError clicking element '{selector}': {e}")
              raise PlaywrightError(f"Failed to click element '{selector}': {e}") from e
         except Exception as e:
-             logger.error(f"Unexpected error clicking '{selector}': {e}", exc_info=True)
+             logger.error(f"Unexpected error clicking '{selector}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
              raise PlaywrightError(f"Unexpected error clicking element '{selector}': {e}") from e
 
     def type(self, selector: str, text: str):
@@ -912,15 +1267,14 @@ class BrowserController:
             raise PlaywrightError("Browser not started.")
         try:
             logger.info(f"Attempting to input text '{text[:30]}...' into element: {selector}")
-            locator = self.page.locator(selector).first
+            locator = self._get_locator(selector)
 
             # --- Strategy 1: Use fill() ---
             # fill() clears the field first and inputs text.
             # It performs actionability checks (visible, enabled, editable etc.)
             
-            logger.debug(f"Trying to 'fill' locator for '{selector}' (includes actionability checks)...")
+            logger.debug("Trying to 'fill' locator for '%s' (includes actionability checks)...", selector)
             try:
-                if not self.headless: time.sleep(0.2)
                 locator.fill(text, timeout=self.default_action_timeout) # Use default action timeout
                 logger.info(f"'fill' successful for element: {selector}")
                 self._human_like_delay(0.3, 0.8) # Delay after successful input
@@ -931,7 +1285,7 @@ class BrowserController:
             # Proceed to fallback
 
             # --- Strategy 2: Fallback to type() ---
-            logger.debug(f"Trying fallback 'type' for locator '{selector}'...")
+            logger.debug("Trying fallback 'type' for locator '%s'...", selector)
             try:
                 # Ensure element is clear before typing as a fallback precaution
                 locator.clear(timeout=self.default_action_timeout * 0.5) # Quick clear attempt
@@ -944,9 +1298,7 @@ class BrowserController:
             except (PlaywrightTimeoutError, PlaywrightError) as type_error:
                  logger.error(f"Both 'fill' and fallback 'type' failed for '{selector}'. Last error ('type'): {type_error}")
                  # Raise the error from the 'type' attempt as it was the last one tried
-                 screenshot_path = f"output/type_fail_{selector.replace(' ','_').replace(':','_').replace('>','_')[:30]}_{int(time.time())}.png"
-                 self.save_screenshot(screenshot_path)
-                 logger.error(f"Saved screenshot on type failure to: {screenshot_path}")
+                 screenshot_path = self._save_failure_screenshot("type_fail", _safe_name(selector))
                  # Raise a combined error or the last one
                  raise PlaywrightError(f"Failed to input text into element '{selector}' using both fill and type. Last error: {type_error}. Screenshot: {screenshot_path}") from type_error
 
@@ -954,16 +1306,14 @@ class BrowserController:
         except PlaywrightTimeoutError as e:
              # This might catch timeouts from clear() or the actionability checks within fill/type
              logger.error(f"Timeout ({self.default_action_timeout}ms) during input operation stages for selector: '{selector}'. Element might not become actionable.")
-             screenshot_path = f"output/input_timeout_{selector.replace(' ','_').replace(':','_').replace('>','_')[:30]}_{int(time.time())}.png"
-             self.save_screenshot(screenshot_path)
-             logger.error(f"Saved screenshot on input timeout to: {screenshot_path}")
+             screenshot_path = self._save_failure_screenshot("input_timeout", _safe_name(selector))
              raise PlaywrightTimeoutError(f"Timeout trying to input text into element: '{selector}'. Check interactability. Screenshot: {screenshot_path}") from e
         except PlaywrightError as e:
              # Covers other Playwright issues like element detached during operation
              logger.error(f"PlaywrightError inputting text into element '{selector}': {e}")
              raise PlaywrightError(f"Failed to input text into element '{selector}': {e}") from e
         except Exception as e:
-             logger.error(f"Unexpected error inputting text into '{selector}': {e}", exc_info=True)
+             logger.error(f"Unexpected error inputting text into '{selector}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
              raise PlaywrightError(f"Unexpected error inputting text into element '{selector}': {e}") from e
              
     def scroll(self, direction: str):
@@ -1001,12 +1351,10 @@ class BrowserController:
         except (PlaywrightTimeoutError, PlaywrightError, AssertionError) as e: # Catch expect failures too
             error_msg = f"Timeout or error pressing '{keys}' on element '{selector}': {type(e).__name__} - {e}"
             logger.error(error_msg)
-            screenshot_path = f"output/press_fail_{selector.replace(' ','_').replace(':','_').replace('>','_')[:30]}_{int(time.time())}.png"
-            self.save_screenshot(screenshot_path)
-            logger.error(f"Saved screenshot on press failure to: {screenshot_path}")
+            screenshot_path = self._save_failure_screenshot("press_fail", _safe_name(selector))
             raise PlaywrightError(f"{error_msg}. Screenshot: {screenshot_path}") from e
         except Exception as e:
-            logger.error(f"Unexpected error pressing '{keys}' on '{selector}': {e}", exc_info=True)
+            logger.error(f"Unexpected error pressing '{keys}' on '{selector}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise PlaywrightError(f"Unexpected error pressing '{keys}' on element '{selector}': {e}") from e
 
     def drag_and_drop(self, source_selector: str, target_selector: str):
@@ -1018,23 +1366,17 @@ class BrowserController:
             source_locator = self._get_locator(source_selector)
             target_locator = self._get_locator(target_selector)
 
-            # Optional: Check visibility/existence before drag attempt
-            expect(source_locator).to_be_visible(timeout=self.default_action_timeout / 2)
-            expect(target_locator).to_be_visible(timeout=self.default_action_timeout / 2)
-
-            # Perform drag_to with default timeout
+            # Perform drag_to with default timeout; it waits for both elements to be visible and stable itself
             source_locator.drag_to(target_locator, timeout=self.default_action_timeout)
             logger.info(f"Successfully dragged '{source_selector}' to '{target_selector}'")
             self._human_like_delay(0.5, 1.2) # Delay after drag/drop
         except (PlaywrightTimeoutError, PlaywrightError, AssertionError) as e:
             error_msg = f"Timeout or error dragging '{source_selector}' to '{target_selector}': {type(e).__name__} - {e}"
             logger.error(error_msg)
-            screenshot_path = f"output/drag_fail_{source_selector.replace(' ','_')[:20]}_{target_selector.replace(' ','_')[:20]}_{int(time.time())}.png"
-            self.save_screenshot(screenshot_path)
-            logger.error(f"Saved screenshot on drag failure to: {screenshot_path}")
+            screenshot_path = self._save_failure_screenshot("drag_fail", f"{_safe_name(source_selector, 20)}_{_safe_name(target_selector, 20)}")
             raise PlaywrightError(f"{error_msg}. Screenshot: {screenshot_path}") from e
         except Exception as e:
-            logger.error(f"Unexpected error dragging '{source_selector}' to '{target_selector}': {e}", exc_info=True)
+            logger.error(f"Unexpected error dragging '{source_selector}' to '{target_selector}': {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
             raise PlaywrightError(f"Unexpected error dragging '{source_selector}' to '{target_selector}': {e}") from e
 
     def wait(self,
@@ -1097,22 +1439,11 @@ class BrowserController:
 
 
     def start(self):
-        """Starts Playwright, launches browser, creates context/page, and attaches console listener."""
+        """Acquires a pooled browser (starting Playwright if needed), creates context/page, and attaches console listener."""
         try:
-            logger.info("Starting Playwright...")
-            self.playwright = sync_playwright().start()
-            # Consider adding args for anti-detection if needed:
-            browser_args = ['--disable-blink-features=AutomationControlled']
-            self.browser = self.playwright.chromium.launch(headless=self.headless, args=browser_args)
-            # self.browser = self.playwright.chromium.launch(headless=self.headless)
-
-            context_options = self.browser.new_context(
-                 user_agent=self._get_random_user_agent(),
-                 viewport=self._get_random_viewport(),
-                 ignore_https_errors=True,
-                 java_script_enabled=True,
-                 extra_http_headers=COMMON_HEADERS,
-            )
+            # Playwright and the browser are shared through the pool; only the context is per session
+            self.playwright, self.browser = _browser_pool.acquire(self.headless)
+
             context_options = {
                  "user_agent": self._get_random_user_agent(),
                  "viewport": self._get_random_viewport(),
@@ -1138,10 +1469,16 @@ class BrowserController:
                 logger.info("No authentication state path provided. Proceeding without saved state.")
                 
             self.context = self.browser.new_context(**context_options)
+            self._viewport_cached = context_options["viewport"]
             
             self.context.set_default_navigation_timeout(self.default_navigation_timeout)
             self.context.set_default_timeout(self.default_action_timeout)
-            self.context.add_init_script(HIDE_WEBDRIVER_SCRIPT)
+            # One bundled init script runs before page scripts in every document, no per-navigation evaluate.
+            # The recorder UI (highlighter, panel, click listener setup) is only needed in headed sessions.
+            init_scripts = [HIDE_WEBDRIVER_SCRIPT]
+            if not self.headless:
+                init_scripts += [HIGHLIGHTER_INIT_SCRIPT, RECORDER_PANEL_INIT_SCRIPT, CLICK_LISTENER_INIT_SCRIPT]
+            self.context.add_init_script("\n;".join(init_scripts))
 
             self.page = self.context.new_page()
 
@@ -1155,7 +1492,9 @@ class BrowserController:
             logger.info("Attached network response listener.")
             self.page.on('requestfailed', self._handle_request_failed)
             logger.info("Attached network failed listener.")
-            self.panel.inject_recorder_ui_scripts() # inject recorder ui
+            self.page.on('domcontentloaded', self._handle_dom_content_loaded) # Resets highlight/panel state per document
+            self.panel.page = self.page # Panel is created before the page exists
+            self.panel.inject_recorder_ui_scripts(init_script_registered=True) # Already part of the bundled init script
             
             # -----------------------------
             logger.info("Browser context and page created.")
@@ -1166,7 +1505,7 @@ class BrowserController:
             raise
     
     def close(self):
-        """Closes the browser and stops Playwright."""
+        """Closes the page and context, and returns the browser to the shared pool."""
         self.panel.remove_recorder_panel()
         self.remove_click_listener() 
         try:
@@ -1193,19 +1532,23 @@ class BrowserController:
             if self.context:
                  self.context.close()
                  logger.info("Browser context closed.")
-            if self.browser:
-                self.browser.close()
-                logger.info("Browser closed.")
-            if self.playwright:
-                self.playwright.stop()
-                logger.info("Playwright stopped.")
         except Exception as e:
             logger.error(f"Error during browser/Playwright cleanup: {e}", exc_info=True)
         finally:
+            if self.browser: # Always released, so the pool's count of live sessions stays accurate
+                _browser_pool.release(self.browser, self.headless)
+                logger.info("Browser returned to pool.")
             self.page = None
             self.context = None
             self.browser = None
             self.playwright = None
-            self.console_messages = [] # Clear messages on final close
-            self.network_requests = [] # Clear network data on final close
-            self._recorder_ui_injected = False
+            self._cached_browser_version = None
+            self._viewport_cached = None
+            self._locator_cache.clear()
+            self._cdp_session = None
+            self.console_messages.clear() # Clear messages on final close
+            self.network_requests.clear() # Clear network data on final close
+            self.panel.page = None
+            self.panel._recorder_ui_injected = False # Init script went away with the context
+            self.panel.handle_document_loaded()
+            self._highlights_drawn = False
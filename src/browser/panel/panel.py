@@ -1,6 +1,6 @@
 # /src/browser/panel/panel.py
-import threading
 import logging
+import re
 from typing import Optional, Dict, Any, List
 from patchright.sync_api import sync_playwright, Page, Browser, Playwright, TimeoutError as PlaywrightTimeoutError
 
@@ -12,13 +12,185 @@ RECORDER_PANEL_JS = """
     const INPUT_ID = 'bw-recorder-param-input'; // Used for general param input now
     const PARAM_BTN_ID = 'bw-recorder-param-button'; // Button next to general param input
     const PARAM_CONT_ID = 'bw-recorder-param-container'; // Container for single param input
-    const ASSERT_PARAM_INPUT1_ID = 'bw-assert-param1';
-    const ASSERT_PARAM_INPUT2_ID = 'bw-assert-param2';
+    const ASSERT_PARAM_INPUT_ID_PREFIX = 'bw-assert-param'; // Inputs are numbered from 1, one per param label
     const ASSERT_PARAM_CONT_ID = 'bw-assert-param-container'; // Container for assertion-specific params
 
+    // --- Static markup for every panel state, parsed once when the panel is first created ---
+    // Show functions only toggle which sub-panel is visible and update textContent of existing nodes.
+    // pointer-events is inherited, so each top-level sub-panel re-enables it for everything inside.
+    const PANEL_SKELETON_HTML = `
+        <div id="bw-panel-step" style="display: none; pointer-events: auto;">
+            <div style="margin-bottom: 5px; font-weight: bold;">Next Step:</div>
+            <div class="bw-desc" style="margin-bottom: 8px; max-width: 300px; word-wrap: break-word;"></div>
+            <div style="margin-bottom: 5px; font-style: italic;">AI Suggests: <span class="bw-suggestion"></span></div>
+            <button id="bw-accept-btn" data-choice="accept" style="margin-right: 5px; padding: 3px 6px;">Accept Suggestion</button>
+            <button id="bw-skip-btn" data-choice="skip" style="margin-right: 5px; padding: 3px 6px;">Skip Step</button>
+            <button class="bw-abort-btn" data-choice="abort" style="padding: 3px 6px; background-color: #d9534f; color: white; border: none;">Abort</button>
+        </div>
+        <div id="bw-panel-target" style="display: none; pointer-events: auto;">
+            <div style="margin-bottom: 5px; font-weight: bold;">Define Assertion:</div>
+            <div class="bw-desc" style="margin-bottom: 8px; max-width: 300px; word-wrap: break-word;"></div>
+            <div style="margin-bottom: 5px; font-style: italic;">Suggested Target Selector: <code class="bw-selector"></code><i class="bw-no-selector">AI could not suggest a target.</i></div>
+            <button id="bw-assert-confirm-target" data-choice="confirm_target" style="margin: 2px; padding: 3px 6px;">Use Suggested</button>
+            <button id="bw-assert-override-target" data-choice="override_target" style="margin: 2px; padding: 3px 6px;">Click New Target</button>
+            <button class="bw-assert-skip" data-choice="skip" style="margin: 2px; padding: 3px 6px;">Skip Assertion</button>
+            <button class="bw-abort-btn" data-choice="abort" style="margin: 2px; padding: 3px 6px; background-color: #d9534f; color: white; border: none;">Abort</button>
+        </div>
+        <div id="bw-panel-type" style="display: none; pointer-events: auto;">
+            <div style="margin-bottom: 5px; font-weight: bold;">Select Assertion Type:</div>
+            <div style="margin-bottom: 8px; font-size: 11px;">Target: <code class="bw-selector"></code></div>
+            <div style="display: flex; flex-wrap: wrap; gap: 5px;">
+                <button id="type-contains" data-choice="select_type_text_contains" style="padding: 3px 6px;">Text Contains</button>
+                <button id="type-equals" data-choice="select_type_text_equals" style="padding: 3px 6px;">Text Equals</button>
+                <button id="type-visible" data-choice="select_type_visible" style="padding: 3px 6px;">Is Visible</button>
+                <button id="type-hidden" data-choice="select_type_hidden" style="padding: 3px 6px;">Is Hidden</button>
+                <button id="type-attr" data-choice="select_type_attribute_equals" style="padding: 3px 6px;">Attribute Equals</button>
+                <button id="type-count" data-choice="select_type_element_count" style="padding: 3px 6px;">Element Count</button>
+                <button id="type-checked" data-choice="select_type_checked" style="padding: 3px 6px;">Is Checked</button>
+                <button id="type-not-checked" data-choice="select_type_not_checked" style="padding: 3px 6px;">Not Checked</button>
+            </div>
+            <hr style="margin: 8px 0; border-top: 1px solid #555;">
+            <button id="bw-assert-back-target" data-choice="back_to_target" style="margin-right: 5px; padding: 3px 6px;">&lt; Back (Target)</button>
+            <button class="bw-assert-skip" data-choice="skip" style="margin-right: 5px; padding: 3px 6px;">Skip Assertion</button>
+            <button class="bw-abort-btn" data-choice="abort" style="padding: 3px 6px; background-color: #d9534f; color: white; border: none;">Abort</button>
+        </div>
+        <div id="bw-panel-params" style="display: none; pointer-events: auto;">
+            <div style="margin-bottom: 5px; font-weight: bold;">Enter Parameters:</div>
+            <div style="margin-bottom: 3px; font-size: 11px;">Target: <code class="bw-selector"></code></div>
+            <div style="margin-bottom: 8px; font-size: 11px;">Assertion: <span class="bw-assertion-type"></span></div>
+            <div id="${ASSERT_PARAM_CONT_ID}" style="margin-bottom: 8px;"></div>
+            <button id="bw-assert-record" data-choice="submit_params" style="margin-right: 5px; padding: 3px 6px;">Record Assertion</button>
+            <button id="bw-assert-back-type" data-choice="back_to_type" style="margin-right: 5px; padding: 3px 6px;">&lt; Back (Type)</button>
+            <button class="bw-abort-btn" data-choice="abort" style="padding: 3px 6px; background-color: #d9534f; color: white; border: none;">Abort</button>
+        </div>
+        <div id="bw-panel-verify" style="display: none; pointer-events: auto;">
+            <div style="margin-bottom: 5px; font-weight: bold;">AI Verification Review:</div>
+            <div class="bw-desc" style="margin-bottom: 8px; max-width: 300px; word-wrap: break-word;"></div>
+            <div class="bw-ai-result" style="margin-bottom: 5px; font-style: italic;"></div>
+            <div class="bw-ai-reasoning" style="margin-bottom: 8px; font-size: 11px; max-height: 60px; overflow-y: auto; border: 1px dashed #666; padding: 3px;"></div>
+            <div class="bw-verify-passed">
+                <div style="margin-bottom: 3px;">Assertion: <code class="bw-assertion-type"></code></div>
+                <div style="margin-bottom: 3px;">Selector: <code class="bw-selector"></code></div>
+                <div style="margin-bottom: 5px;">Parameters: <code class="bw-parameters"></code></div>
+                <div class="bw-verify-warning" style="color: #ffcc00; font-size: 11px;">Warning: Cannot record assertion directly (missing type or selector from AI). Choose Manual or Skip.</div>
+            </div>
+            <div class="bw-verify-failed" style="color: #ffdddd;">AI could not verify the condition.</div>
+            <hr style="margin: 8px 0; border-top: 1px solid #555;">
+            <button id="bw-verify-record" data-choice="record_ai" style="margin: 2px; padding: 3px 6px;">Record AI Assertion</button>
+            <button id="bw-verify-manual" data-choice="define_manual" style="margin: 2px; padding: 3px 6px;">Define Manually</button>
+            <button id="bw-verify-skip" data-choice="skip" style="margin: 2px; padding: 3px 6px;">Skip Step</button>
+            <button class="bw-abort-btn" data-choice="abort" style="margin: 2px; padding: 3px 6px; background-color: #d9534f; color: white; border: none;">Abort</button>
+        </div>
+        <!-- Shared parameterization container (step and verification panels), initially hidden -->
+        <div id="${PARAM_CONT_ID}" style="margin-top: 8px; display: none; pointer-events: auto;">
+            <input type="text" id="${INPUT_ID}" placeholder="Parameter Name (optional)" style="padding: 2px 4px; width: 150px; margin-right: 5px;">
+            <button id="${PARAM_BTN_ID}" data-choice="parameterized" style="padding: 3px 6px;">Set Param & Record</button>
+        </div>
+    `;
+
+    // --- Push-based choice delivery ---
+    // A click hands {choice, params, paramName} straight to the pending _recorder_waitForChoice promise.
+    // A choice made while nothing is waiting is kept in window._recorder_user_choice
+    // until the next wait consumes it or the panel changes state.
+    function deliverChoice(choiceValue, params = null, paramName = null) {
+        const result = { choice: choiceValue, params: params, paramName: paramName };
+        window._recorder_user_choice = result;
+        if (window._recorder_resolveChoice) window._recorder_resolveChoice(result);
+    }
+
+    window._recorder_waitForChoice = (timeoutMs) => new Promise((resolve) => {
+        let timer;
+        const finish = (choice) => {
+            clearTimeout(timer);
+            window._recorder_resolveChoice = undefined;
+            window._recorder_user_choice = undefined; // Consumed
+            resolve(choice);
+        };
+        if (window._recorder_user_choice !== undefined) {
+            finish(window._recorder_user_choice);
+            return;
+        }
+        timer = setTimeout(() => finish(null), timeoutMs);
+        window._recorder_resolveChoice = finish;
+    });
+
+    // --- Shows a panel state (by function name) and waits for its answer within the same evaluate ---
+    window._recorder_awaitInteraction = ({ showFunction, showArgs, timeoutMs }) => {
+        if (showFunction) window[showFunction](...showArgs);
+        return window._recorder_waitForChoice(timeoutMs);
+    };
+
+    // --- Builds all sub-panels once; a single delegated listener answers every [data-choice] button ---
+    function buildPanelSkeleton(panel) {
+        panel.innerHTML = PANEL_SKELETON_HTML;
+        // Nodes the show functions touch on every call, looked up once since the skeleton is never rebuilt
+        const byId = (id) => panel.querySelector(`#${id}`);
+        panel._refs = {
+            paramInput: byId(INPUT_ID),
+            paramBtn: byId(PARAM_BTN_ID),
+            paramCont: byId(PARAM_CONT_ID),
+            acceptBtn: byId('bw-accept-btn'),
+            assertParamCont: byId(ASSERT_PARAM_CONT_ID),
+            subPanels: {},
+        };
+        panel.querySelectorAll('[id^="bw-panel-"]').forEach(sub => { panel._refs.subPanels[sub.id] = sub; });
+        panel.addEventListener('click', (event) => {
+            const btn = event.target.closest('button[data-choice]');
+            if (!btn || !panel.contains(btn)) return;
+            const choice = btn.dataset.choice;
+            if (choice === 'submit_params') {
+                // Entered values travel with the submit choice, so no separate read is needed
+                deliverChoice(choice, readAssertionParams(panel, panel._paramCount));
+            } else if (choice === 'parameterized') {
+                const inputVal = panel._refs.paramInput.value.trim();
+                window._recorder_parameter_name = inputVal ? inputVal : null; // Store null if empty
+                deliverChoice(choice, null, window._recorder_parameter_name); // Don't hide panel here, Python side handles it after retrieving value
+            } else {
+                deliverChoice(choice);
+            }
+        });
+        panel._inputs = []; // Param inputs, created on demand by ensureParamInputs and cached for reads
+        panel._paramCount = 0;
+    }
+
+    // --- Cached panel reference (dropped once the node leaves the document) ---
+    function getPanel() {
+        const panel = window._bw_panelRef;
+        return panel && panel.isConnected ? panel : null;
+    }
+
+    // --- Grows the assertion param rows to `count`; existing rows are reused ---
+    function ensureParamInputs(panel, count) {
+        const container = panel._refs.assertParamCont;
+        while (panel._inputs.length < count) {
+            const inputId = `${ASSERT_PARAM_INPUT_ID_PREFIX}${panel._inputs.length + 1}`;
+            const row = document.createElement('div');
+            row.style.marginBottom = '3px';
+            const label = document.createElement('label');
+            label.htmlFor = inputId;
+            label.style.cssText = 'display: inline-block; width: 100px;';
+            const input = document.createElement('input');
+            input.type = 'text';
+            input.id = inputId;
+            input.dataset.key = `param${panel._inputs.length + 1}`;
+            input.style.cssText = 'padding: 2px 4px; width: 120px;';
+            row.append(label, input);
+            container.appendChild(row);
+            panel._inputs.push(input);
+        }
+        return panel._inputs;
+    }
+
+    // --- Reads the first `count` assertion params as {param1: ..., param2: ...} ---
+    function readAssertionParams(panel, count) {
+        const params = {};
+        panel._inputs.slice(0, count).forEach(input => { params[input.dataset.key] = input.value; });
+        return params;
+    }
+
     // --- Function to create or get the panel ---
     function getOrCreatePanel() {
-        let panel = document.getElementById(PANEL_ID);
+        let panel = getPanel();
         if (!panel) {
             panel = document.createElement('div');
             panel.id = PANEL_ID;
@@ -39,250 +211,134 @@ RECORDER_PANEL_JS = """
                 display: 'none', // Initially hidden
                 pointerEvents: 'none'
             });
+            buildPanelSkeleton(panel);
             document.body.appendChild(panel);
+            window._bw_panelRef = panel;
         }
         return panel;
     }
-    
-    // --- Helper to Set Button Listeners ---
-    // (choiceValue is what window._recorder_user_choice will be set to)
-    function setChoiceOnClick(buttonId, choiceValue) {
-        const btn = document.getElementById(buttonId);
-        if (btn) {
-            btn.onclick = () => { window._recorder_user_choice = choiceValue; };
-        } else {
-             console.warn(`[Recorder Panel] Button with ID ${buttonId} not found for listener.`);
+
+    // --- Shows one sub-panel, hiding the previously active one ---
+    function activateSubPanel(panel, subPanelId) {
+        const next = panel._refs.subPanels[subPanelId];
+        if (panel._activeSubPanel && panel._activeSubPanel !== next) {
+            panel._activeSubPanel.style.display = 'none';
         }
+        next.style.display = 'block';
+        panel._activeSubPanel = next;
+        // Parameterization UI is only shown on request, restore the accept button it replaces
+        panel._refs.paramCont.style.display = 'none';
+        panel._refs.acceptBtn.style.display = '';
+        panel.style.display = 'block';
+        return next;
     }
-    
+
     // State 1: Confirm/Override Assertion Target
     window._recorder_showAssertionTargetPanel = (plannedDesc, suggestedSelector) => {
-        const panel = getOrCreatePanel();
-        const selectorDisplay = suggestedSelector ? `<code>${suggestedSelector.substring(0, 100)}...</code>` : '<i>AI could not suggest a target.</i>';
-        panel.innerHTML = `
-            <div style="margin-bottom: 5px; font-weight: bold; pointer-events: auto;">Define Assertion:</div>
-            <div style="margin-bottom: 8px; max-width: 300px; word-wrap: break-word; pointer-events: auto;">${plannedDesc}</div>
-            <div style="margin-bottom: 5px; font-style: italic; pointer-events: auto;">Suggested Target Selector: ${selectorDisplay}</div>
-            <button id="bw-assert-confirm-target" style="margin: 2px; padding: 3px 6px; pointer-events: auto;" ${!suggestedSelector ? 'disabled' : ''}>Use Suggested</button>
-            <button id="bw-assert-override-target" style="margin: 2px; padding: 3px 6px; pointer-events: auto;">Click New Target</button>
-            <button id="bw-assert-skip" style="margin: 2px; padding: 3px 6px; pointer-events: auto;">Skip Assertion</button>
-            <button id="bw-abort-btn" style="margin: 2px; padding: 3px 6px; background-color: #d9534f; color: white; border: none; pointer-events: auto;">Abort</button>
-        `;
+        const sub = activateSubPanel(getOrCreatePanel(), 'bw-panel-target');
+        sub.querySelector('.bw-desc').textContent = plannedDesc;
+        const selectorEl = sub.querySelector('.bw-selector');
+        selectorEl.textContent = suggestedSelector ? `${suggestedSelector}...` : '';
+        selectorEl.style.display = suggestedSelector ? '' : 'none';
+        sub.querySelector('.bw-no-selector').style.display = suggestedSelector ? 'none' : '';
+        sub.querySelector('#bw-assert-confirm-target').disabled = !suggestedSelector;
         window._recorder_user_choice = undefined; // Reset choice
-        setChoiceOnClick('bw-assert-confirm-target', 'confirm_target');
-        setChoiceOnClick('bw-assert-override-target', 'override_target');
-        setChoiceOnClick('bw-assert-skip', 'skip');
-        setChoiceOnClick('bw-abort-btn', 'abort');
-        panel.style.display = 'block';
         console.log('[Recorder Panel] Assertion Target Panel Shown.');
     };
-    
+
     // State 2: Select Assertion Type
     window._recorder_showAssertionTypePanel = (targetSelector) => {
-        const panel = getOrCreatePanel();
-        panel.innerHTML = `
-             <div style="margin-bottom: 5px; font-weight: bold; pointer-events: auto;">Select Assertion Type:</div>
-             <div style="margin-bottom: 8px; font-size: 11px; pointer-events: auto;">Target: <code>${targetSelector.substring(0, 100)}...</code></div>
-             <div style="display: flex; flex-wrap: wrap; gap: 5px; pointer-events: auto;">
-                 <button id="type-contains" style="padding: 3px 6px; pointer-events: auto;">Text Contains</button>
-                 <button id="type-equals" style="padding: 3px 6px; pointer-events: auto;">Text Equals</button>
-                 <button id="type-visible" style="padding: 3px 6px; pointer-events: auto;">Is Visible</button>
-                 <button id="type-hidden" style="padding: 3px 6px; pointer-events: auto;">Is Hidden</button>
-                 <button id="type-attr" style="padding: 3px 6px; pointer-events: auto;">Attribute Equals</button>
-                 <button id="type-count" style="padding: 3px 6px; pointer-events: auto;">Element Count</button>
-                 <button id="type-checked" style="padding: 3px 6px; pointer-events: auto;">Is Checked</button>
-                 <button id="type-not-checked" style="padding: 3px 6px; pointer-events: auto;">Not Checked</button>
-             </div>
-             <hr style="margin: 8px 0; border-top: 1px solid #555;">
-             <button id="bw-assert-back-target" style="margin-right: 5px; padding: 3px 6px; pointer-events: auto;">< Back (Target)</button>
-             <button id="bw-assert-skip" style="margin-right: 5px; padding: 3px 6px; pointer-events: auto;">Skip Assertion</button>
-             <button id="bw-abort-btn" style="padding: 3px 6px; background-color: #d9534f; color: white; border: none; pointer-events: auto;">Abort</button>
-        `;
+        const sub = activateSubPanel(getOrCreatePanel(), 'bw-panel-type');
+        sub.querySelector('.bw-selector').textContent = `${targetSelector}...`;
         window._recorder_user_choice = undefined; // Reset choice
-        // Set listeners for type selection
-        setChoiceOnClick('type-contains', 'select_type_text_contains');
-        setChoiceOnClick('type-equals', 'select_type_text_equals');
-        setChoiceOnClick('type-visible', 'select_type_visible');
-        setChoiceOnClick('type-hidden', 'select_type_hidden');
-        setChoiceOnClick('type-attr', 'select_type_attribute_equals');
-        setChoiceOnClick('type-count', 'select_type_element_count');
-        setChoiceOnClick('type-checked', 'select_type_checked');
-        setChoiceOnClick('type-not-checked', 'select_type_not_checked');
-        // Other controls
-        setChoiceOnClick('bw-assert-back-target', 'back_to_target');
-        setChoiceOnClick('bw-assert-skip', 'skip');
-        setChoiceOnClick('bw-abort-btn', 'abort');
-        panel.style.display = 'block';
         console.log('[Recorder Panel] Assertion Type Panel Shown.');
     };
 
     // State 3: Enter Assertion Parameters
     window._recorder_showAssertionParamsPanel = (targetSelector, assertionType, paramLabels) => {
         // paramLabels is an array like ['Expected Text'] or ['Attribute Name', 'Expected Value'] or ['Expected Count']
-        const panel = getOrCreatePanel();
-        let inputHTML = '';
-        if (paramLabels.length === 1) {
-            inputHTML = `<label for="${ASSERT_PARAM_INPUT1_ID}" style="margin-right: 5px; pointer-events: auto;">${paramLabels[0]}:</label>
-                         <input type="text" id="${ASSERT_PARAM_INPUT1_ID}" style="padding: 2px 4px; width: 180px; pointer-events: auto;">`;
-        } else if (paramLabels.length === 2) {
-             inputHTML = `<div style="margin-bottom: 3px;">
-                              <label for="${ASSERT_PARAM_INPUT1_ID}" style="display: inline-block; width: 100px; pointer-events: auto;">${paramLabels[0]}:</label>
-                              <input type="text" id="${ASSERT_PARAM_INPUT1_ID}" style="padding: 2px 4px; width: 120px; pointer-events: auto;">
-                          </div>
-                          <div>
-                              <label for="${ASSERT_PARAM_INPUT2_ID}" style="display: inline-block; width: 100px; pointer-events: auto;">${paramLabels[1]}:</label>
-                              <input type="text" id="${ASSERT_PARAM_INPUT2_ID}" style="padding: 2px 4px; width: 120px; pointer-events: auto;">
-                          </div>`;
-        }
-
-        panel.innerHTML = `
-             <div style="margin-bottom: 5px; font-weight: bold; pointer-events: auto;">Enter Parameters:</div>
-             <div style="margin-bottom: 3px; font-size: 11px; pointer-events: auto;">Target: <code>${targetSelector.substring(0, 60)}...</code></div>
-             <div style="margin-bottom: 8px; font-size: 11px; pointer-events: auto;">Assertion: ${assertionType}</div>
-             <div id="${ASSERT_PARAM_CONT_ID}" style="margin-bottom: 8px; pointer-events: auto;">
-                ${inputHTML}
-             </div>
-             <button id="bw-assert-record" style="margin-right: 5px; padding: 3px 6px; pointer-events: auto;">Record Assertion</button>
-             <button id="bw-assert-back-type" style="margin-right: 5px; padding: 3px 6px; pointer-events: auto;">< Back (Type)</button>
-             <button id="bw-abort-btn" style="padding: 3px 6px; background-color: #d9534f; color: white; border: none; pointer-events: auto;">Abort</button>
-        `;
+        const sub = activateSubPanel(getOrCreatePanel(), 'bw-panel-params');
+        sub.querySelector('.bw-selector').textContent = `${targetSelector}...`;
+        sub.querySelector('.bw-assertion-type').textContent = assertionType;
+        const panel = sub.parentElement;
+        const inputs = ensureParamInputs(panel, paramLabels.length);
+        inputs.forEach((input, i) => {
+            const hasParam = i < paramLabels.length;
+            const row = input.parentElement;
+            row.style.display = hasParam ? '' : 'none';
+            row.firstChild.textContent = hasParam ? `${paramLabels[i]}:` : '';
+            input.value = '';
+        });
+        panel._paramCount = paramLabels.length;
         window._recorder_user_choice = undefined; // Reset choice
-        setChoiceOnClick('bw-assert-record', 'submit_params');
-        setChoiceOnClick('bw-assert-back-type', 'back_to_type');
-        setChoiceOnClick('bw-abort-btn', 'abort');
-        panel.style.display = 'block';
         // Auto-focus the first input if possible
-        const firstInput = document.getElementById(ASSERT_PARAM_INPUT1_ID);
-        if (firstInput) {
-             setTimeout(() => firstInput.focus(), 50); // Short delay
+        if (paramLabels.length > 0) {
+             setTimeout(() => inputs[0].focus(), 50); // Short delay
         }
         console.log('[Recorder Panel] Assertion Params Panel Shown.');
     };
-    
+
     // State 4: Verification Review
     window._recorder_showVerificationReviewPanel = (args) => {
         const { plannedDesc, aiVerified, aiReasoning, assertionType, parameters, selector } = args;
-        const panel = getOrCreatePanel();
-        let detailsHTML = '';
-        let recordButtonDisabled = true; // Disable record button by default
-
-        // --- Build Details Section based on AI Result ---
+        const sub = activateSubPanel(getOrCreatePanel(), 'bw-panel-verify');
+        // Check if we have enough info to actually record the assertion
+        const canRecord = Boolean(aiVerified && assertionType && selector);
+
+        sub.querySelector('.bw-desc').textContent = plannedDesc;
+        const resultEl = sub.querySelector('.bw-ai-result');
+        resultEl.textContent = `AI Result: ${aiVerified ? 'PASSED' : 'FAILED'}`;
+        resultEl.style.color = aiVerified ? '#ccffcc' : '#ffdddd';
+        sub.querySelector('.bw-ai-reasoning').textContent = `AI Reasoning: ${aiReasoning || 'N/A'}`;
+
+        // --- Details Section based on AI Result ---
+        sub.querySelector('.bw-verify-passed').style.display = aiVerified ? '' : 'none';
+        sub.querySelector('.bw-verify-failed').style.display = aiVerified ? 'none' : '';
         if (aiVerified) {
-            // Check if we have enough info to actually record the assertion
-            const canRecord = assertionType && selector;
-            recordButtonDisabled = !canRecord;
-
-            detailsHTML += `<div style="margin-bottom: 3px; pointer-events: auto;">Assertion: <code>${assertionType || 'N/A'}</code></div>`;
-            detailsHTML += `<div style="margin-bottom: 3px; pointer-events: auto;">Selector: <code>${selector ? selector.substring(0, 100) + '...' : 'MISSING!'}</code></div>`;
+            sub.querySelector('.bw-assertion-type').textContent = assertionType || 'N/A';
+            sub.querySelector('.bw-selector').textContent = selector ? selector + '...' : 'MISSING!';
             // Safely format parameters (convert object to string)
             let paramsString = 'None';
             if (parameters && Object.keys(parameters).length > 0) {
                  try { paramsString = JSON.stringify(parameters); } catch(e){ paramsString = '{...}'; }
             }
-            detailsHTML += `<div style="margin-bottom: 5px; pointer-events: auto;">Parameters: <code>${paramsString}</code></div>`;
-             if (!canRecord) {
-                detailsHTML += `<div style="color: #ffcc00; font-size: 11px; pointer-events: auto;">Warning: Cannot record assertion directly (missing type or selector from AI). Choose Manual or Skip.</div>`;
-            }
-        } else {
-            // Verification failed
-             detailsHTML += `<div style="color: #ffdddd; pointer-events: auto;">AI could not verify the condition.</div>`;
+            sub.querySelector('.bw-parameters').textContent = paramsString;
+            sub.querySelector('.bw-verify-warning').style.display = canRecord ? 'none' : '';
         }
 
+        // Disable record button unless the AI result can be recorded as-is
+        const recordBtn = sub.querySelector('#bw-verify-record');
+        recordBtn.disabled = !canRecord;
+        recordBtn.title = canRecord ? '' : 'Cannot record directly, missing info from AI';
 
-        panel.innerHTML = `
-            <div style="margin-bottom: 5px; font-weight: bold; pointer-events: auto;">AI Verification Review:</div>
-            <div style="margin-bottom: 8px; max-width: 300px; word-wrap: break-word; pointer-events: auto;">${plannedDesc}</div>
-            <div style="margin-bottom: 5px; font-style: italic; color: ${aiVerified ? '#ccffcc' : '#ffdddd'}; pointer-events: auto;">
-                AI Result: ${aiVerified ? 'PASSED' : 'FAILED'}
-            </div>
-            <div style="margin-bottom: 8px; font-size: 11px; max-height: 60px; overflow-y: auto; border: 1px dashed #666; padding: 3px; pointer-events: auto;">
-                AI Reasoning: ${aiReasoning || 'N/A'}
-            </div>
-            ${detailsHTML}
-            <hr style="margin: 8px 0; border-top: 1px solid #555;">
-            <button id="bw-verify-record" style="margin: 2px; padding: 3px 6px; pointer-events: auto;" ${recordButtonDisabled ? 'disabled title="Cannot record directly, missing info from AI"' : ''}>Record AI Assertion</button>
-            <button id="bw-verify-manual" style="margin: 2px; padding: 3px 6px; pointer-events: auto;">Define Manually</button>
-            <button id="bw-verify-skip" style="margin: 2px; padding: 3px 6px; pointer-events: auto;">Skip Step</button>
-            <button id="bw-abort-btn" style="margin: 2px; padding: 3px 6px; background-color: #d9534f; color: white; border: none; pointer-events: auto;">Abort</button>
-             <!-- Re-use existing parameterization container, initially hidden -->
-             <div id="${PARAM_CONT_ID}" style="margin-top: 8px; display: none; pointer-events: auto;">
-                 <input type="text" id="${INPUT_ID}" placeholder="Parameter Name (optional)" style="padding: 2px 4px; width: 150px; margin-right: 5px; pointer-events: auto;">
-                 <button id="${PARAM_BTN_ID}" style="padding: 3px 6px; pointer-events: auto;">Set Param & Record</button>
-             </div>
-        `;
         window._recorder_user_choice = undefined; // Reset choice
         window._recorder_parameter_name = undefined; // Reset param name
-
-        // Set listeners
-        setChoiceOnClick('bw-verify-record', 'record_ai');
-        setChoiceOnClick('bw-verify-manual', 'define_manual');
-        setChoiceOnClick('bw-verify-skip', 'skip');
-        setChoiceOnClick('bw-abort-btn', 'abort');
-        // Listener for the parameterization button (same as before)
-        const paramBtn = document.getElementById(PARAM_BTN_ID);
-        if (paramBtn) {
-            paramBtn.onclick = () => {
-                const inputVal = document.getElementById(INPUT_ID).value.trim();
-                window._recorder_parameter_name = inputVal ? inputVal : null;
-                window._recorder_user_choice = 'parameterized'; // Special choice
-            };
-        }
-
-        panel.style.display = 'block';
         console.log('[Recorder Panel] Verification Review Panel Shown.');
     };
 
-    // Function to retrieve assertion parameters
+    // Function to retrieve assertion parameters (the submit choice already carries them)
     window._recorder_getAssertionParams = (count) => {
-        const params = {};
-        const input1 = document.getElementById(ASSERT_PARAM_INPUT1_ID);
-        if (input1) params.param1 = input1.value;
-        if (count > 1) {
-             const input2 = document.getElementById(ASSERT_PARAM_INPUT2_ID);
-             if (input2) params.param2 = input2.value;
-        }
+        const panel = getPanel();
+        const params = panel ? readAssertionParams(panel, count) : {};
         console.log('[Recorder Panel] Retrieved assertion params:', params);
         return params;
     };
 
     // --- Function to update panel content ---
     window._recorder_showPanel = (stepDescription, suggestionText) => {
-        const panel = getOrCreatePanel();
-        panel.innerHTML = `
-            <div style="margin-bottom: 5px; font-weight: bold; pointer-events: auto;">Next Step:</div> <!-- Re-enable for text selection if needed -->
-            <div style="margin-bottom: 8px; max-width: 300px; word-wrap: break-word; pointer-events: auto;">${stepDescription}</div>
-            <div style="margin-bottom: 5px; font-style: italic; pointer-events: auto;">AI Suggests: ${suggestionText}</div>
-            <button id="bw-accept-btn" style="margin-right: 5px; padding: 3px 6px; pointer-events: auto;">Accept Suggestion</button> <!-- <<< Re-enable pointer events for buttons -->
-            <button id="bw-skip-btn" style="margin-right: 5px; padding: 3px 6px; pointer-events: auto;">Skip Step</button> <!-- <<< Re-enable pointer events for buttons -->
-            <button id="bw-abort-btn" style="padding: 3px 6px; background-color: #d9534f; color: white; border: none; pointer-events: auto;">Abort</button> <!-- <<< Re-enable pointer events for buttons -->
-            <div id="${PARAM_CONT_ID}" style="margin-top: 8px; display: none; pointer-events: auto;"> <!-- <<< Re-enable pointer events for container -->
-                 <input type="text" id="${INPUT_ID}" placeholder="Parameter Name (optional)" style="padding: 2px 4px; width: 150px; margin-right: 5px; pointer-events: auto;"> <!-- <<< Re-enable pointer events for input -->
-                 <button id="${PARAM_BTN_ID}" style="padding: 3px 6px; pointer-events: auto;">Set Param & Record</button> <!-- <<< Re-enable pointer events for buttons -->
-            </div>
-        `;
+        const sub = activateSubPanel(getOrCreatePanel(), 'bw-panel-step');
+        sub.querySelector('.bw-desc').textContent = stepDescription;
+        sub.querySelector('.bw-suggestion').textContent = suggestionText;
 
-        // --- Attach Button Listeners ---
         // Reset choice flag before showing
         window._recorder_user_choice = undefined;
         window._recorder_parameter_name = undefined;
-
-        document.getElementById('bw-accept-btn').onclick = () => { window._recorder_user_choice = 'accept'; };
-        document.getElementById('bw-skip-btn').onclick = () => { window._recorder_user_choice = 'skip'; /* hidePanel(); */ }; // Optionally hide immediately
-        document.getElementById('bw-abort-btn').onclick = () => { window._recorder_user_choice = 'abort'; /* hidePanel(); */ };
-        document.getElementById(PARAM_BTN_ID).onclick = () => {
-            const inputVal = document.getElementById(INPUT_ID).value.trim();
-            window._recorder_parameter_name = inputVal ? inputVal : null; // Store null if empty
-            window._recorder_user_choice = 'parameterized'; // Special choice for parameterization submit
-            // Don't hide panel here, Python side handles it after retrieving value
-        };
-
-        panel.style.display = 'block'; // Make panel visible
         console.log('[Recorder Panel] Panel shown.');
     };
 
     // --- Function to hide the panel ---
     window._recorder_hidePanel = () => {
-        const panel = document.getElementById(PANEL_ID);
+        const panel = getPanel();
         if (panel) {
             panel.style.display = 'none';
             console.log('[Recorder Panel] Panel hidden.');
@@ -294,16 +350,16 @@ RECORDER_PANEL_JS = """
 
     // --- Function to show parameterization UI ---
     window._recorder_showParamUI = (defaultValue) => {
-         const paramContainer = document.getElementById(PARAM_CONT_ID);
-         const inputField = document.getElementById(INPUT_ID);
-         const acceptBtn = document.getElementById('bw-accept-btn');
-         if(paramContainer && inputField && acceptBtn) {
+         const panel = getPanel();
+         if (panel) {
+             const inputField = panel._refs.paramInput;
              inputField.value = ''; // Clear previous value
-             inputField.setAttribute('placeholder', `Param Name for '${defaultValue.substring(0,20)}...' (optional)`);
-             paramContainer.style.display = 'block';
+             window._recorder_user_choice = undefined; // Only the param submit should answer the next wait
+             inputField.setAttribute('placeholder', `Param Name for '${defaultValue}...' (optional)`);
+             panel._refs.paramCont.style.display = 'block';
              // Hide the original "Accept" button, show param button
-             acceptBtn.style.display = 'none';
-             document.getElementById(PARAM_BTN_ID).style.display = 'inline-block'; // Ensure param button is visible
+             panel._refs.acceptBtn.style.display = 'none';
+             panel._refs.paramBtn.style.display = 'inline-block'; // Ensure param button is visible
              console.log('[Recorder Panel] Parameterization UI shown.');
              return true;
          }
@@ -313,37 +369,118 @@ RECORDER_PANEL_JS = """
 
     // --- Function to remove the panel ---
     window._recorder_removePanel = () => {
-        const panel = document.getElementById(PANEL_ID);
+        const panel = getPanel();
         if (panel) {
             panel.remove();
             console.log('[Recorder Panel] Panel removed.');
         }
-        // Clean up global flags
+        delete window._bw_panelRef;
+        // Clean up global flags (the functions stay defined, the init script installs them once per document)
         delete window._recorder_user_choice;
         delete window._recorder_parameter_name;
-        delete window._recorder_showPanel;
-        delete window._recorder_hidePanel;
-        delete window._recorder_showParamUI;
-        delete window._recorder_removePanel;
     };
 
     return true; // Indicate script injection success
 }
 """
 
+def _minify_js(source: str) -> str:
+    """
+    Drops // comments, HTML comments, indentation and blank lines. Line breaks are kept so automatic
+    semicolon insertion still applies; only safe for scripts without '//' inside strings, like RECORDER_PANEL_JS.
+    """
+    source = re.sub(r'<!--.*?-->', '', source, flags=re.S)
+    source = re.sub(r'^[ \t]*//[^\n]*$', '', source, flags=re.M)
+    source = re.sub(r'[ \t]+//[^\n]*$', '', source, flags=re.M)
+    return "\n".join(line.strip() for line in source.splitlines() if line.strip())
+
+# What is actually sent to the browser; RECORDER_PANEL_JS stays the readable source
+_RECORDER_PANEL_JS_MIN = _minify_js(RECORDER_PANEL_JS)
+
+# Runs RECORDER_PANEL_JS in every new document of the context before page scripts,
+# so show/hide calls only need to invoke the already-defined window functions.
+RECORDER_PANEL_INIT_SCRIPT = f"({_RECORDER_PANEL_JS_MIN})();"
+
+# --- Calls into the injected panel functions (built once, reused for every evaluate) ---
+# Display lengths for text shown in the panel; longer strings are cut in Python so only what is shown is sent
+_DESC_DISPLAY_LEN = 300
+_REASONING_DISPLAY_LEN = 1000
+_SELECTOR_DISPLAY_LEN = 100
+_SHORT_SELECTOR_DISPLAY_LEN = 60 # Params panel, which also shows the assertion type
+_PARAM_DEFAULT_DISPLAY_LEN = 20
+
+def _clip(text: Optional[str], max_len: int) -> Optional[str]:
+    """Cuts text to max_len for display; None and empty strings pass through."""
+    return text[:max_len] if text else text
+
+# Returned instead of a result when the document lacks the panel functions (init script did not run in it)
+_PANEL_MISSING = "__bw_panel_missing__"
+# Calls window[fn](...args), or reports the panel API as missing
+_JS_CALL_PANEL = f"({{fn, args}}) => window[fn] ? window[fn](...args) : '{_PANEL_MISSING}'"
+_JS_AWAIT_INTERACTION = f"(args) => window._recorder_awaitInteraction ? window._recorder_awaitInteraction(args) : '{_PANEL_MISSING}'"
+# Reads and clears the parameter name in one round-trip
+_JS_TAKE_PARAMETER_NAME = """
+() => {
+    const name = window._recorder_parameter_name;
+    window._recorder_parameter_name = undefined;
+    return name;
+}
+"""
+
+# Panel methods that do nothing in headless mode, see Panel.__init__
+_HEADLESS_NOOP_METHODS = (
+    "inject_recorder_ui_scripts",
+    "show_verification_review_panel",
+    "show_assertion_target_panel",
+    "show_assertion_type_panel",
+    "show_assertion_params_panel",
+    "get_assertion_parameters_from_panel",
+    "show_recorder_panel",
+    "hide_recorder_panel",
+    "remove_recorder_panel",
+    "wait_for_panel_interaction",
+    "get_parameterization_result",
+)
+
+def _noop(*args, **kwargs) -> None:
+    return None
+
+def _noop_false(*args, **kwargs) -> bool:
+    return False
+
 
 class Panel:
-    """Deals with panel injected into browser in manual mode"""
+    """
+    Deals with panel injected into browser in manual mode.
+    Not thread-safe: a panel belongs to one page and is driven only from the recorder's thread
+    (the Playwright sync API thread), so no lock is taken around panel calls.
+    """
     def __init__(self, headless=True, page=None):
         self._recorder_ui_injected = False # Track if UI script is injected
-        self._panel_interaction_lock = threading.Lock() # Prevent race conditions waiting for panel
+        self._last_choice_params: Optional[Dict[str, str]] = None # Params delivered with the last panel choice
+        self._last_choice_param_name: Optional[str] = None # Parameter name delivered with a 'parameterized' choice
+        self._waiting = False # A panel wait is in flight; the page keeps a single resolver, so waits must not nest
+        # Panel state in the current document, so hide/remove can skip the round-trip when there is nothing to do.
+        # Reset by handle_document_loaded since a new document starts without the panel.
+        self._panel_in_document = False
+        self._panel_visible = False
+        self._param_ui_visible_for: Optional[str] = None # default_value the parameterization UI currently shows, if any
         self.headless = headless
         self.page = page
+        if headless:
+            # No panel without a window: bind the public API to no-ops once instead of checking on every call
+            for name in _HEADLESS_NOOP_METHODS:
+                setattr(self, name, _noop)
+            self.prompt_parameterization_in_panel = _noop_false
         
         # inject ui panel onto the browser
-    def inject_recorder_ui_scripts(self):
-        """Injects the JS functions for the recorder UI panel."""
-        if self.headless: return # No UI in headless
+    def inject_recorder_ui_scripts(self, init_script_registered: bool = False):
+        """
+        Injects the JS functions for the recorder UI panel once: registered as a context init script
+        for every future document, and evaluated in the page's current document.
+        Pass init_script_registered=True when the caller already bundled RECORDER_PANEL_INIT_SCRIPT into the
+        context's init script before creating the page; nothing needs to be sent then.
+        """
         if not self.page:
             logger.error("Page not initialized. Cannot inject recorder UI.")
             return False
@@ -351,211 +488,195 @@ class Panel:
             logger.debug("Recorder UI scripts already injected.")
             return True
         try:
-            self.page.evaluate(RECORDER_PANEL_JS)
+            if not init_script_registered:
+                self.page.context.add_init_script(RECORDER_PANEL_INIT_SCRIPT)
+                self.page.evaluate(_RECORDER_PANEL_JS_MIN) # Current document predates the init script
             self._recorder_ui_injected = True
             logger.info("Recorder UI panel JavaScript injected successfully.")
             return True
         except Exception as e:
             logger.error(f"Failed to inject recorder UI panel JS: {e}", exc_info=True)
             return False
-        
-    def show_verification_review_panel(self, planned_desc: str, verification_result: Dict[str, Any]):
-        """Shows the panel for reviewing AI verification results."""
-        if self.headless or not self.page: return
-        try:
-            # Extract data needed by the JS function
-            args = {
-                "plannedDesc": planned_desc,
-                "aiVerified": verification_result.get('verified', False),
-                "aiReasoning": verification_result.get('reasoning', 'N/A'),
-                "assertionType": verification_result.get('assertion_type'),
-                "parameters": verification_result.get('parameters', {}),
-                "selector": verification_result.get('verification_selector') # Use the final selector
-            }
 
-            js_script = f"""
-            (args) => {{
-                ({RECORDER_PANEL_JS})(); // Ensure functions are defined
-                if (window._recorder_showVerificationReviewPanel) {{
-                    window._recorder_showVerificationReviewPanel(args);
-                }} else {{ console.error('Verification review panel function not defined!'); }}
-            }}"""
-            self.page.evaluate(js_script, args)
-        except Exception as e:
-            logger.error(f"Failed to show verification review panel: {e}", exc_info=True)
-    
-    def show_assertion_target_panel(self, planned_desc: str, suggested_selector: Optional[str]):
-        """Shows the panel for confirming/overriding the assertion target."""
-        if self.headless or not self.page: return
+    def _ensure_injected(self) -> bool:
+        """
+        Defines the panel functions in the current document. Only needed when the init script did not
+        run in it (e.g. the page's initial document), which callers detect from a _PANEL_MISSING result.
+        """
         try:
-            js_script = f"""
-            (args) => {{
-                ({RECORDER_PANEL_JS})(); // Ensure functions are defined
-                if (window._recorder_showAssertionTargetPanel) {{
-                    window._recorder_showAssertionTargetPanel(args.plannedDesc, args.suggestedSelector);
-                }} else {{ console.error('Assertion target panel function not defined!'); }}
-            }}"""
-            self.page.evaluate(js_script, {"plannedDesc": planned_desc, "suggestedSelector": suggested_selector})
+            self.page.evaluate(_RECORDER_PANEL_JS_MIN)
+            logger.debug("Recorder UI panel JavaScript evaluated in a document the init script missed.")
+            return True
         except Exception as e:
-            logger.error(f"Failed to show assertion target panel: {e}", exc_info=True)
+            logger.warning(f"Could not define recorder UI panel functions in the current document: {e}")
+            return False
 
-    def show_assertion_type_panel(self, target_selector: str):
-        """Shows the panel for selecting the assertion type."""
-        if self.headless or not self.page: return
-        try:
-            js_script = f"""
-            (args) => {{
-                ({RECORDER_PANEL_JS})(); // Ensure functions are defined
-                if (window._recorder_showAssertionTypePanel) {{
-                    window._recorder_showAssertionTypePanel(args.targetSelector);
-                }} else {{ console.error('Assertion type panel function not defined!'); }}
-            }}"""
-            self.page.evaluate(js_script, {"targetSelector": target_selector})
-        except Exception as e:
-            logger.error(f"Failed to show assertion type panel: {e}", exc_info=True)
+    def handle_document_loaded(self):
+        """Forgets the panel state of the previous document. Called by the browser controller on domcontentloaded."""
+        self._panel_in_document = False
+        self._panel_visible = False
+        self._param_ui_visible_for = None
 
-    def show_assertion_params_panel(self, target_selector: str, assertion_type: str, param_labels: List[str]):
-        """Shows the panel for entering assertion parameters."""
-        if self.headless or not self.page: return
+    def _mark_panel_shown(self):
+        self._panel_in_document = True
+        self._panel_visible = True
+        self._param_ui_visible_for = None # Showing a panel state hides the parameterization UI
+        
+    def _call_panel(self, fn_name: str, args: List[Any], failure_level: int = logging.ERROR) -> Any:
+        """
+        Calls an injected window._recorder_* panel function with positional args in one evaluate.
+        Returns its result, or None without a page or if the call fails (headless panels never get here, see __init__).
+        """
+        if not self.page: return None
         try:
-            js_script = f"""
-            (args) => {{
-                ({RECORDER_PANEL_JS})(); // Ensure functions are defined
-                if (window._recorder_showAssertionParamsPanel) {{
-                    window._recorder_showAssertionParamsPanel(args.targetSelector, args.assertionType, args.paramLabels);
-                }} else {{ console.error('Assertion params panel function not defined!'); }}
-            }}"""
-            self.page.evaluate(js_script, {
-                "targetSelector": target_selector,
-                "assertionType": assertion_type,
-                "paramLabels": param_labels
-            })
+            result = self.page.evaluate(_JS_CALL_PANEL, {"fn": fn_name, "args": args})
+            if result == _PANEL_MISSING:
+                if not self._ensure_injected(): return None
+                result = self.page.evaluate(_JS_CALL_PANEL, {"fn": fn_name, "args": args})
+            return None if result == _PANEL_MISSING else result
         except Exception as e:
-            logger.error(f"Failed to show assertion params panel: {e}", exc_info=True)
+            logger.log(failure_level, f"Panel call {fn_name} failed (might be removed or page navigated): {e}")
+            return None
+
+    def _show_panel(self, fn_name: str, args: List[Any], wait_timeout_seconds: Optional[float]) -> Optional[str]:
+        """Shows a panel state; with wait_timeout_seconds also waits for and returns the user's choice in the same round-trip."""
+        if not self.page: return None
+        if wait_timeout_seconds is not None:
+            return self._await_interaction(fn_name, args, wait_timeout_seconds)
+        self._call_panel(fn_name, args)
+        self._mark_panel_shown()
+        return None
+
+    def show_verification_review_panel(self, planned_desc: str, verification_result: Dict[str, Any], wait_timeout_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        Shows the panel for reviewing AI verification results.
+        With wait_timeout_seconds, also waits for the user's choice in the same round-trip and returns it.
+        """
+        # Extract data needed by the JS function
+        args = {
+            "plannedDesc": _clip(planned_desc, _DESC_DISPLAY_LEN),
+            "aiVerified": verification_result.get('verified', False),
+            "aiReasoning": _clip(verification_result.get('reasoning', 'N/A'), _REASONING_DISPLAY_LEN),
+            "assertionType": verification_result.get('assertion_type'),
+            "parameters": verification_result.get('parameters', {}),
+            "selector": _clip(verification_result.get('verification_selector'), _SELECTOR_DISPLAY_LEN) # Use the final selector
+        }
+        return self._show_panel("_recorder_showVerificationReviewPanel", [args], wait_timeout_seconds)
+
+    def show_assertion_target_panel(self, planned_desc: str, suggested_selector: Optional[str]):
+        """Shows the panel for confirming/overriding the assertion target."""
+        self._show_panel("_recorder_showAssertionTargetPanel", [_clip(planned_desc, _DESC_DISPLAY_LEN), _clip(suggested_selector, _SELECTOR_DISPLAY_LEN)], None)
+
+    def show_assertion_type_panel(self, target_selector: str, wait_timeout_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        Shows the panel for selecting the assertion type.
+        With wait_timeout_seconds, also waits for the user's choice in the same round-trip and returns it.
+        """
+        return self._show_panel("_recorder_showAssertionTypePanel", [_clip(target_selector, _SELECTOR_DISPLAY_LEN)], wait_timeout_seconds)
+
+    def show_assertion_params_panel(self, target_selector: str, assertion_type: str, param_labels: List[str], wait_timeout_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        Shows the panel for entering assertion parameters.
+        With wait_timeout_seconds, also waits for the user's choice in the same round-trip and returns it;
+        submitted values are then available from get_assertion_parameters_from_panel without another call.
+        """
+        return self._show_panel("_recorder_showAssertionParamsPanel", [_clip(target_selector, _SHORT_SELECTOR_DISPLAY_LEN), assertion_type, param_labels], wait_timeout_seconds)
 
     def get_assertion_parameters_from_panel(self, count: int) -> Optional[Dict[str, str]]:
         """Retrieves the parameter values entered in the assertion panel."""
-        if self.headless or not self.page: return None
-        try:
-            params = self.page.evaluate("window._recorder_getAssertionParams ? window._recorder_getAssertionParams(count) : null", {"count": count})
-            return params
-        except Exception as e:
-            logger.error(f"Failed to get assertion parameters from panel: {e}")
-            return None
+        if not self.page or not self._recorder_ui_injected: return None
+        if self._last_choice_params is not None:
+            # Delivered together with the 'submit_params' choice, no extra round-trip needed
+            return self._last_choice_params
+        return self._call_panel("_recorder_getAssertionParams", [count])
 
     def show_recorder_panel(self, step_description: str, suggestion_text: str):
         """Shows the recorder UI panel with step info."""
-        if self.headless or not self.page:
-            logger.warning("Cannot show recorder panel (headless or no page).")
+        if not self.page:
+            logger.warning("Cannot show recorder panel (no page).")
             return
-        try:
-            # Evaluate a script that FIRST defines the functions, THEN calls showPanel
-            js_script = f"""
-            (args) => {{
-                // Ensure panel functions are defined (runs the definitions)
-                ({RECORDER_PANEL_JS})();
-
-                // Now call the show function
-                if (window._recorder_showPanel) {{
-                    window._recorder_showPanel(args.stepDescription, args.suggestionText);
-                }} else {{
-                     console.error('[Recorder Panel] _recorder_showPanel function is still not defined after injection attempt!');
-                }}
-            }}
-            """
-            self.page.evaluate(js_script, {"stepDescription": step_description, "suggestionText": suggestion_text})
-        except Exception as e:
-            logger.error(f"Failed to show recorder panel: {e}", exc_info=True) # Log full trace for debugging
+        # Panel functions are already defined in the document by the init script
+        self._show_panel("_recorder_showPanel", [_clip(step_description, _DESC_DISPLAY_LEN), suggestion_text], None)
 
     def hide_recorder_panel(self):
         """Hides the recorder UI panel if it exists."""
-        if self.headless or not self.page: return
-        try:
-            # Check if function exists before calling
-            self.page.evaluate("if (window._recorder_hidePanel) window._recorder_hidePanel()")
-        except Exception as e:
-            logger.warning(f"Failed to hide recorder panel (might be removed or page navigated): {e}")
+        if not self._panel_visible: return
+        self._call_panel("_recorder_hidePanel", [], failure_level=logging.WARNING)
+        self._panel_visible = False
+        self._param_ui_visible_for = None
 
     def remove_recorder_panel(self):
         """Removes the recorder UI panel from the DOM if it exists."""
-        if self.headless or not self.page: return
-        try:
-            # Check if function exists before calling
-            self.page.evaluate("if (window._recorder_removePanel) window._recorder_removePanel()")
-        except Exception as e:
-            logger.warning(f"Failed to remove recorder panel (might be removed or page navigated): {e}")
+        if not self._panel_in_document: return
+        self._call_panel("_recorder_removePanel", [], failure_level=logging.WARNING)
+        self.handle_document_loaded() # Nothing left to hide or remove
 
     def prompt_parameterization_in_panel(self, default_value: str) -> bool:
-        """Shows the parameterization input field, ensuring functions are defined."""
-        if self.headless or not self.page: return False
-        try:
-            # Combine definition and call again
-            js_script = f"""
-            (args) => {{
-                 // Ensure panel functions are defined
-                ({RECORDER_PANEL_JS})();
-
-                // Now call the show param UI function
-                if (window._recorder_showParamUI) {{
-                    return window._recorder_showParamUI(args.defaultValue);
-                }} else {{
-                     console.error('[Recorder Panel] _recorder_showParamUI function is still not defined!');
-                     return false;
-                }}
-            }}
-            """
-            success = self.page.evaluate(js_script, {"defaultValue": default_value})
-            return success if success is True else False # Ensure boolean return
-        except Exception as e:
-            logger.error(f"Failed to show parameterization UI in panel: {e}")
-            return False
+        """Shows the parameterization input field in the current panel."""
+        if self._param_ui_visible_for is not None and self._param_ui_visible_for == default_value:
+            return True # Already showing, unanswered, for this value
+        shown = self._call_panel("_recorder_showParamUI", [_clip(default_value, _PARAM_DEFAULT_DISPLAY_LEN)]) is True # Ensure boolean return
+        self._param_ui_visible_for = default_value if shown else None
+        return shown
 
     def wait_for_panel_interaction(self, timeout_seconds: float) -> Optional[str]:
         """
         Waits for the user to click a button on the recorder panel.
         Returns the choice ('accept', 'skip', 'abort', 'parameterized') or None on timeout.
         """
-        if self.headless or not self.page or not self._recorder_ui_injected: return None
-
-        with self._panel_interaction_lock: # Prevent concurrent waits if called rapidly
-            js_condition = "() => window._recorder_user_choice !== undefined"
-            timeout_ms = timeout_seconds * 1000
-            user_choice = None
-
-            logger.info(f"Waiting up to {timeout_seconds}s for user interaction via UI panel...")
+        if not self.page or not self._recorder_ui_injected: return None
+        return self._await_interaction(None, [], timeout_seconds)
 
-            try:
-                # Ensure the flag is initially undefined before waiting
-                self.page.evaluate("window._recorder_user_choice = undefined")
+    def _await_interaction(self, show_function: Optional[str], show_args: List[Any], timeout_seconds: float) -> Optional[str]:
+        """
+        Optionally shows a panel state, then waits for the user's choice, all in one page.evaluate.
+        Params and parameter name delivered with the choice are kept for the getters below.
+        """
+        if not self.page or not self._recorder_ui_injected: return None
+        if self._waiting:
+            raise RuntimeError("Panel wait started while another one is in flight; Panel must only be driven from one thread.")
 
-                self.page.wait_for_function(js_condition, timeout=timeout_ms)
+        timeout_ms = timeout_seconds * 1000
+        user_choice = None
+        self._last_choice_params = None
+        self._last_choice_param_name = None
 
-                # If wait succeeds, get the choice
-                user_choice = self.page.evaluate("window._recorder_user_choice")
-                logger.info(f"User interaction detected via panel: '{user_choice}'")
+        logger.info(f"Waiting up to {timeout_seconds}s for user interaction via UI panel...")
 
-            except PlaywrightTimeoutError:
+        if show_function: self._mark_panel_shown()
+        self._waiting = True
+        try:
+            # Resolved from the page with {choice, params, paramName} by the clicked button's handler, or with null once timeout_ms elapses
+            wait_args = {"showFunction": show_function, "showArgs": show_args, "timeoutMs": timeout_ms}
+            result = self.page.evaluate(_JS_AWAIT_INTERACTION, wait_args)
+            if result == _PANEL_MISSING and self._ensure_injected():
+                result = self.page.evaluate(_JS_AWAIT_INTERACTION, wait_args)
+            if result == _PANEL_MISSING:
+                result = None
+            if result is None:
                 logger.warning("Timeout reached waiting for panel interaction.")
-                user_choice = None # Timeout occurred
-            except Exception as e:
-                logger.error(f"Error during page.wait_for_function for panel interaction: {e}", exc_info=True)
-                user_choice = None # Treat other errors as timeout/failure
-            finally:
-                # Reset the flag *immediately after reading or timeout* for the next wait
-                 try:
-                     self.page.evaluate("window._recorder_user_choice = undefined")
-                 except Exception:
-                      logger.warning("Could not reset panel choice flag after interaction/timeout.")
+            else:
+                user_choice = result.get("choice")
+                self._param_ui_visible_for = None # Answered; a new prompt must reset the input and pending choice
+                self._last_choice_params = result.get("params")
+                self._last_choice_param_name = result.get("paramName")
+                logger.info(f"User interaction detected via panel: '{user_choice}'")
+        except Exception as e:
+            logger.error(f"Error while waiting for panel interaction: {e}", exc_info=True)
+            user_choice = None # Treat errors (e.g. navigation during wait) as timeout/failure
+        finally:
+            self._waiting = False
 
         return user_choice
 
     def get_parameterization_result(self) -> Optional[str]:
          """Retrieves the parameter name entered in the panel. Call after wait_for_panel_interaction returns 'parameterized'."""
-         if self.headless or not self.page or not self._recorder_ui_injected: return None
+         if not self.page or not self._recorder_ui_injected: return None
+         if self._last_choice_param_name is not None:
+             # Delivered together with the 'parameterized' choice
+             return self._last_choice_param_name
          try:
-             param_name = self.page.evaluate("window._recorder_parameter_name")
-             # Reset the flag after reading
-             self.page.evaluate("window._recorder_parameter_name = undefined")
+             param_name = self.page.evaluate(_JS_TAKE_PARAMETER_NAME) # Also resets the flag
              logger.debug(f"Retrieved parameter name from panel: {param_name}")
              return param_name # Can be string or null
          except Exception as e:
@@ -12,6 +12,8 @@ class TaskManager:
         self.subtasks: List[Dict[str, Any]] = [] # Stores the individual test steps
         self.current_subtask_index: int = 0 # Index of the step being processed or next to process
         self.max_retries_per_subtask: int = max_retries_per_subtask
+        # Every step before this index is finished ('done', 'skipped' or failed permanently), so scans start here
+        self._next_actionable_idx: int = 0
         logger.info(f"TaskManager (Test Mode) initialized (max_retries_per_step={max_retries_per_subtask}).")
 
     def set_main_task(self, feature_description: str):
@@ -19,6 +21,7 @@ class TaskManager:
         self.main_task = feature_description
         self.subtasks = []
         self.current_subtask_index = 0
+        self._next_actionable_idx = 0
         logger.info(f"Feature under test set: {feature_description}")
 
 
@@ -44,6 +47,7 @@ class TaskManager:
                 "last_failed_selector": None # Store selector if failure was element-related
             })
         self.current_subtask_index = 0 if self.subtasks else -1 # Reset index
+        self._next_actionable_idx = 0
         logger.info(f"Added {len(test_step_list)} test steps.")
 
     def insert_subtasks(self, index: int, new_step_descriptions: List[str]):
@@ -70,6 +74,7 @@ class TaskManager:
 
         # Insert the new tasks into the list
         self.subtasks[index:index] = new_tasks
+        self._next_actionable_idx = min(self._next_actionable_idx, index) # New pending steps may precede it
         logger.info(f"Inserted {len(new_tasks)} new subtasks at index {index}.")
 
         # Crucial: If the insertion happens at or before the current index,
@@ -84,9 +89,10 @@ class TaskManager:
     def get_next_subtask(self) -> Optional[Dict[str, Any]]:
         """
         Gets the first test step that is 'pending' or 'failed' with retries remaining.
-        Iterates sequentially.
+        Iterates sequentially, starting after the steps already known to be finished.
         """
-        for index, task in enumerate(self.subtasks):
+        for index in range(self._next_actionable_idx, len(self.subtasks)):
+            task = self.subtasks[index]
             # In recorder mode, 'failed' means AI suggestion failed, allow retry
             # In executor mode (if used here), 'failed' means execution failed
             is_pending = task["status"] == "pending"
@@ -137,6 +143,9 @@ class TaskManager:
             task["status"] = status
             task["result"] = result
             task["error"] = error
+            if index < self._next_actionable_idx and not self._is_finished(task):
+                self._next_actionable_idx = index # Step reopened
+            self._advance_next_actionable()
 
             log_message = f"Test Step {index + 1} ('{task['description'][:50]}...') processed. Status: {status}."
             if result and status == 'done': log_message += f" Result: {str(result)[:100]}..."
@@ -162,11 +171,19 @@ class TaskManager:
 
 
 
+    def _is_finished(self, task: Dict[str, Any]) -> bool:
+        """A step is finished unless it is pending, in progress, or failed with retries remaining."""
+        status = task['status']
+        if status == 'pending' or status == 'in_progress':
+            return False
+        return not (status == 'failed' and task['attempts'] <= self.max_retries_per_subtask)
+
+    def _advance_next_actionable(self):
+        """Moves _next_actionable_idx past finished steps."""
+        while self._next_actionable_idx < len(self.subtasks) and self._is_finished(self.subtasks[self._next_actionable_idx]):
+            self._next_actionable_idx += 1
+
     def is_complete(self) -> bool:
         """Checks if all test steps have been processed (are 'done' or 'failed' permanently)."""
-        for task in self.subtasks:
-            if task['status'] == 'pending' or \
-               task['status'] == 'in_progress' or \
-               (task['status'] == 'failed' and task['attempts'] <= self.max_retries_per_subtask):
-                return False # Found an actionable step
-        return True # All steps processed
+        self._advance_next_actionable()
+        return self._next_actionable_idx >= len(self.subtasks) # All steps processed
@@ -1,22 +1,19 @@
 # /src/dom/views.py 
-from dataclasses import dataclass, field, KW_ONLY # Use field for default_factory
-from functools import cached_property
+from dataclasses import dataclass, field, KW_ONLY, InitVar # Use field for default_factory
 from typing import TYPE_CHECKING, Dict, List, Optional, Union, Literal, Tuple
+import logging
 import re # Added for selector generation
 
 # Use relative imports if within the same package structure
 from .history.view import CoordinateSet, HashedDomElement, ViewportInfo # Adjusted import
 
+logger = logging.getLogger(__name__)
+
 # Placeholder decorator if not using utils.time_execution_sync
+# Returns the function itself, so decorated methods pay no wrapper call
 def time_execution_sync(label):
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            # Basic logging
-            # logger.debug(f"Executing {label}...")
-            result = func(*args, **kwargs)
-            # logger.debug(f"Finished {label}.")
-            return result
-        return wrapper
+        return func
     return decorator
 
 # Avoid circular import issues
@@ -26,13 +23,15 @@ if TYPE_CHECKING:
     # Let's adjust the structure slightly or use string hints.
     pass # Forward reference handled by structure/string hints below
 
-@dataclass(frozen=False)
+# Nodes are created by the thousand per page, so all three classes use __slots__ instead of a per-instance __dict__
+# Tree walks test node kinds with `type(x) is ...` rather than isinstance, so these classes are not meant to be subclassed
+@dataclass(frozen=False, slots=True)
 class DOMBaseNode:
     # Parent needs to be Optional and potentially use string hint if defined later
     parent: Optional['DOMElementNode'] = None # Default to None
     is_visible: bool = False # Provide default
 
-@dataclass(frozen=False)
+@dataclass(frozen=False, slots=True)
 class DOMTextNode(DOMBaseNode):
      # --- Field ordering within subclass matters less with KW_ONLY ---
     # --- but arguments after the marker MUST be passed by keyword ---
@@ -61,8 +60,15 @@ class DOMTextNode(DOMBaseNode):
             return False
         return self.parent.is_top_element
 
+# Collapses runs of whitespace in element text shown to the LLM
+_WHITESPACE_RE = re.compile(r'\s+')
+# Static tags always worth listing in a verification context
+COMMON_STATIC_TAGS = frozenset(('p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'span', 'div', 'li', 'label', 'td', 'th', 'strong', 'em', 'dt', 'dd'))
+# Attributes shown in the LLM context string when the caller does not pass include_attributes
+DEFAULT_CONTEXT_ATTRIBUTES = ('id', 'name', 'class', 'aria-label', 'placeholder', 'role', 'type', 'value', 'title', 'alt', 'href', 'data-testid', 'data-value')
+
 # Define DOMElementNode *before* DOMBaseNode references it fully, or ensure Optional['DOMElementNode'] works
-@dataclass(frozen=False)
+@dataclass(frozen=False, slots=True)
 class DOMElementNode(DOMBaseNode):
     """
     Represents an element node in the processed DOM tree.
@@ -81,7 +87,20 @@ class DOMElementNode(DOMBaseNode):
     page_coordinates: Optional[CoordinateSet] = None
     viewport_coordinates: Optional[CoordinateSet] = None
     viewport_info: Optional[ViewportInfo] = None
-    css_selector: Optional[str] = None # Added field for robust selector
+    # Backing slot for the css_selector property installed below the class
+    _css_selector: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    # Init-only, so no slot is generated for it; a non-None value seeds the property in __post_init__
+    css_selector: InitVar[Optional[str]] = None # Added field for robust selector
+    # Result of get_all_text_till_next_clickable_element() over the full subtree, computed on first call
+    _cached_text: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _hash: Optional[HashedDomElement] = field(default=None, init=False, repr=False, compare=False) # See hash
+    _visit_token: Optional[object] = field(default=None, init=False, repr=False, compare=False) # Last context walk that emitted this node
+    # generate_llm_context_string results for this subtree, keyed by (purpose, static limit, attributes)
+    _context_cache: Optional[Dict[Tuple[str, int, Tuple[str, ...]], Tuple[str, Dict[str, 'DOMElementNode']]]] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self, css_selector: Optional[str]) -> None:
+        if css_selector is not None:
+            self._css_selector = css_selector
 
     def __repr__(self) -> str:
         # ... (repr logic remains the same) ...
@@ -98,49 +117,50 @@ class DOMElementNode(DOMBaseNode):
         if self.is_in_viewport: extras.append('in-viewport')
         if self.shadow_root: extras.append('shadow-root')
         if self.highlight_index is not None: extras.append(f'highlight:{self.highlight_index}')
-        if self.css_selector: extras.append(f'css:"{self.css_selector[:50]}..."') # Show generated selector
+        if self._css_selector: extras.append(f'css:"{self._css_selector[:50]}..."') # Show selector only if already generated
 
         if extras:
             tag_str += f' [{", ".join(extras)}]'
         return tag_str
 
-    @cached_property
+    @property
     def hash(self) -> HashedDomElement:
         """ Lazily computes and caches the hash of the element using HistoryTreeProcessor. """
-        # Use relative import within the method to avoid top-level circular dependencies
-        from .history.service import HistoryTreeProcessor
-        # Ensure HistoryTreeProcessor._hash_dom_element exists and is static or accessible
-        return HistoryTreeProcessor._hash_dom_element(self)
+        if self._hash is None:
+            # Use relative import within the method to avoid top-level circular dependencies
+            from .history.service import HistoryTreeProcessor
+            # Ensure HistoryTreeProcessor._hash_dom_element exists and is static or accessible
+            self._hash = HistoryTreeProcessor._hash_dom_element(self)
+        return self._hash
 
     def get_all_text_till_next_clickable_element(self, max_depth: int = -1) -> str:
         """
-        Recursively collects all text content within this element, stopping descent
+        Collects all text content within this element, stopping descent
         if a nested interactive element (with a highlight_index) is encountered.
+        Walks the subtree with an explicit stack, so deep pages cost no Python recursion.
+        The unlimited-depth result is cached on the node, since the tree does not change once built.
         """
+        if max_depth == -1 and self._cached_text is not None:
+            return self._cached_text
         text_parts = []
-
-        def collect_text(node: Union['DOMElementNode', DOMTextNode], current_depth: int) -> None:
-            if max_depth != -1 and current_depth > max_depth:
-                return
-
-            # Check if the node itself is interactive and not the starting node
-            if isinstance(node, DOMElementNode) and node is not self and node.highlight_index is not None:
-                # Stop recursion down this path if we hit an interactive element
-                return
-
-            if isinstance(node, DOMTextNode):
+        stack: List[Tuple[Union['DOMElementNode', DOMTextNode], int]] = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if max_depth != -1 and depth > max_depth:
+                continue
+            if type(node) is DOMTextNode:
                 # Only include visible text nodes
                 if node.is_visible:
                     text_parts.append(node.text)
-            elif isinstance(node, DOMElementNode):
-                # Recursively process children
-                for child in node.children:
-                    collect_text(child, current_depth + 1)
+            elif node is self or node.highlight_index is None:
+                # Stop descending at nested interactive elements; children are pushed reversed to keep document order
+                stack.extend((child, depth + 1) for child in reversed(node.children))
 
-        # Start collection from the element itself
-        collect_text(self, 0)
         # Join collected parts and clean up whitespace
-        return '\n'.join(filter(None, (tp.strip() for tp in text_parts))).strip()
+        text = '\n'.join(filter(None, (tp.strip() for tp in text_parts))).strip()
+        if max_depth == -1:
+            self._cached_text = text
+        return text
 
 
     @time_execution_sync('--clickable_elements_to_string')
@@ -154,6 +174,7 @@ class DOMElementNode(DOMBaseNode):
         Generates a string representation of VISIBLE elements tree for LLM context.
         Clearly distinguishes interactive elements (with index) from static ones.
         Assigns temporary IDs to static elements for later lookup.
+        The tree does not change once built, so results are cached on this node per set of arguments.
 
         Args:
             include_attributes: List of specific attributes to include. If None, uses defaults.
@@ -168,31 +189,43 @@ class DOMElementNode(DOMBaseNode):
                   to the corresponding DOMElementNode objects.
 
         """
+        max_static_elements = max_static_elements_verification if context_purpose == 'verification' else max_static_elements_action
+        attrs_to_check = include_attributes if include_attributes else DEFAULT_CONTEXT_ATTRIBUTES
+        cache_key = (context_purpose, max_static_elements, tuple(attrs_to_check))
+        if self._context_cache is not None and cache_key in self._context_cache:
+            cached_str, cached_map = self._context_cache[cache_key]
+            return cached_str, dict(cached_map) # Callers may modify their map
+
         formatted_lines = []
-        processed_node_ids = set()
+        visit_token = object() # Marks nodes emitted by this call, see DOMElementNode._visit_token
         static_element_count = 0
-        nodes_processed_count = 0 
         static_id_counter = 1 # Counter for temporary static IDs
         temp_static_id_map: Dict[str, 'DOMElementNode'] = {} # Map temporary ID to node
 
-        max_static_elements = max_static_elements_verification if context_purpose == 'verification' else max_static_elements_action
-
         
         def get_direct_visible_text(node: DOMElementNode, max_len=10000) -> str:
             """Gets text directly within this node, ignoring children elements."""
             texts = []
             for child in node.children:
-                if isinstance(child, DOMTextNode) and child.is_visible:
+                if type(child) is DOMTextNode and child.is_visible:
                     texts.append(child.text.strip())
             full_text = ' '.join(filter(None, texts))
             if len(full_text) > max_len:
                  return full_text[:max_len-3] + "..."
             return full_text
 
+        parent_hints: Dict[int, Optional[str]] = {} # id(parent) -> hint, shared by sibling static elements
+
         def get_parent_hint(node: DOMElementNode) -> Optional[str]:
-            """Gets a hint string for the nearest identifiable parent."""
+            """Gets a hint string for the nearest identifiable parent, computed once per parent."""
             parent = node.parent
-            if isinstance(parent, DOMElementNode):
+            parent_id = id(parent)
+            if parent_id not in parent_hints:
+                parent_hints[parent_id] = build_parent_hint(parent)
+            return parent_hints[parent_id]
+
+        def build_parent_hint(parent: Optional[DOMElementNode]) -> Optional[str]:
+            if type(parent) is DOMElementNode:
                 parent_attrs = parent.attributes
                 hint_parts = []
                 if parent_attrs.get('id'):
@@ -208,21 +241,20 @@ class DOMElementNode(DOMBaseNode):
                     return f"(inside: <{parent.tag_name} {' '.join(hint_parts)}>)"
             return None
 
-        def process_node(node: Union['DOMElementNode', DOMTextNode], depth: int) -> None:
-            nonlocal static_element_count, nodes_processed_count, static_id_counter # Allow modification
+        # Depth-first walk in document order with an explicit stack (children are pushed reversed)
+        stack: List[Tuple[DOMElementNode, int]] = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
 
-            # Skip if already processed or not an element
-            if not isinstance(node, DOMElementNode): return
-            nodes_processed_count += 1
-            node_id = id(node)
-            if node_id in processed_node_ids: return
-            processed_node_ids.add(node_id)
+            # Skip if already processed (only element nodes are ever pushed)
+            if node._visit_token is visit_token: continue
+            node._visit_token = visit_token
 
             is_node_visible = node.is_visible
             visibility_marker = "" if is_node_visible else " (Not Visible)" 
 
             should_add_current_node = False
-            line_to_add = ""
+            line_parts: List[str] = [] # Fragments of this node's line, joined once when it is added
             is_interactive = node.highlight_index is not None
             temp_static_id_assigned = None # Track if ID was assigned to this node
 
@@ -231,8 +263,6 @@ class DOMElementNode(DOMBaseNode):
 
             # --- Attribute Extraction (Common logic) ---
             attributes_to_show = {}
-            default_attrs = ['id', 'name', 'class', 'aria-label', 'placeholder', 'role', 'type', 'value', 'title', 'alt', 'href', 'data-testid', 'data-value']
-            attrs_to_check = include_attributes if include_attributes else default_attrs
             extract_attrs_for_this_node = is_interactive or (context_purpose == 'verification')
             if extract_attrs_for_this_node:
                 for attr_key in attrs_to_check:
@@ -249,8 +279,6 @@ class DOMElementNode(DOMBaseNode):
                     value_str = str(value) # Ensure it's a string
                     # Limit length for display
                     display_value = value_str if len(value_str) < 50 else value_str[:47] + '...'
-                    # *** CORRECT HTML ESCAPING for attribute value strings ***
-                    display_value = display_value.replace('&', '&').replace('<', '<').replace('>', '>').replace('"', '"')
                     parts.append(f'{key}="{display_value}"')
                 attrs_str = " ".join(parts)
 
@@ -258,15 +286,15 @@ class DOMElementNode(DOMBaseNode):
             if is_interactive:
                 # == INTERACTIVE ELEMENT == (Always include)
                 text_content = node.get_all_text_till_next_clickable_element()
-                text_content = ' '.join(text_content.split()) if text_content else ""
+                text_content = _WHITESPACE_RE.sub(' ', text_content).strip() if text_content else ""
                 # Truncate long text for display
                 if len(text_content) > 150: text_content = text_content[:147] + "..."
 
-                line_to_add = f"{indent}[{node.highlight_index}]<{node.tag_name}"
-                if attrs_str: line_to_add += f" {attrs_str}"
-                if text_content: line_to_add += f">{text_content}</{node.tag_name}>"
-                else: line_to_add += " />"
-                line_to_add += visibility_marker
+                line_parts += (indent, '[', str(node.highlight_index), ']<', node.tag_name)
+                if attrs_str: line_parts += (' ', attrs_str)
+                if text_content: line_parts += ('>', text_content, '</', node.tag_name, '>')
+                else: line_parts.append(" />")
+                line_parts.append(visibility_marker)
                 should_add_current_node = True
 
             elif static_element_count < max_static_elements:
@@ -276,9 +304,8 @@ class DOMElementNode(DOMBaseNode):
 
                 # Determine if static node is relevant for verification
                 if context_purpose == 'verification':
-                    common_static_tags = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'span', 'div', 'li', 'label', 'td', 'th', 'strong', 'em', 'dt', 'dd'}
                     # Include if common tag OR has text OR *has attributes calculated in attrs_str*
-                    if node.tag_name in common_static_tags or text_content or attrs_str:
+                    if node.tag_name in COMMON_STATIC_TAGS or text_content or attrs_str:
                         include_this_static = True
                         
                 if not text_content:
@@ -292,18 +319,17 @@ class DOMElementNode(DOMBaseNode):
                     static_id_counter += 1
                     
                     # *** Start building the line ***
-                    line_to_add = f"{indent}<{node.tag_name}"
+                    line_parts += (indent, '<', node.tag_name)
 
                     # *** CRUCIAL: Add the calculated attributes string ***
                     if attrs_str:
-                        line_to_add += f" {attrs_str}"
+                        line_parts += (' ', attrs_str)
                         
                     # --- Add the static ID attribute to the string ---
-                    line_to_add += f' data-static-id="{current_static_id}"'
+                    line_parts += (' data-static-id="', current_static_id, '"')
 
                     # *** Add the static marker ***
-                    line_to_add += " (Static)"
-                    line_to_add += visibility_marker
+                    line_parts += (" (Static)", visibility_marker)
 
                     # *** Add parent hint ONLY if element lacks key identifiers ***
                     node_attrs = node.attributes # Use original attributes for this check
@@ -311,41 +337,35 @@ class DOMElementNode(DOMBaseNode):
                     if not has_key_identifier:
                             parent_hint = get_parent_hint(node)
                             if parent_hint:
-                                line_to_add += f" {parent_hint}"
+                                line_parts += (' ', parent_hint)
 
                     # *** Add text content and close tag ***
                     if text_content:
-                        line_to_add += f">{text_content}</{node.tag_name}>"
+                        line_parts += ('>', text_content, '</', node.tag_name, '>')
                     else:
-                        line_to_add += " />"
+                        line_parts.append(" />")
 
                     should_add_current_node = True
                     static_element_count += 1
 
             # --- Add the formatted line if needed ---
             if should_add_current_node:
-                formatted_lines.append(line_to_add)
-                # logger.debug(f"Added line: {line_to_add}") # Optional debug
-
-            # --- ALWAYS Recurse into children (unless static limit hit) ---
-            # We recurse even if the parent wasn't added, because children might be visible/interactive
-            if static_element_count >= max_static_elements:
-                 # Stop recursing down static branches if limit is hit
-                 pass
-            else:
-                 for child in node.children:
-                     # Pass DOMElementNode or DOMTextNode directly
-                     process_node(child, depth + 1)
-
+                formatted_lines.append("".join(line_parts))
+                # logger.debug(f"Added line: {formatted_lines[-1]}") # Optional debug
 
-        # Start processing from the root element
-        process_node(self, 0)
+            # --- ALWAYS descend into children (unless static limit hit) ---
+            # We descend even if the parent wasn't added, because children might be visible/interactive
+            if static_element_count < max_static_elements:
+                stack.extend((child, depth + 1) for child in reversed(node.children) if type(child) is DOMElementNode)
 
-        # logger.debug(f"Finished generate_llm_context_string. Processed {nodes_processed_count} nodes. Added {len(formatted_lines)} lines.") # Log summary
+        # logger.debug(f"Finished generate_llm_context_string. Added {len(formatted_lines)} lines.") # Log summary
 
         output_str = '\n'.join(formatted_lines)
         if static_element_count >= max_static_elements:
              output_str += f"\n{ '  ' * 0 }... (Static element list truncated after {max_static_elements} entries)"
+        if self._context_cache is None:
+            self._context_cache = {}
+        self._context_cache[cache_key] = (output_str, dict(temp_static_id_map))
         return output_str, temp_static_id_map
 
 
@@ -356,7 +376,7 @@ class DOMElementNode(DOMBaseNode):
 
         # Check children
         for child in self.children:
-            if isinstance(child, DOMElementNode):
+            if type(child) is DOMElementNode:
                 result = child.get_file_upload_element(check_siblings=False)
                 if result:
                     return result
@@ -364,7 +384,7 @@ class DOMElementNode(DOMBaseNode):
         # Check siblings only for the initial call
         if check_siblings and self.parent:
             for sibling in self.parent.children:
-                if sibling is not self and isinstance(sibling, DOMElementNode):
+                if sibling is not self and type(sibling) is DOMElementNode:
                     result = sibling.get_file_upload_element(check_siblings=False)
                     if result:
                         return result
@@ -375,6 +395,26 @@ class DOMElementNode(DOMBaseNode):
 SelectorMap = Dict[int, DOMElementNode]
 
 
+
+def _get_css_selector(self: DOMElementNode) -> Optional[str]:
+    """ Generates the enhanced CSS selector on first access and caches it on the node. """
+    if self._css_selector is None:
+        # Use relative import within the function to avoid top-level circular dependencies
+        from .service import DomService
+        try:
+            self._css_selector = DomService._enhanced_css_selector_for_element(self)
+        except Exception as e:
+            logger.error(f"Error generating selector for node {self.xpath}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+            self._css_selector = self.xpath # Fallback to xpath
+    return self._css_selector
+
+def _set_css_selector(self: DOMElementNode, value: Optional[str]) -> None:
+    self._css_selector = value
+
+# Installed after @dataclass (replacing the InitVar's class default) so selectors are only computed for the
+# nodes a caller actually asks about.
+DOMElementNode.css_selector = property(_get_css_selector, _set_css_selector)
+
 @dataclass
 class DOMState:
     """Holds the state of the processed DOM at a point in time."""
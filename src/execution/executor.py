@@ -4,9 +4,10 @@ import logging
 import time
 import os
 from patchright.sync_api import sync_playwright, Page, TimeoutError as PlaywrightTimeoutError, Error as PlaywrightError, expect
-from typing import Optional, Dict, Any, Tuple, List
+from typing import Optional, Dict, Any, Tuple, List, Callable
 from pydantic import BaseModel, Field
 import re
+from functools import lru_cache
 from PIL import Image
 from pixelmatch.contrib.PIL import pixelmatch
 import io
@@ -15,6 +16,8 @@ from ..browser.browser_controller import BrowserController # Re-use for browser
 from ..llm.llm_client import LLMClient
 from ..agents.recorder_agent import WebAgent
 from ..utils.image_utils import compare_images
+from ..utils.pixelmatch_fast import count_mismatched_pixels, warm_up as warm_up_pixel_diff
+from ..utils.utils import save_json_file
 
 # Define a short timeout specifically for selector validation during healing
 HEALING_SELECTOR_VALIDATION_TIMEOUT_MS = 2000
@@ -27,6 +30,35 @@ class HealingSelectorSuggestion(BaseModel):
 
 logger = logging.getLogger(__name__)
 
+# Counts matches for a CSS selector or an XPath expression in the main document
+_JS_COUNT_MATCHES = """([selector, isXPath]) => isXPath
+    ? document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null).snapshotLength
+    : document.querySelectorAll(selector).length"""
+
+# Characters that make a selector containing '/' CSS rather than XPath (e.g. 'a[href="/x"]')
+_CSS_CHARS_RE = re.compile(r'[#.\[>+~]')
+
+# Deliberately not BrowserController's _normalize_selector: that one also treats a leading '.' as XPath
+# (relative paths like './/div'), which would break the '.class' CSS selectors recorded test files contain.
+@lru_cache(maxsize=1024)
+def _normalize_selector(selector: str) -> str:
+    """
+    Prefixes selectors that look like XPath with 'xpath=' for Playwright; others pass through.
+    Cached, since runs resolve the same few selectors on every step and retry.
+    """
+    is_likely_xpath = selector.startswith(('/', '(')) or ('/' in selector and not _CSS_CHARS_RE.search(selector))
+    if is_likely_xpath and not selector.startswith(('css=', 'xpath=')):
+        logger.warning(f"Selector '{selector}' looks like XPath but lacks prefix. Assuming XPath and adding 'xpath=' prefix.")
+        return f"xpath={selector}"
+    return selector
+
+def _open_rgba(fp) -> Image.Image:
+    """Decodes an image as RGBA, skipping the converted copy when the file is already RGBA."""
+    img = Image.open(fp)
+    img.load() # Decode now so the file handle is released
+    return img if img.mode == "RGBA" else img.convert("RGBA")
+
+
 class TestExecutor:
     """
     Executes a recorded test case from a JSON file deterministically using Playwright.
@@ -80,6 +112,12 @@ class TestExecutor:
         self.pixel_threshold = pixel_threshold # Store threshold
         logger.info(f"TestExecutor initialized (visual baseline dir: {self.baseline_dir}, pixel threshold: {self.pixel_threshold*100:.2f}%)")
         os.makedirs(self.baseline_dir, exist_ok=True) # Ensure baseline dir exists
+        warm_up_pixel_diff() # Compile the pixel diff kernel now rather than on the first visual step
+        self._baseline_metadata_cache: Dict[str, Dict] = {} # baseline_id -> parsed metadata JSON, see _load_baseline_metadata
+        self._baseline_index: Dict[str, Tuple[str, str]] = {} # baseline_id -> (metadata path, image path), see _refresh_baseline_index
+        self._refresh_baseline_index()
+        self._first_navigation_done = False # Performance timing is captured on the first navigate of each run
+        self._action_table = self._build_action_table() # action -> handler, see run_test
     
     
     def _get_locator(self, selector: str):
@@ -89,15 +127,7 @@ class TestExecutor:
         if not selector:
             raise ValueError("Selector cannot be empty.")
         
-        is_likely_xpath = selector.startswith(('/', '(', '//')) or \
-                          ('/' in selector and not any(c in selector for c in ['#', '.', '[', '>', '+', '~']))
-
-        # If it looks like XPath but doesn't have a prefix, add 'css='
-        # Playwright's locator treats "css=<xpath>" as an XPath selector.
-        processed_selector = selector
-        if is_likely_xpath and not selector.startswith(('css=', 'xpath=')):
-            logger.warning(f"Selector '{selector}' looks like XPath but lacks prefix. Assuming XPath and adding 'css=' prefix.")
-            processed_selector = f"xpath={selector}"
+        processed_selector = _normalize_selector(selector)
         
         try:
             logger.debug(f"Attempting to locate using: '{processed_selector}'")
@@ -109,25 +139,75 @@ class TestExecutor:
             raise PlaywrightError(f"Invalid selector syntax or error creating locator: '{processed_selector}'. Error: {e}") from e
     
         
+    def _refresh_baseline_index(self) -> None:
+        """Scans the baseline dir once, indexing the baselines that have both their metadata JSON and PNG."""
+        found: Dict[str, Dict[str, str]] = {}
+        try:
+            with os.scandir(self.baseline_dir) as entries:
+                for entry in entries:
+                    stem, ext = os.path.splitext(entry.name)
+                    if ext in (".json", ".png") and entry.is_file():
+                        found.setdefault(stem, {})[ext] = entry.path
+        except OSError as e:
+            logger.error(f"Error scanning baseline dir '{self.baseline_dir}': {e}")
+        self._baseline_index = {stem: (paths[".json"], paths[".png"]) for stem, paths in found.items() if len(paths) == 2}
+        self._baseline_metadata_cache.clear() # Baselines may have been re-recorded or deleted since they were read
+        logger.debug(f"Indexed {len(self._baseline_index)} visual baseline(s) in {self.baseline_dir}")
+
+    def _load_baseline_metadata(self, baseline_id: str) -> Optional[Dict]:
+        """Reads a baseline's metadata JSON once per index refresh (i.e. per run); returns None if it is missing or unreadable."""
+        metadata = self._baseline_metadata_cache.get(baseline_id)
+        if metadata is not None:
+            return metadata
+        paths = self._baseline_index.get(baseline_id)
+        if paths is None:
+            return None
+        metadata_path = paths[0]
+        try:
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading baseline metadata for ID '{baseline_id}': {e}")
+            return None
+        self._baseline_metadata_cache[baseline_id] = metadata
+        return metadata
+
     def _load_baseline(self, baseline_id: str) -> Tuple[Optional[Image.Image], Optional[Dict]]:
         """Loads the baseline image and metadata."""
-        metadata_path = os.path.join(self.baseline_dir, f"{baseline_id}.json")
-        image_path = os.path.join(self.baseline_dir, f"{baseline_id}.png") # Assume PNG
-
-        if not os.path.exists(metadata_path) or not os.path.exists(image_path):
+        paths = self._baseline_index.get(baseline_id)
+        if paths is None:
             logger.error(f"Baseline files not found for ID '{baseline_id}' in {self.baseline_dir}")
             return None, None
+        metadata_path, image_path = paths
 
         try:
-            with open(metadata_path, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-            baseline_img = Image.open(image_path).convert("RGBA") # Load and ensure RGBA
+            metadata = self._load_baseline_metadata(baseline_id)
+            if metadata is None:
+                return None, None
+            baseline_img = _open_rgba(image_path) # Load and ensure RGBA
             logger.info(f"Loaded baseline '{baseline_id}' (Image: {image_path}, Metadata: {metadata_path})")
             return baseline_img, metadata
         except Exception as e:
             logger.error(f"Error loading baseline files for ID '{baseline_id}': {e}", exc_info=True)
             return None, None
 
+    def _count_selector_matches(self, selector: str) -> int:
+        """
+        Counts elements matching a healing suggestion with one document query. Falls back to a Playwright
+        locator when the page finds none or rejects the syntax, which covers shadow DOM and engine-only
+        selectors (e.g. ':has-text()').
+        """
+        processed_selector = _normalize_selector(selector)
+        is_xpath = processed_selector.startswith('xpath=')
+        query = processed_selector.split('=', 1)[1] if processed_selector.startswith(('xpath=', 'css=')) else processed_selector
+        try:
+            count = self.page.evaluate(_JS_COUNT_MATCHES, [query, is_xpath])
+            if count:
+                return count
+        except PlaywrightError as e:
+            logger.debug(f"Document query rejected selector '{selector}', retrying with a locator: {e}")
+        return self.page.locator(processed_selector).count()
+
     def _attempt_soft_healing(
             self,
             failed_step: Dict[str, Any],
@@ -216,8 +296,7 @@ class TestExecutor:
                     validation_passed = False
                     validation_reasoning_suffix = ""
                     try:
-                        # Use page.locator() with a short timeout for existence check
-                        count = self.page.locator(suggested_selector).count()
+                        count = self._count_selector_matches(suggested_selector)
 
                         if count > 0:
                             validation_passed = True
@@ -312,6 +391,482 @@ class TestExecutor:
             logger.critical(f"❌ Hard Healing: Critical error during re-recording setup or execution: {record_err}", exc_info=True)
    
 
+    def _build_action_table(self) -> Dict[str, Callable[[Optional[str], Dict[str, Any], Dict[str, Any], Dict[str, Any]], None]]:
+        """Maps each recorded action to its handler; handlers raise on failure so the healing loop can retry."""
+        return {
+            "navigate": self._do_navigate,
+            "click": self._do_click,
+            "type": self._do_type,
+            "scroll": self._do_scroll, # Less common, but support if recorded
+            "check": self._do_check,
+            "uncheck": self._do_uncheck,
+            "select": self._do_select,
+            "wait": self._do_wait, # Generic wait action
+            "wait_for_load_state": self._do_wait_for_load_state,
+            "wait_for_selector": self._do_wait_for_selector, # Explicit wait
+            "key_press": self._do_key_press,
+            "drag_and_drop": self._do_drag_and_drop,
+            "assert_text_contains": self._assert_text_contains,
+            "assert_text_equals": self._assert_text_equals,
+            "assert_visible": self._assert_visible,
+            "assert_hidden": self._assert_hidden,
+            "assert_attribute_equals": self._assert_attribute_equals,
+            "assert_element_count": self._assert_element_count,
+            "assert_checked": self._assert_checked,
+            "assert_not_checked": self._assert_not_checked,
+            "assert_disabled": self._assert_disabled,
+            "assert_enabled": self._assert_enabled,
+            "task_replanned": lambda sel, params, step, run_status: None,
+            "assert_visual_match": self._assert_visual_match,
+            "assert_passed_verification": self._assert_llm_verification,
+            "assert_llm_verification": self._assert_llm_verification,
+        }
+
+    def _do_navigate(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        url = params.get("url")
+        if not url: raise ValueError("Missing 'url' parameter for navigate.")
+        self.browser_controller.goto(url)# Uses default navigation timeout from context
+        if not self._first_navigation_done:
+            if self.get_performance:
+                run_status["performance_timing"] = self.browser_controller.page_performance_timing
+            self._first_navigation_done = True
+
+    def _do_click(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for click.")
+        locator = self._get_locator(current_selector)
+        locator.click(timeout=self.default_timeout) # Explicit timeout for action
+
+    def _do_type(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        text = params.get("text")
+        if not current_selector: raise ValueError("Missing 'current_selector' for type.")
+        if text is None: raise ValueError("Missing 'text' parameter for type.")
+        locator = self._get_locator(current_selector)
+        locator.fill(text, timeout=self.default_timeout) # Use fill for robustness
+
+    def _do_scroll(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        direction = params.get("direction")
+        if direction not in ["up", "down"]: raise ValueError("Invalid 'direction'.")
+        amount = "window.innerHeight" if direction=="down" else "-window.innerHeight"
+        self.page.evaluate(f"window.scrollBy(0, {amount})")
+
+    def _do_check(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for check action.")
+        # Use the browser_controller method which handles locator/timeout
+        self.browser_controller.check(current_selector)
+
+    def _do_uncheck(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for uncheck action.")
+        # Use the browser_controller method
+        self.browser_controller.uncheck(current_selector)
+
+    def _do_select(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        option_label = params.get("option_label")
+        option_value = params.get("option_value") # Support value too if recorded
+        option_index_str = params.get("option_index") # Support index if recorded
+        option_param = None
+        param_type = None
+
+        if option_label is not None:
+            option_param = {"label": option_label}
+            param_type = f"label '{option_label}'"
+        elif option_value is not None:
+            option_param = {"value": option_value}
+            param_type = f"value '{option_value}'"
+        elif option_index_str is not None and option_index_str.isdigit():
+            option_param = {"index": int(option_index_str)}
+            param_type = f"index {option_index_str}"
+        else:
+            raise ValueError("Missing 'option_label', 'option_value', or 'option_index' parameter for select action.")
+
+        if not current_selector: raise ValueError("Missing 'current_selector' for select action.")
+
+        logger.info(f"Selecting option by {param_type} in element: {current_selector}")
+        locator = self._get_locator(current_selector)
+        locator.select_option(**option_param, timeout=self.default_timeout)
+
+    def _do_wait(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        timeout_s = params.get("timeout_seconds")
+        target_url = params.get("url")
+        element_state = params.get("state") # e.g., 'visible', 'hidden'
+        wait_selector = current_selector # Use current (potentially healed) selector if waiting for element
+
+        if timeout_s is not None and not target_url and not element_state:
+            # Simple time wait
+            logger.info(f"Waiting for {timeout_s} seconds...")
+            self.page.wait_for_timeout(timeout_s * 1000)
+        elif wait_selector and element_state:
+            # Wait for element state
+            logger.info(f"Waiting for element '{wait_selector}' to be '{element_state}' (max {self.default_timeout}ms)...")
+            locator = self._get_locator(wait_selector)
+            locator.wait_for(state=element_state, timeout=self.default_timeout)
+        elif target_url:
+            # Wait for URL
+            logger.info(f"Waiting for URL matching '{target_url}' (max {self.browser_controller.default_navigation_timeout}ms)...")
+            self.page.wait_for_url(target_url, timeout=self.browser_controller.default_navigation_timeout)
+        else:
+            raise ValueError("Invalid parameters for 'wait' action. Need timeout_seconds OR (selector and state) OR url.")
+
+    def _do_wait_for_load_state(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        state = params.get("state", "load")
+        self.page.wait_for_load_state(state, timeout=self.browser_controller.default_navigation_timeout) # Use navigation timeout
+
+    def _do_wait_for_selector(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        wait_state = params.get("state", "visible")
+        timeout = params.get("timeout_ms", self.default_timeout)
+        if not current_selector: raise ValueError("Missing 'current_selector' for wait_for_selector.")
+        locator = self._get_locator(current_selector)
+        locator.wait_for(state=wait_state, timeout=timeout)
+
+    def _do_key_press(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        keys = params.get("keys")
+        if not current_selector: raise ValueError("Missing 'selector' for key_press.")
+        if not keys: raise ValueError("Missing 'keys' parameter for key_press.")
+        # Use controller method or locator directly
+        locator = self._get_locator(current_selector)
+        locator.press(keys, timeout=self.default_timeout)
+        # self.browser_controller.press(current_selector, keys) # Alt: if using controller method
+
+    def _do_drag_and_drop(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        target_selector = params.get("target_selector")
+        source_selector = current_selector # Source is in the main 'selector' field
+        if not source_selector: raise ValueError("Missing source 'selector' for drag_and_drop.")
+        if not target_selector: raise ValueError("Missing 'target_selector' in parameters for drag_and_drop.")
+        # Use controller method or locators directly
+        source_locator = self._get_locator(source_selector)
+        target_locator = self._get_locator(target_selector)
+        source_locator.drag_to(target_locator, timeout=self.default_timeout)
+        # self.browser_controller.drag_and_drop(source_selector, target_selector) # Alt: if using controller
+
+    # --- Assertions ---
+
+    def _assert_text_contains(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        expected_text = params.get("expected_text")
+        if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
+        if expected_text is None: raise ValueError("Missing 'expected_text'.")
+        locator = self._get_locator(current_selector)
+        expect(locator).to_contain_text(expected_text, timeout=self.default_timeout)
+
+    def _assert_text_equals(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        expected_text = params.get("expected_text")
+        if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
+        if expected_text is None: raise ValueError("Missing 'expected_text'.")
+        locator = self._get_locator(current_selector)
+        expect(locator).to_have_text(expected_text, timeout=self.default_timeout)
+
+    def _assert_visible(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
+        locator = self._get_locator(current_selector)
+        expect(locator).to_be_visible(timeout=self.default_timeout)
+
+    def _assert_hidden(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
+        locator = self._get_locator(current_selector)
+        expect(locator).to_be_hidden(timeout=self.default_timeout)
+
+    def _assert_attribute_equals(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        attr_name = params.get("attribute_name")
+        expected_value = params.get("expected_value")
+        if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
+        if not attr_name: raise ValueError("Missing 'attribute_name'.")
+        if expected_value is None: raise ValueError("Missing 'expected_value'.")
+        locator = self._get_locator(current_selector)
+        expect(locator).to_have_attribute(attr_name, expected_value, timeout=self.default_timeout)
+
+    def _assert_element_count(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        expected_count = params.get("expected_count")
+        if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
+        if expected_count is None: raise ValueError("Missing 'expected_count'.")
+        if not isinstance(expected_count, int): raise ValueError("'expected_count' must be an integer.") # Add type check
+
+        # --- FIX: Get locator for count without using .first ---
+        # Apply the same current_selector processing as in _get_locator
+        processed_selector = _normalize_selector(current_selector)
+
+        # Get the locator for potentially MULTIPLE elements
+        count_locator = self.page.locator(processed_selector)
+        # --- End FIX ---
+
+        logger.info(f"Asserting count of elements matching '{processed_selector}' to be {expected_count}")
+        expect(count_locator).to_have_count(expected_count, timeout=self.default_timeout)
+
+    def _assert_checked(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for assert_checked.")
+        locator = self._get_locator(current_selector)
+        # Use Playwright's dedicated assertion for checked state
+        expect(locator).to_be_checked(timeout=self.default_timeout)
+
+    def _assert_not_checked(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for assert_not_checked.")
+        locator = self._get_locator(current_selector)
+        # Use .not modifier with the checked assertion
+        expect(locator).not_to_be_checked(timeout=self.default_timeout)
+
+    def _assert_disabled(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for assert_disabled.")
+        locator = self._get_locator(current_selector)
+        # Use Playwright's dedicated assertion for disabled state
+        expect(locator).to_be_disabled(timeout=self.default_timeout)
+
+    def _assert_enabled(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        if not current_selector: raise ValueError("Missing 'current_selector' for assert_enabled.")
+        locator = self._get_locator(current_selector)
+        expect(locator).to_be_enabled(timeout=self.default_timeout)
+
+    def _assert_visual_match(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        baseline_id = params.get("baseline_id")
+        step_id = step.get("step_id", run_status["steps_executed"])
+        element_selector = step.get("selector") # Use step's selector if available
+        use_llm = params.get("use_llm_fallback", True)
+        # Allow overriding threshold per step
+        step_threshold = params.get("pixel_threshold", self.pixel_threshold)
+
+        if not baseline_id:
+            raise ValueError("Missing 'baseline_id' parameter for assert_visual_match.")
+
+        logger.info(f"--- Performing Visual Assertion: '{baseline_id}' (Selector: {element_selector}, Threshold: {step_threshold*100:.2f}%, LLM: {use_llm}) ---")
+
+        # 1. Load Baseline
+        baseline_img, baseline_meta = self._load_baseline(baseline_id)
+        if not baseline_img or not baseline_meta:
+            raise FileNotFoundError(f"Baseline '{baseline_id}' not found or failed to load.")
+
+        # 2. Capture Current State
+        current_screenshot_bytes = None
+        if element_selector:
+            current_screenshot_bytes = self.browser_controller.take_screenshot_element(element_selector)
+        else:
+            current_screenshot_bytes = self.browser_controller.take_screenshot() # Full page
+
+        if not current_screenshot_bytes:
+            raise PlaywrightError("Failed to capture current screenshot for visual comparison.")
+
+        try:
+            # Create a BytesIO buffer to treat the bytes like a file
+            buffer = io.BytesIO(current_screenshot_bytes)
+            # Open the image from the buffer using Pillow, in RGBA format for consistency,
+            # especially important for pixel comparisons that might expect an alpha channel.
+            logger.info("received")
+            current_img = _open_rgba(buffer)
+        except Exception as e:
+            logger.error(f"Failed to convert bytes to PIL Image: {e}", exc_info=True)
+            current_img = None
+
+
+
+        if not current_img:
+            raise RuntimeError("Failed to process current screenshot bytes into an image.")
+
+
+        # 3. Pre-check Dimensions
+        if baseline_img.size != current_img.size:
+            size_mismatch_msg = f"Visual Assertion Failed: Image dimensions mismatch for '{baseline_id}'. Baseline: {baseline_img.size}, Current: {current_img.size}."
+            logger.error(size_mismatch_msg)
+            # Save current image for debugging
+            ts = time.strftime("%Y%m%d_%H%M%S")
+            current_img_path = os.path.join("output", f"visual_fail_{baseline_id}_current_{ts}.png")
+            current_img.save(current_img_path)
+            logger.info(f"Saved current image (dimension mismatch) to: {current_img_path}")
+            raise AssertionError(size_mismatch_msg) # Fail the assertion
+
+        # 4. Pixel Comparison
+        total_pixels = baseline_img.width * baseline_img.height
+        # The JIT kernel only counts; pixelmatch still runs when the step fails and needs a diff image
+        mismatched_pixels = count_mismatched_pixels(baseline_img, current_img, threshold=0.1)
+        if mismatched_pixels is None or (total_pixels > 0 and mismatched_pixels / total_pixels > step_threshold):
+            img_diff = Image.new("RGBA", baseline_img.size) # Image to store diff pixels
+            try:
+                mismatched_pixels = pixelmatch(baseline_img, current_img, img_diff, includeAA=True, threshold=0.1) # Use default pixelmatch threshold first
+            except Exception as pm_error:
+                logger.error(f"Error during pixelmatch comparison for '{baseline_id}': {pm_error}", exc_info=True)
+                raise RuntimeError(f"Pixelmatch library error: {pm_error}") from pm_error
+
+        diff_ratio = mismatched_pixels / total_pixels if total_pixels > 0 else 0
+        logger.info(f"Pixel comparison for '{baseline_id}': Mismatched Pixels = {mismatched_pixels}, Total Pixels = {total_pixels}, Difference = {diff_ratio*100:.4f}%")
+
+        # 5. Check against threshold
+        pixel_match_passed = diff_ratio <= step_threshold
+        llm_reasoning = None
+        diff_image_path = None
+
+        if pixel_match_passed:
+            logger.info(f"✅ Visual Assertion PASSED (Pixel Diff <= Threshold) for '{baseline_id}'.")
+            # Step completed successfully
+        else:
+            logger.warning(f"Visual Assertion: Pixel difference ({diff_ratio*100:.4f}%) exceeds threshold ({step_threshold*100:.2f}%) for '{baseline_id}'.")
+
+            # Save diff image regardless of LLM outcome
+            ts = time.strftime("%Y%m%d_%H%M%S")
+            diff_image_path = os.path.join("output", f"visual_diff_{baseline_id}_{ts}.png")
+            try:
+                img_diff.save(diff_image_path)
+                logger.info(f"Saved pixel difference image to: {diff_image_path}")
+            except Exception as save_err:
+                logger.error(f"Failed to save diff image: {save_err}")
+                diff_image_path = None # Mark as failed
+
+            # 6. LLM Fallback
+            if use_llm and self.llm_client:
+                logger.info(f"Attempting LLM visual comparison fallback for '{baseline_id}'...")
+                baseline_bytes = io.BytesIO()
+                baseline_img.save(baseline_bytes, format='PNG')
+                baseline_bytes = baseline_bytes.getvalue()
+
+                # --- UPDATED LLM PROMPT for Stitched Image ---
+                llm_prompt = f"""Analyze the combined image provided below for the purpose of automated software testing.
+            The LEFT half (labeled '1: Baseline') is the established baseline screenshot.
+            The RIGHT half (labeled '2: Current') is the current state screenshot.
+
+            Compare these two halves to determine if they are SEMANTICALLY equivalent from a user's perspective.
+
+            IGNORE minor differences like:
+            - Anti-aliasing variations
+            - Single-pixel shifts
+            - Tiny rendering fluctuations
+            - Small, insignificant dynamic content changes (e.g., blinking cursors, exact timestamps if not the focus).
+
+            FOCUS ON significant differences like:
+            - Layout changes (elements moved, resized, missing, added)
+            - Major color changes of key elements
+            - Text content changes (errors, different labels, etc.)
+            - Missing or fundamentally different images/icons.
+
+            Baseline ID: "{baseline_id}"
+            Captured URL (Baseline): "{baseline_meta.get('url_captured', 'N/A')}"
+            Selector (Baseline): "{baseline_meta.get('selector_captured', 'Full Page')}"
+
+            Based on these criteria, are the two halves (baseline vs. current) functionally and visually equivalent enough to PASS a visual regression test?
+
+            Respond ONLY with "YES" or "NO", followed by a brief explanation justifying your answer by referencing differences between the left and right halves.
+            Example YES: YES - The left (baseline) and right (current) images are visually equivalent. Minor text rendering differences are ignored.
+            Example NO: NO - The primary call-to-action button visible on the left (baseline) is missing on the right (current).
+            """
+                # --- END UPDATED PROMPT ---
+
+                try:
+                    # No change here, compare_images handles the stitching internally
+                    llm_response = compare_images(llm_prompt, baseline_bytes, current_screenshot_bytes, self.llm_client)
+                    logger.info(f"LLM visual comparison response for '{baseline_id}': {llm_response}")
+                    llm_reasoning = llm_response # Store reasoning
+
+                    if llm_response.strip().upper().startswith("YES"):
+                        logger.info(f"✅ Visual Assertion PASSED (LLM Override) for '{baseline_id}'.")
+                        pixel_match_passed = True # Override pixel result
+                    elif llm_response.strip().upper().startswith("NO"):
+                        logger.warning(f"Visual Assertion: LLM confirmed significant difference for '{baseline_id}'.")
+                        pixel_match_passed = False # Confirm failure
+                    else:
+                        logger.warning(f"Visual Assertion: LLM response unclear for '{baseline_id}'. Treating as failure.")
+                        pixel_match_passed = False
+                except Exception as llm_err:
+                    logger.error(f"LLM visual comparison failed: {llm_err}", exc_info=True)
+                    llm_reasoning = f"LLM Error: {llm_err}"
+                    pixel_match_passed = False # Treat LLM error as failure
+
+            else: # LLM fallback not enabled or LLM not available
+                logger.warning(f"Visual Assertion: LLM fallback skipped for '{baseline_id}'. Failing based on pixel difference.")
+                pixel_match_passed = False
+
+            # 7. Handle Final Failure
+            if not pixel_match_passed:
+                failure_msg = f"Visual Assertion Failed for '{baseline_id}'. Pixel diff: {diff_ratio*100:.4f}% (Threshold: {step_threshold*100:.2f}%)."
+                if llm_reasoning: failure_msg += f" LLM Reason: {llm_reasoning}"
+                logger.error(failure_msg)
+                # Add details to run_status before raising
+                visual_failure_details = {
+                    "baseline_id": baseline_id,
+                    "pixel_difference_ratio": diff_ratio,
+                    "pixel_threshold": step_threshold,
+                    "mismatched_pixels": mismatched_pixels,
+                    "diff_image_path": diff_image_path,
+                    "llm_reasoning": llm_reasoning
+                }
+                # We need to store this somewhere accessible when raising the final error
+                # Let's add it directly to the step dict temporarily? Or a dedicated failure context?
+                # For now, log it and include basics in the AssertionError
+                run_status["visual_failure_details"] = visual_failure_details # Add to main run status
+                raise AssertionError(failure_msg) # Fail the step
+
+        visual_result = {
+            "step_id": step_id,
+            "baseline_id": baseline_id,
+            "status": "PASS" if pixel_match_passed else "FAIL",
+            "pixel_difference_ratio": diff_ratio,
+            "mismatched_pixels": mismatched_pixels,
+            "pixel_threshold": step_threshold,
+            "llm_override": use_llm and not pixel_match_passed and llm_response.strip().upper().startswith("YES") if 'llm_response' in locals() else False,
+            "llm_reasoning": llm_reasoning,
+            "diff_image_path": diff_image_path,
+            "element_selector": element_selector
+        }
+        run_status["visual_assertion_results"].append(visual_result)
+
+    def _assert_llm_verification(self, current_selector: Optional[str], params: Dict[str, Any], step: Dict[str, Any], run_status: Dict[str, Any]) -> None:
+        description = step.get("description", f"Step {step.get('step_id', run_status['steps_executed'])}")
+        if not self.llm_client:
+            raise PlaywrightError("LLMClient not available for vision-based verification step.")
+        if not description:
+            raise ValueError("Missing 'description' field for 'assert_passed_verification' step.")
+        if not self.browser_controller:
+            raise PlaywrightError("BrowserController not available for state gathering.")
+
+        logger.info("Performing vision-based verification with DOM context...")
+
+        # --- Gather Context ---
+        screenshot_bytes = self.browser_controller.take_screenshot()
+        current_url = self.browser_controller.get_current_url()
+        dom_context_str = "DOM context could not be retrieved." # Default
+        try:
+            dom_state = self.browser_controller.get_structured_dom(highlight_all_clickable_elements=False, viewport_expansion=-1) # No highlight during execution verification
+            if dom_state and dom_state.element_tree:
+                # Use 'verification' purpose for potentially richer context
+                dom_context_str, _ = dom_state.element_tree.generate_llm_context_string(context_purpose='verification')
+            else:
+                logger.warning("Failed to get valid DOM state for vision verification.")
+        except Exception as dom_err:
+            logger.error(f"Error getting DOM context for vision verification: {dom_err}", exc_info=True)
+        # --------------------
+
+        if not screenshot_bytes:
+            raise PlaywrightError("Failed to capture screenshot for vision verification.")
+
+
+        prompt = f"""Analyze the provided webpage screenshot AND the accompanying HTML context.
+
+    The goal during testing was to verify the following condition: "{description}"
+    Current URL: {current_url}
+
+    HTML Context (Visible elements, interactive elements marked with `[index]`, static with `(Static)`):
+    ```html
+    {dom_context_str}
+    ```
+
+    Based on BOTH the visual evidence in the screenshot AND the HTML context (Prioritize html context more as screenshot will have some delay from when it was asked and when it was taken), is the verification condition "{description}" currently met?
+    If you think due to the delay in html AND screenshot, state might have changed from where the condition was met, then also respond with YES
+
+    IMPORTANT: Consider that elements might be in a loading state (e.g., placeholders described) OR a fully loaded state (e.g., actual images shown visually). If the current state reasonably fulfills the ultimate goal implied by the description (even if the exact visual differs due to loading, like placeholders becoming images), respond YES.
+
+    Respond with only "YES" or "NO", followed by a brief explanation justifying your answer using evidence from the screenshot and/or HTML context.
+    Example Response (Success): YES - The 'Welcome, User!' message [Static id='s15'] is visible in the HTML and visually present at the top of the screenshot.
+    Example Response (Failure): NO - The HTML context shows an error message element [12] and the screenshot visually confirms the 'Invalid credentials' error.
+    Example Response (Success - Placeholder Intent): YES - The description asked for 5 placeholders, but the screenshot and HTML show 5 fully loaded images within the expected containers ('div.image-container'). This fulfills the intent of ensuring the 5 image sections are present and populated.
+    """
+
+
+        llm_response = self.llm_client.generate_multimodal(prompt, screenshot_bytes)
+        logger.debug(f"Vision verification LLM response: {llm_response}")
+
+        if llm_response.strip().upper().startswith("YES"):
+            logger.info("✅ Vision verification PASSED (with DOM context).")
+        elif llm_response.strip().upper().startswith("NO"):
+            logger.error(f"❌ Vision verification FAILED (with DOM context). LLM Reasoning: {llm_response}")
+            raise AssertionError(f"Vision verification failed: Condition '{description}' not met. LLM Reason: {llm_response}")
+        elif llm_response.startswith("Error:"):
+            logger.error(f"❌ Vision verification FAILED due to LLM error: {llm_response}")
+            raise PlaywrightError(f"Vision verification LLM error: {llm_response}")
+        else:
+            logger.error(f"❌ Vision verification FAILED due to unclear LLM response: {llm_response}")
+            raise AssertionError(f"Vision verification failed: Unclear LLM response. Response: {llm_response}")
+
     def run_test(self, json_file_path: str) -> Dict[str, Any]:
         """Loads and executes the test steps from the JSON file."""
         start_time = time.time()
@@ -350,10 +905,19 @@ class TestExecutor:
                 modified_test_data = test_data.copy() 
 
             steps = modified_test_data.get("steps", [])
-            viewport = next((json.load(open(os.path.join(self.baseline_dir, f"{step.get('parameters', {}).get('baseline_id')}.json"))).get("viewport_size") for step in steps if step.get("action") == "assert_visual_match" and step.get('parameters', {}).get('baseline_id') and os.path.exists(os.path.join(self.baseline_dir, f"{step.get('parameters', {}).get('baseline_id')}.json"))), None)
+            self._refresh_baseline_index() # Baselines may have been recorded since the last run
+            # Use the viewport of the first visual baseline that exists, so screenshots are comparable
+            viewport = None
+            for step in steps:
+                if step.get("action") != "assert_visual_match": continue
+                baseline_id = step.get('parameters', {}).get('baseline_id')
+                baseline_meta = self._load_baseline_metadata(baseline_id) if baseline_id else None
+                if baseline_meta is not None:
+                    viewport = baseline_meta.get("viewport_size")
+                    break
             test_name = modified_test_data.get("test_name", "Unnamed Test")
             feature_description = modified_test_data.get("feature_description", "")
-            first_navigation_done = False
+            self._first_navigation_done = False
             run_status["test_name"] = test_name
             logger.info(f"Executing test: '{test_name}' with {len(steps)} steps.")
 
@@ -399,435 +963,10 @@ class TestExecutor:
                 run_status["visual_assertion_results"] = []
                 while not step_healed and current_healing_attempts <= self.healing_retries_per_step:
                     try:
-                        if action == "navigate":
-                            url = params.get("url")
-                            if not url: raise ValueError("Missing 'url' parameter for navigate.")
-                            self.browser_controller.goto(url)# Uses default navigation timeout from context
-                            if not first_navigation_done:
-                                if self.get_performance:
-                                    run_status["performance_timing"] = self.browser_controller.page_performance_timing
-                                first_navigation_done = True
-                        elif action == "click":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for click.")
-                            locator = self._get_locator(current_selector)
-                            locator.click(timeout=self.default_timeout) # Explicit timeout for action
-                        elif action == "type":
-                            text = params.get("text")
-                            if not current_selector: raise ValueError("Missing 'current_selector' for type.")
-                            if text is None: raise ValueError("Missing 'text' parameter for type.")
-                            locator = self._get_locator(current_selector)
-                            locator.fill(text, timeout=self.default_timeout) # Use fill for robustness
-                        elif action == "scroll": # Less common, but support if recorded
-                            direction = params.get("direction")
-                            if direction not in ["up", "down"]: raise ValueError("Invalid 'direction'.")
-                            amount = "window.innerHeight" if direction=="down" else "-window.innerHeight"
-                            self.page.evaluate(f"window.scrollBy(0, {amount})")
-                        elif action == "check": 
-                            if not current_selector: raise ValueError("Missing 'current_selector' for check action.")
-                            # Use the browser_controller method which handles locator/timeout
-                            self.browser_controller.check(current_selector)
-                        elif action == "uncheck":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for uncheck action.")
-                            # Use the browser_controller method
-                            self.browser_controller.uncheck(current_selector)
-                        elif action == "select":
-                            option_label = params.get("option_label")
-                            option_value = params.get("option_value") # Support value too if recorded
-                            option_index_str = params.get("option_index") # Support index if recorded
-                            option_param = None
-                            param_type = None
-
-                            if option_label is not None:
-                                option_param = {"label": option_label}
-                                param_type = f"label '{option_label}'"
-                            elif option_value is not None:
-                                option_param = {"value": option_value}
-                                param_type = f"value '{option_value}'"
-                            elif option_index_str is not None and option_index_str.isdigit():
-                                option_param = {"index": int(option_index_str)}
-                                param_type = f"index {option_index_str}"
-                            else:
-                                raise ValueError("Missing 'option_label', 'option_value', or 'option_index' parameter for select action.")
-
-                            if not current_selector: raise ValueError("Missing 'current_selector' for select action.")
-
-                            logger.info(f"Selecting option by {param_type} in element: {current_selector}")
-                            locator = self._get_locator(current_selector)
-                            locator.select_option(**option_param, timeout=self.default_timeout)
-                        elif action == "wait": # Generic wait action
-                            timeout_s = params.get("timeout_seconds")
-                            target_url = params.get("url")
-                            element_state = params.get("state") # e.g., 'visible', 'hidden'
-                            wait_selector = current_selector # Use current (potentially healed) selector if waiting for element
-
-                            if timeout_s is not None and not target_url and not element_state:
-                                # Simple time wait
-                                logger.info(f"Waiting for {timeout_s} seconds...")
-                                self.page.wait_for_timeout(timeout_s * 1000)
-                            elif wait_selector and element_state:
-                                # Wait for element state
-                                logger.info(f"Waiting for element '{wait_selector}' to be '{element_state}' (max {self.default_timeout}ms)...")
-                                locator = self._get_locator(wait_selector)
-                                locator.wait_for(state=element_state, timeout=self.default_timeout)
-                            elif target_url:
-                                # Wait for URL
-                                logger.info(f"Waiting for URL matching '{target_url}' (max {self.browser_controller.default_navigation_timeout}ms)...")
-                                self.page.wait_for_url(target_url, timeout=self.browser_controller.default_navigation_timeout)
-                            else:
-                                raise ValueError("Invalid parameters for 'wait' action. Need timeout_seconds OR (selector and state) OR url.")
-                        elif action == "wait_for_load_state":
-                            state = params.get("state", "load")
-                            self.page.wait_for_load_state(state, timeout=self.browser_controller.default_navigation_timeout) # Use navigation timeout
-                        elif action == "wait_for_selector": # Explicit wait
-                            wait_state = params.get("state", "visible")
-                            timeout = params.get("timeout_ms", self.default_timeout)
-                            if not current_selector: raise ValueError("Missing 'current_selector' for wait_for_selector.")
-                            locator = self._get_locator(current_selector)
-                            locator.wait_for(state=wait_state, timeout=timeout)
-                        elif action == "key_press":
-                            keys = params.get("keys")
-                            if not current_selector: raise ValueError("Missing 'selector' for key_press.")
-                            if not keys: raise ValueError("Missing 'keys' parameter for key_press.")
-                            # Use controller method or locator directly
-                            locator = self._get_locator(current_selector)
-                            locator.press(keys, timeout=self.default_timeout)
-                            # self.browser_controller.press(current_selector, keys) # Alt: if using controller method
-                        elif action == "drag_and_drop":
-                            target_selector = params.get("target_selector")
-                            source_selector = current_selector # Source is in the main 'selector' field
-                            if not source_selector: raise ValueError("Missing source 'selector' for drag_and_drop.")
-                            if not target_selector: raise ValueError("Missing 'target_selector' in parameters for drag_and_drop.")
-                            # Use controller method or locators directly
-                            source_locator = self._get_locator(source_selector)
-                            target_locator = self._get_locator(target_selector)
-                            source_locator.drag_to(target_locator, timeout=self.default_timeout)
-                            # self.browser_controller.drag_and_drop(source_selector, target_selector) # Alt: if using controller
-
-                        # --- Assertions ---
-                        elif action == "assert_text_contains":
-                            expected_text = params.get("expected_text")
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
-                            if expected_text is None: raise ValueError("Missing 'expected_text'.")
-                            locator = self._get_locator(current_selector)
-                            expect(locator).to_contain_text(expected_text, timeout=self.default_timeout)
-                        elif action == "assert_text_equals":
-                            expected_text = params.get("expected_text")
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
-                            if expected_text is None: raise ValueError("Missing 'expected_text'.")
-                            locator = self._get_locator(current_selector)
-                            expect(locator).to_have_text(expected_text, timeout=self.default_timeout)
-                        elif action == "assert_visible":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
-                            locator = self._get_locator(current_selector)
-                            expect(locator).to_be_visible(timeout=self.default_timeout)
-                        elif action == "assert_hidden":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
-                            locator = self._get_locator(current_selector)
-                            expect(locator).to_be_hidden(timeout=self.default_timeout)
-                        elif action == "assert_attribute_equals":
-                            attr_name = params.get("attribute_name")
-                            expected_value = params.get("expected_value")
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
-                            if not attr_name: raise ValueError("Missing 'attribute_name'.")
-                            if expected_value is None: raise ValueError("Missing 'expected_value'.")
-                            locator = self._get_locator(current_selector)
-                            expect(locator).to_have_attribute(attr_name, expected_value, timeout=self.default_timeout)
-                        elif action == "assert_element_count":
-                            expected_count = params.get("expected_count")
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assertion.")
-                            if expected_count is None: raise ValueError("Missing 'expected_count'.")
-                            if not isinstance(expected_count, int): raise ValueError("'expected_count' must be an integer.") # Add type check
-
-                            # --- FIX: Get locator for count without using .first ---
-                            # Apply the same current_selector processing as in _get_locator if needed
-                            is_likely_xpath = current_selector.startswith(('/', '(', '//')) or \
-                                            ('/' in current_selector and not any(c in current_selector for c in ['#', '.', '[', '>', '+', '~']))
-                            processed_selector = current_selector
-                            if is_likely_xpath and not current_selector.startswith(('css=', 'xpath=')):
-                                processed_selector = f"xpath={current_selector}"
-
-                            # Get the locator for potentially MULTIPLE elements
-                            count_locator = self.page.locator(processed_selector)
-                            # --- End FIX ---
-
-                            logger.info(f"Asserting count of elements matching '{processed_selector}' to be {expected_count}")
-                            expect(count_locator).to_have_count(expected_count, timeout=self.default_timeout)
-                        elif action == "assert_checked":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assert_checked.")
-                            locator = self._get_locator(current_selector)
-                            # Use Playwright's dedicated assertion for checked state
-                            expect(locator).to_be_checked(timeout=self.default_timeout)
-                        elif action == "assert_not_checked":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assert_not_checked.")
-                            locator = self._get_locator(current_selector)
-                            # Use .not modifier with the checked assertion
-                            expect(locator).not_to_be_checked(timeout=self.default_timeout)
-                        elif action == "assert_disabled":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assert_disabled.")
-                            locator = self._get_locator(current_selector)
-                            # Use Playwright's dedicated assertion for disabled state
-                            expect(locator).to_be_disabled(timeout=self.default_timeout)
-                        elif action == "assert_enabled":
-                            if not current_selector: raise ValueError("Missing 'current_selector' for assert_enabled.")
-                            locator = self._get_locator(current_selector)
-                            expect(locator).to_be_enabled(timeout=self.default_timeout)
-                        elif action == "task_replanned":
-                            pass
-                        elif action == "assert_visual_match":
-                            baseline_id = params.get("baseline_id")
-                            element_selector = step.get("selector") # Use step's selector if available
-                            use_llm = params.get("use_llm_fallback", True)
-                            # Allow overriding threshold per step
-                            step_threshold = params.get("pixel_threshold", self.pixel_threshold)
-
-                            if not baseline_id:
-                                raise ValueError("Missing 'baseline_id' parameter for assert_visual_match.")
-
-                            logger.info(f"--- Performing Visual Assertion: '{baseline_id}' (Selector: {element_selector}, Threshold: {step_threshold*100:.2f}%, LLM: {use_llm}) ---")
-
-                            # 1. Load Baseline
-                            baseline_img, baseline_meta = self._load_baseline(baseline_id)
-                            if not baseline_img or not baseline_meta:
-                                raise FileNotFoundError(f"Baseline '{baseline_id}' not found or failed to load.")
-
-                            # 2. Capture Current State
-                            current_screenshot_bytes = None
-                            if element_selector:
-                                current_screenshot_bytes = self.browser_controller.take_screenshot_element(element_selector)
-                            else:
-                                current_screenshot_bytes = self.browser_controller.take_screenshot() # Full page
-
-                            if not current_screenshot_bytes:
-                                raise PlaywrightError("Failed to capture current screenshot for visual comparison.")
-
-                            try:
-                                # Create a BytesIO buffer to treat the bytes like a file
-                                buffer = io.BytesIO(current_screenshot_bytes)
-                                # Open the image from the buffer using Pillow
-                                img = Image.open(buffer)
-                                # Ensure the image is in RGBA format for consistency,
-                                # especially important for pixel comparisons that might expect an alpha channel.
-                                logger.info("received")
-                                current_img = img.convert("RGBA")
-                            except Exception as e:
-                                logger.error(f"Failed to convert bytes to PIL Image: {e}", exc_info=True)
-                                current_img = None
-
-                            
-                            
-                            if not current_img:
-                                raise RuntimeError("Failed to process current screenshot bytes into an image.")
-                            
-
-                            # 3. Pre-check Dimensions
-                            if baseline_img.size != current_img.size:
-                                size_mismatch_msg = f"Visual Assertion Failed: Image dimensions mismatch for '{baseline_id}'. Baseline: {baseline_img.size}, Current: {current_img.size}."
-                                logger.error(size_mismatch_msg)
-                                # Save current image for debugging
-                                ts = time.strftime("%Y%m%d_%H%M%S")
-                                current_img_path = os.path.join("output", f"visual_fail_{baseline_id}_current_{ts}.png")
-                                current_img.save(current_img_path)
-                                logger.info(f"Saved current image (dimension mismatch) to: {current_img_path}")
-                                raise AssertionError(size_mismatch_msg) # Fail the assertion
-
-                            # 4. Pixel Comparison
-                            img_diff = Image.new("RGBA", baseline_img.size) # Image to store diff pixels
-                            try:
-                                mismatched_pixels = pixelmatch(baseline_img, current_img, img_diff, includeAA=True, threshold=0.1) # Use default pixelmatch threshold first
-                            except Exception as pm_error:
-                                logger.error(f"Error during pixelmatch comparison for '{baseline_id}': {pm_error}", exc_info=True)
-                                raise RuntimeError(f"Pixelmatch library error: {pm_error}") from pm_error
-
-
-                            total_pixels = baseline_img.width * baseline_img.height
-                            diff_ratio = mismatched_pixels / total_pixels if total_pixels > 0 else 0
-                            logger.info(f"Pixel comparison for '{baseline_id}': Mismatched Pixels = {mismatched_pixels}, Total Pixels = {total_pixels}, Difference = {diff_ratio*100:.4f}%")
-
-                            # 5. Check against threshold
-                            pixel_match_passed = diff_ratio <= step_threshold
-                            llm_reasoning = None
-                            diff_image_path = None
-
-                            if pixel_match_passed:
-                                logger.info(f"✅ Visual Assertion PASSED (Pixel Diff <= Threshold) for '{baseline_id}'.")
-                                # Step completed successfully
-                            else:
-                                logger.warning(f"Visual Assertion: Pixel difference ({diff_ratio*100:.4f}%) exceeds threshold ({step_threshold*100:.2f}%) for '{baseline_id}'.")
-
-                                # Save diff image regardless of LLM outcome
-                                ts = time.strftime("%Y%m%d_%H%M%S")
-                                diff_image_path = os.path.join("output", f"visual_diff_{baseline_id}_{ts}.png")
-                                try:
-                                    img_diff.save(diff_image_path)
-                                    logger.info(f"Saved pixel difference image to: {diff_image_path}")
-                                except Exception as save_err:
-                                    logger.error(f"Failed to save diff image: {save_err}")
-                                    diff_image_path = None # Mark as failed
-
-                                # 6. LLM Fallback
-                                if use_llm and self.llm_client:
-                                    logger.info(f"Attempting LLM visual comparison fallback for '{baseline_id}'...")
-                                    baseline_bytes = io.BytesIO()
-                                    baseline_img.save(baseline_bytes, format='PNG')
-                                    baseline_bytes = baseline_bytes.getvalue()
-
-                                    # --- UPDATED LLM PROMPT for Stitched Image ---
-                                    llm_prompt = f"""Analyze the combined image provided below for the purpose of automated software testing.
-            The LEFT half (labeled '1: Baseline') is the established baseline screenshot.
-            The RIGHT half (labeled '2: Current') is the current state screenshot.
-
-            Compare these two halves to determine if they are SEMANTICALLY equivalent from a user's perspective.
-
-            IGNORE minor differences like:
-            - Anti-aliasing variations
-            - Single-pixel shifts
-            - Tiny rendering fluctuations
-            - Small, insignificant dynamic content changes (e.g., blinking cursors, exact timestamps if not the focus).
-
-            FOCUS ON significant differences like:
-            - Layout changes (elements moved, resized, missing, added)
-            - Major color changes of key elements
-            - Text content changes (errors, different labels, etc.)
-            - Missing or fundamentally different images/icons.
-
-            Baseline ID: "{baseline_id}"
-            Captured URL (Baseline): "{baseline_meta.get('url_captured', 'N/A')}"
-            Selector (Baseline): "{baseline_meta.get('selector_captured', 'Full Page')}"
-
-            Based on these criteria, are the two halves (baseline vs. current) functionally and visually equivalent enough to PASS a visual regression test?
-
-            Respond ONLY with "YES" or "NO", followed by a brief explanation justifying your answer by referencing differences between the left and right halves.
-            Example YES: YES - The left (baseline) and right (current) images are visually equivalent. Minor text rendering differences are ignored.
-            Example NO: NO - The primary call-to-action button visible on the left (baseline) is missing on the right (current).
-            """
-                                    # --- END UPDATED PROMPT ---
-
-                                    try:
-                                        # No change here, compare_images handles the stitching internally
-                                        llm_response = compare_images(llm_prompt, baseline_bytes, current_screenshot_bytes, self.llm_client)
-                                        logger.info(f"LLM visual comparison response for '{baseline_id}': {llm_response}")
-                                        llm_reasoning = llm_response # Store reasoning
-
-                                        if llm_response.strip().upper().startswith("YES"):
-                                            logger.info(f"✅ Visual Assertion PASSED (LLM Override) for '{baseline_id}'.")
-                                            pixel_match_passed = True # Override pixel result
-                                        elif llm_response.strip().upper().startswith("NO"):
-                                            logger.warning(f"Visual Assertion: LLM confirmed significant difference for '{baseline_id}'.")
-                                            pixel_match_passed = False # Confirm failure
-                                        else:
-                                            logger.warning(f"Visual Assertion: LLM response unclear for '{baseline_id}'. Treating as failure.")
-                                            pixel_match_passed = False
-                                    except Exception as llm_err:
-                                        logger.error(f"LLM visual comparison failed: {llm_err}", exc_info=True)
-                                        llm_reasoning = f"LLM Error: {llm_err}"
-                                        pixel_match_passed = False # Treat LLM error as failure
-
-                                else: # LLM fallback not enabled or LLM not available
-                                    logger.warning(f"Visual Assertion: LLM fallback skipped for '{baseline_id}'. Failing based on pixel difference.")
-                                    pixel_match_passed = False
-
-                                # 7. Handle Final Failure
-                                if not pixel_match_passed:
-                                    failure_msg = f"Visual Assertion Failed for '{baseline_id}'. Pixel diff: {diff_ratio*100:.4f}% (Threshold: {step_threshold*100:.2f}%)."
-                                    if llm_reasoning: failure_msg += f" LLM Reason: {llm_reasoning}"
-                                    logger.error(failure_msg)
-                                    # Add details to run_status before raising
-                                    visual_failure_details = {
-                                        "baseline_id": baseline_id,
-                                        "pixel_difference_ratio": diff_ratio,
-                                        "pixel_threshold": step_threshold,
-                                        "mismatched_pixels": mismatched_pixels,
-                                        "diff_image_path": diff_image_path,
-                                        "llm_reasoning": llm_reasoning
-                                    }
-                                    # We need to store this somewhere accessible when raising the final error
-                                    # Let's add it directly to the step dict temporarily? Or a dedicated failure context?
-                                    # For now, log it and include basics in the AssertionError
-                                    run_status["visual_failure_details"] = visual_failure_details # Add to main run status
-                                    raise AssertionError(failure_msg) # Fail the step
-
-                            visual_result = {
-                                "step_id": step_id,
-                                "baseline_id": baseline_id,
-                                "status": "PASS" if pixel_match_passed else "FAIL",
-                                "pixel_difference_ratio": diff_ratio,
-                                "mismatched_pixels": mismatched_pixels,
-                                "pixel_threshold": step_threshold,
-                                "llm_override": use_llm and not pixel_match_passed and llm_response.strip().upper().startswith("YES") if 'llm_response' in locals() else False,
-                                "llm_reasoning": llm_reasoning,
-                                "diff_image_path": diff_image_path,
-                                "element_selector": element_selector
-                            }
-                            run_status["visual_assertion_results"].append(visual_result)
-       
-
-                        elif action == "assert_passed_verification" or action == "assert_llm_verification":
-                            if not self.llm_client:
-                                raise PlaywrightError("LLMClient not available for vision-based verification step.")
-                            if not description:
-                                raise ValueError("Missing 'description' field for 'assert_passed_verification' step.")
-                            if not self.browser_controller:
-                                raise PlaywrightError("BrowserController not available for state gathering.")
-
-                            logger.info("Performing vision-based verification with DOM context...")
-
-                            # --- Gather Context ---
-                            screenshot_bytes = self.browser_controller.take_screenshot()
-                            current_url = self.browser_controller.get_current_url()
-                            dom_context_str = "DOM context could not be retrieved." # Default
-                            try:
-                                dom_state = self.browser_controller.get_structured_dom(highlight_all_clickable_elements=False, viewport_expansion=-1) # No highlight during execution verification
-                                if dom_state and dom_state.element_tree:
-                                    # Use 'verification' purpose for potentially richer context
-                                    dom_context_str, _ = dom_state.element_tree.generate_llm_context_string(context_purpose='verification')
-                                else:
-                                    logger.warning("Failed to get valid DOM state for vision verification.")
-                            except Exception as dom_err:
-                                logger.error(f"Error getting DOM context for vision verification: {dom_err}", exc_info=True)
-                            # --------------------
-
-                            if not screenshot_bytes:
-                                raise PlaywrightError("Failed to capture screenshot for vision verification.")
-
-
-                            prompt = f"""Analyze the provided webpage screenshot AND the accompanying HTML context.
-
-    The goal during testing was to verify the following condition: "{description}"
-    Current URL: {current_url}
-
-    HTML Context (Visible elements, interactive elements marked with `[index]`, static with `(Static)`):
-    ```html
-    {dom_context_str}
-    ```
-
-    Based on BOTH the visual evidence in the screenshot AND the HTML context (Prioritize html context more as screenshot will have some delay from when it was asked and when it was taken), is the verification condition "{description}" currently met?
-    If you think due to the delay in html AND screenshot, state might have changed from where the condition was met, then also respond with YES
-
-    IMPORTANT: Consider that elements might be in a loading state (e.g., placeholders described) OR a fully loaded state (e.g., actual images shown visually). If the current state reasonably fulfills the ultimate goal implied by the description (even if the exact visual differs due to loading, like placeholders becoming images), respond YES.
-
-    Respond with only "YES" or "NO", followed by a brief explanation justifying your answer using evidence from the screenshot and/or HTML context.
-    Example Response (Success): YES - The 'Welcome, User!' message [Static id='s15'] is visible in the HTML and visually present at the top of the screenshot.
-    Example Response (Failure): NO - The HTML context shows an error message element [12] and the screenshot visually confirms the 'Invalid credentials' error.
-    Example Response (Success - Placeholder Intent): YES - The description asked for 5 placeholders, but the screenshot and HTML show 5 fully loaded images within the expected containers ('div.image-container'). This fulfills the intent of ensuring the 5 image sections are present and populated.
-    """
-
-
-                            llm_response = self.llm_client.generate_multimodal(prompt, screenshot_bytes)
-                            logger.debug(f"Vision verification LLM response: {llm_response}")
-
-                            if llm_response.strip().upper().startswith("YES"):
-                                logger.info("✅ Vision verification PASSED (with DOM context).")
-                            elif llm_response.strip().upper().startswith("NO"):
-                                logger.error(f"❌ Vision verification FAILED (with DOM context). LLM Reasoning: {llm_response}")
-                                raise AssertionError(f"Vision verification failed: Condition '{description}' not met. LLM Reason: {llm_response}")
-                            elif llm_response.startswith("Error:"):
-                                logger.error(f"❌ Vision verification FAILED due to LLM error: {llm_response}")
-                                raise PlaywrightError(f"Vision verification LLM error: {llm_response}")
-                            else:
-                                logger.error(f"❌ Vision verification FAILED due to unclear LLM response: {llm_response}")
-                                raise AssertionError(f"Vision verification failed: Unclear LLM response. Response: {llm_response}")
-                        # --- Add more actions/assertions as needed ---
-                        else:
+                        handler = self._action_table.get(action)
+                        if handler is not None:
+                            handler(current_selector, params, step, run_status)
+                        else: # New actions/assertions go in _build_action_table
                             logger.warning(f"Unsupported action type '{action}' found in step {step_id}. Skipping.")
                             # Optionally treat as failure: raise ValueError(f"Unsupported action: {action}")
 
@@ -1028,8 +1167,7 @@ class TestExecutor:
                 try:
                     logger.info(f"Saving updated test file with {run_status['healed_steps_count']} healed step(s) to: {json_file_path}")
                     # modified_test_data should contain the updated steps list
-                    with open(json_file_path, 'w', encoding='utf-8') as f:
-                         json.dump(modified_test_data, f, indent=2, ensure_ascii=False)
+                    save_json_file(json_file_path, modified_test_data)
                     run_status["healed_file_saved"] = True
                     logger.info(f"Successfully saved healed test file: {json_file_path}")
                     # Adjust final message if test passed after healing
@@ -0,0 +1,82 @@
+# /src/utils/pixelmatch_fast.py
+import logging
+from typing import Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# --- Optional Accelerator Imports ---
+try:
+    import numpy as np
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Largest YIQ delta between two colors, as in pixelmatch
+_MAX_YIQ_DELTA = 35215.0
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, inline='always')
+    def _blend(c, a):
+        # Blend a channel with a white background, like pixelmatch does for translucent pixels
+        return 255.0 + (c - 255.0) * a
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _diff_count_kernel(a, b, max_delta):
+        height, width = a.shape[0], a.shape[1]
+        total = 0
+        for y in prange(height):
+            row_diffs = 0
+            for x in range(width):
+                r1, g1, b1, a1 = float(a[y, x, 0]), float(a[y, x, 1]), float(a[y, x, 2]), float(a[y, x, 3])
+                r2, g2, b2, a2 = float(b[y, x, 0]), float(b[y, x, 1]), float(b[y, x, 2]), float(b[y, x, 3])
+                if r1 == r2 and g1 == g2 and b1 == b2 and a1 == a2:
+                    continue
+                if a1 < 255.0:
+                    a1 /= 255.0
+                    r1, g1, b1 = _blend(r1, a1), _blend(g1, a1), _blend(b1, a1)
+                if a2 < 255.0:
+                    a2 /= 255.0
+                    r2, g2, b2 = _blend(r2, a2), _blend(g2, a2), _blend(b2, a2)
+                dy = (r1 - r2) * 0.29889531 + (g1 - g2) * 0.58662247 + (b1 - b2) * 0.11448223
+                di = (r1 - r2) * 0.59597799 - (g1 - g2) * 0.27417610 - (b1 - b2) * 0.32180189
+                dq = (r1 - r2) * 0.21147017 - (g1 - g2) * 0.52261711 + (b1 - b2) * 0.31114694
+                if 0.5053 * dy * dy + 0.299 * di * di + 0.1957 * dq * dq > max_delta:
+                    row_diffs += 1
+            total += row_diffs
+        return total
+
+
+def diff_count(a, b, threshold: float = 0.1) -> int:
+    """
+    Counts pixels whose YIQ color delta exceeds `threshold`, matching pixelmatch with includeAA=True.
+    `a` and `b` are uint8 arrays of shape (H, W, 4). Requires numba.
+    """
+    return int(_diff_count_kernel(a, b, _MAX_YIQ_DELTA * threshold * threshold))
+
+
+def count_mismatched_pixels(img1: Image.Image, img2: Image.Image, threshold: float = 0.1) -> Optional[int]:
+    """
+    Counts mismatched pixels between two same-sized RGBA images without building a diff image.
+    Returns None if numba is not installed, so callers can fall back to pixelmatch.
+    """
+    if not NUMBA_AVAILABLE:
+        return None
+    try:
+        return diff_count(np.asarray(img1), np.asarray(img2), threshold)
+    except Exception as e:
+        logger.warning(f"Fast pixel diff failed, falling back to pixelmatch: {e}")
+        return None
+
+
+def warm_up() -> None:
+    """Compiles the kernel ahead of the first visual assertion; a no-op without numba."""
+    if not NUMBA_AVAILABLE:
+        return
+    try:
+        diff_count(np.zeros((2, 2, 4), np.uint8), np.zeros((2, 2, 4), np.uint8), 0.1)
+    except Exception as e:
+        logger.warning(f"Could not compile the fast pixel diff kernel: {e}")
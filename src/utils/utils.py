@@ -1,5 +1,6 @@
 # /src/utils/utils.py
 import os
+import json
 from dotenv import load_dotenv
 
 def load_api_key():
@@ -40,4 +41,10 @@ def load_llm_timeout():
     llm_timeout = os.getenv("LLM_TIMEOUT")
     if not llm_timeout:
         raise ValueError("LLM_TIMEOUT not found in .env file or environment variables.")
-    return llm_timeout
\ No newline at end of file
+    return llm_timeout
+
+def save_json_file(file_path: str, data) -> None:
+    """Writes data as indented UTF-8 JSON, encoding it in one call and writing it with a single write."""
+    payload = json.dumps(data, indent=2, ensure_ascii=False)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(payload)